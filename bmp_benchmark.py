@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+BMP转换器性能基准测试
+在本地生成确定性的合成BMP语料（1/4/8/16/24/32位，自下而上和自上而下，32×32 到 8K），
+分别测量 detect_bmp_format、read_bmp_pixels、read_bmp_manually 和 convert_bmp_to_array
+各阶段的耗时、吞吐量（百万像素/秒）和峰值内存，并与保存的基线比较，退步超过阈值时返回非零退出码。
+
+用法:
+    python bmp_benchmark.py                       # 快速档（最大 1024×768）
+    python bmp_benchmark.py --profile full        # 完整档（最大 7680×4320）
+    python bmp_benchmark.py --save-baseline       # 把本次结果保存为基线
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from bmp_to_rgb565_enhanced import BMPConverter
+
+# 基线文件格式版本
+BASELINE_VERSION = 1
+
+# 各档位包含的图像尺寸
+SIZES = {
+    'quick': [(32, 32), (256, 256), (1024, 768)],
+    'full': [(32, 32), (256, 256), (1024, 768), (1920, 1080), (3840, 2160), (7680, 4320)],
+}
+
+BIT_DEPTHS = [1, 4, 8, 16, 24, 32]
+OUTPUT_FORMATS = ['RGB565', 'RGB565_8BIT', 'RGB332', 'GRAY8']
+BYTE_ORDERS = ['little', 'big']
+STAGES = ['detect', 'pillow', 'manual', 'convert', 'startup']
+
+# 命令行单次转换的启动耗时预算（毫秒），以及命令行路径上不应加载的模块
+STARTUP_BUDGET_MS = 300
+STARTUP_FORBIDDEN_MODULES = ['tkinter', 'PIL', 'concurrent.futures.process', 'multiprocessing.shared_memory',
+                             'tracemalloc']
+
+# 在子进程中运行命令行转换，并报告转换后已加载的受限模块
+STARTUP_SCRIPT = """
+import sys
+import bmp_to_rgb565_enhanced
+status = bmp_to_rgb565_enhanced.cli_main(sys.argv[1:])
+loaded = [name for name in {forbidden!r} if name in sys.modules]
+print('loaded:' + ','.join(loaded))
+sys.exit(status)
+"""
+
+
+def synthetic_image(width, height, seed=0):
+    """生成确定性的测试图像（RGB，H×W×3）：渐变背景叠加随机噪声块和纯色块，
+    兼顾平坦区域和高频细节"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    rgb = np.empty((height, width, 3), dtype=np.uint8)
+    rgb[..., 0] = (x * 255 // max(1, width - 1)).astype(np.uint8)
+    rgb[..., 1] = (y * 255 // max(1, height - 1)).astype(np.uint8)
+    rgb[..., 2] = ((x + y) & 0xFF).astype(np.uint8)
+
+    block = max(4, min(width, height) // 8)
+    for _ in range(8):
+        bx = int(rng.integers(0, max(1, width - block)))
+        by = int(rng.integers(0, max(1, height - block)))
+        if rng.random() < 0.5:
+            rgb[by:by + block, bx:bx + block] = rng.integers(0, 256, (min(block, height - by), min(block, width - bx), 3),
+                                                            dtype=np.uint8)
+        else:
+            rgb[by:by + block, bx:bx + block] = rng.integers(0, 256, 3, dtype=np.uint8)
+    return rgb
+
+
+def encode_bmp(rgb, bpp, top_down=False):
+    """把RGB图像编码为未压缩的BMP字节串（位深不大于8时量化到调色板）"""
+    height, width, _ = rgb.shape
+    row_size = ((width * bpp + 31) // 32) * 4
+    palette = b''
+
+    if bpp <= 8:
+        # 固定调色板：每个通道均匀取若干级，像素按亮度映射到索引
+        colors = 1 << bpp
+        levels = np.linspace(0, 255, colors).astype(np.uint8)
+        palette = np.zeros((colors, 4), dtype=np.uint8)
+        palette[:, 0] = levels[::-1]
+        palette[:, 1] = levels
+        palette[:, 2] = levels
+        palette = palette.tobytes()
+        gray = (rgb.astype(np.uint16).sum(axis=2) // 3).astype(np.uint8)
+        indices = (gray.astype(np.uint16) * colors >> 8).astype(np.uint8)
+        if bpp == 8:
+            packed = indices
+        elif bpp == 4:
+            padded = np.zeros((height, width + (width & 1)), dtype=np.uint8)
+            padded[:, :width] = indices
+            packed = (padded[:, 0::2] << 4) | padded[:, 1::2]
+        else:
+            packed = np.packbits(indices, axis=1)
+    elif bpp == 16:
+        # X1R5G5B5
+        r = rgb[..., 0].astype(np.uint16) >> 3
+        g = rgb[..., 1].astype(np.uint16) >> 3
+        b = rgb[..., 2].astype(np.uint16) >> 3
+        packed = ((r << 10) | (g << 5) | b).astype('<u2').view(np.uint8).reshape(height, width * 2)
+    elif bpp == 24:
+        packed = rgb[..., ::-1].reshape(height, width * 3)
+    else:
+        bgra = np.full((height, width, 4), 255, dtype=np.uint8)
+        bgra[..., :3] = rgb[..., ::-1]
+        packed = bgra.reshape(height, width * 4)
+
+    rows = np.zeros((height, row_size), dtype=np.uint8)
+    rows[:, :packed.shape[1]] = packed
+    if not top_down:
+        rows = rows[::-1]
+    data = rows.tobytes()
+
+    data_offset = 14 + 40 + len(palette)
+    file_header = struct.pack('<2sIHHI', b'BM', data_offset + len(data), 0, 0, data_offset)
+    dib_header = struct.pack('<IiiHHIIiiII', 40, width, -height if top_down else height, 1, bpp, 0,
+                             len(data), 2835, 2835, (1 << bpp) if bpp <= 8 else 0, 0)
+    return file_header + dib_header + palette + data
+
+
+def build_corpus(corpus_dir, sizes, bit_depths=BIT_DEPTHS):
+    """生成（或复用已有的）合成语料，返回 [(用例名, 文件路径, 宽, 高), ...]"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    corpus = []
+    for width, height in sizes:
+        rgb = None
+        for bpp in bit_depths:
+            for top_down in (False, True):
+                name = f"{width}x{height}_{bpp}bpp_{'topdown' if top_down else 'bottomup'}"
+                path = os.path.join(corpus_dir, name + '.bmp')
+                if not os.path.exists(path):
+                    if rgb is None:
+                        rgb = synthetic_image(width, height, seed=width * 7919 + height)
+                    with open(path, 'wb') as f:
+                        f.write(encode_bmp(rgb, bpp, top_down))
+                corpus.append((name, path, width, height))
+    return corpus
+
+
+def measure(func, min_time=0.2, max_repeats=20):
+    """多次运行取最短耗时（秒），再单独运行一次用 tracemalloc 测量峰值内存（字节）
+
+    计时前先预热运行一次（建立查找表等一次性开销不计入）。
+    tracemalloc 只统计Python和numpy的分配，Pillow内部缓冲区不计入。
+    """
+    func()
+    best = None
+    total = 0.0
+    repeats = 0
+    while repeats < max_repeats and (repeats == 0 or total < min_time):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+        repeats += 1
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def _checked(result):
+    """基准阶段返回 (结果, 错误) 时检查错误，避免把失败的调用计为很快"""
+    value, error = result
+    if error:
+        raise RuntimeError(error)
+    return value
+
+
+def run_benchmarks(corpus, stages, output_formats, byte_orders, min_time=0.2, progress=None):
+    """运行基准测试，返回 {键: {'seconds', 'mpps', 'peak_mb'}}"""
+    converter = BMPConverter()
+    results = {}
+    output_file = os.path.join(tempfile.gettempdir(), f"bmp_benchmark_{os.getpid()}.h")
+
+    def record(key, pixels, func):
+        seconds, peak = measure(func, min_time)
+        results[key] = {
+            'seconds': seconds,
+            'mpps': pixels / seconds / 1e6 if seconds > 0 else float('inf'),
+            'peak_mb': peak / (1024 * 1024),
+        }
+        if progress:
+            progress(key, results[key])
+
+    try:
+        for name, path, width, height in corpus:
+            pixels = width * height
+            bmp_info = _checked(converter.detect_bmp_format(path))
+
+            if 'detect' in stages:
+                record(f"detect/{name}", pixels, lambda: _checked(converter.detect_bmp_format(path)))
+            if 'pillow' in stages:
+                record(f"pillow/{name}", pixels, lambda: _checked(converter.read_bmp_pixels(path, bmp_info)))
+            if 'manual' in stages:
+                record(f"manual/{name}", pixels, lambda: _checked(converter.read_bmp_manually(path, bmp_info)))
+            if 'convert' in stages:
+                for output_format in output_formats:
+                    for byte_order in byte_orders:
+                        def convert():
+                            success, message = converter.convert_bmp_to_array(path, output_file, output_format, byte_order)
+                            if not success:
+                                raise RuntimeError(message)
+                        record(f"convert/{name}/{output_format}/{byte_order}", pixels, convert)
+    finally:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+    return results
+
+
+def measure_startup(input_file, repeats=7):
+    """在新的解释器进程中运行一次命令行转换，返回 (耗时中位数（秒）, 已加载的受限模块)
+
+    耗时包括解释器启动、导入模块、转换一幅小图和退出，反映构建脚本逐个转换素材时的单次开销。
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    output_file = os.path.join(tempfile.gettempdir(), f"bmp_benchmark_startup_{os.getpid()}.h")
+    command = [sys.executable, '-c', STARTUP_SCRIPT.format(forbidden=STARTUP_FORBIDDEN_MODULES), input_file, output_file]
+    times = []
+    loaded = []
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = subprocess.run(command, cwd=script_dir, capture_output=True, text=True)
+            times.append(time.perf_counter() - start)
+            if result.returncode != 0:
+                raise RuntimeError(f"命令行转换失败: {result.stdout}{result.stderr}")
+            report = [line for line in result.stdout.splitlines() if line.startswith('loaded:')][-1]
+            loaded = [name for name in report[len('loaded:'):].split(',') if name]
+    finally:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+    return statistics.median(times), loaded
+
+
+def compare_with_baseline(results, baseline, time_tolerance=0.3, memory_tolerance=0.3):
+    """与基线比较，返回退步项列表 [(键, 说明), ...]
+
+    耗时超过 基线×(1+time_tolerance)+1毫秒，或峰值内存超过 基线×(1+memory_tolerance)+1MB 时视为退步；
+    绝对余量用于消除小图像上的计时和分配噪声。
+    """
+    regressions = []
+    for key, current in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if current['seconds'] > base['seconds'] * (1 + time_tolerance) + 0.001:
+            regressions.append((key, f"吞吐量 {current['mpps']:.1f} MP/s，基线 {base['mpps']:.1f} MP/s"))
+        if current['peak_mb'] > base['peak_mb'] * (1 + memory_tolerance) + 1.0:
+            regressions.append((key, f"峰值内存 {current['peak_mb']:.1f} MB，基线 {base['peak_mb']:.1f} MB"))
+    return regressions
+
+
+def load_baseline(path):
+    """读取基线文件，不存在时返回 None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != BASELINE_VERSION:
+        raise ValueError(f"基线文件版本不兼容: {path}")
+    return data['results']
+
+
+def save_baseline(path, results, profile):
+    """保存基线文件（与已有基线合并，便于分档保存）"""
+    merged = {}
+    if os.path.exists(path):
+        merged = load_baseline(path) or {}
+    merged.update(results)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'version': BASELINE_VERSION, 'profile': profile, 'results': merged}, f, indent=1, sort_keys=True)
+        f.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BMP转换器性能基准测试")
+    parser.add_argument('--profile', choices=sorted(SIZES), default='quick',
+                        help="语料档位：quick 最大 1024×768，full 最大 7680×4320（默认 quick）")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help="要测量的阶段（默认全部）")
+    parser.add_argument('--bpp', nargs='+', type=int, choices=BIT_DEPTHS, default=BIT_DEPTHS, help="要测量的位深（默认全部）")
+    parser.add_argument('--formats', nargs='+', choices=OUTPUT_FORMATS, default=OUTPUT_FORMATS,
+                        help="convert 阶段的输出格式（默认全部）")
+    parser.add_argument('--byte-orders', nargs='+', choices=BYTE_ORDERS, default=BYTE_ORDERS,
+                        help="convert 阶段的字节顺序（默认全部）")
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'bmp2rgb565_bench'),
+                        help="合成语料目录（已存在的文件会被复用）")
+    parser.add_argument('--min-time', type=float, default=0.2, help="每项最少累计运行时间（秒，默认 0.2）")
+    parser.add_argument('--baseline', default='bench_baseline.json', help="基线文件（默认 bench_baseline.json）")
+    parser.add_argument('--save-baseline', '--update-baseline', action='store_true', help="把本次结果写入基线文件")
+    parser.add_argument('--no-baseline', action='store_true',
+                        help="只测量，不与基线比较（默认没有基线文件时视为未通过，避免CI门禁空跑）")
+    parser.add_argument('--time-tolerance', type=float, default=0.3, help="允许的耗时增加比例（默认 0.3）")
+    parser.add_argument('--memory-tolerance', type=float, default=0.3, help="允许的峰值内存增加比例（默认 0.3）")
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET_MS, metavar='MS',
+                        help=f"命令行单次转换的启动耗时预算（毫秒，默认 {STARTUP_BUDGET_MS}）")
+    parser.add_argument('--json', metavar='FILE', help="把本次结果以JSON写入文件")
+    args = parser.parse_args(argv)
+
+    corpus = build_corpus(args.corpus_dir, SIZES[args.profile], args.bpp)
+    print(f"语料: {len(corpus)} 个文件（{args.corpus_dir}）")
+    print(f"{'用例':<56} {'耗时(ms)':>10} {'MP/s':>9} {'峰值(MB)':>9}")
+
+    def progress(key, result):
+        print(f"{key:<56} {result['seconds'] * 1000:>10.2f} {result['mpps']:>9.1f} {result['peak_mb']:>9.1f}")
+        sys.stdout.flush()
+
+    results = run_benchmarks(corpus, args.stages, args.formats, args.byte_orders, args.min_time, progress)
+
+    failures = []
+    if 'startup' in args.stages:
+        name, path, width, height = min(corpus, key=lambda case: case[2] * case[3])
+        seconds, loaded = measure_startup(path)
+        results['startup/cli'] = {'seconds': seconds, 'mpps': width * height / seconds / 1e6, 'peak_mb': 0.0}
+        progress('startup/cli', results['startup/cli'])
+        if seconds * 1000 > args.startup_budget:
+            failures.append(('startup/cli', f"启动耗时 {seconds * 1000:.0f} ms，超出预算 {args.startup_budget:.0f} ms"))
+        if loaded:
+            failures.append(('startup/cli', f"命令行路径加载了 {', '.join(loaded)}"))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+            f.write('\n')
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results, args.profile)
+        print(f"已保存基线: {args.baseline}（{len(results)} 项）")
+    elif not args.no_baseline:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            failures.append(('baseline', f"未找到基线文件 {args.baseline}，使用 --save-baseline 生成，"
+                                         f"或用 --no-baseline 只测量不比较"))
+        else:
+            regressions = compare_with_baseline(results, baseline, args.time_tolerance, args.memory_tolerance)
+            compared = sum(1 for key in results if key in baseline)
+            if regressions:
+                print(f"\n性能退步 {len(regressions)} 项（共比较 {compared} 项）")
+                failures = regressions + failures
+            else:
+                print(f"\n与基线比较 {compared} 项，未发现退步")
+
+    if failures:
+        print("\n未通过:")
+        for key, detail in failures:
+            print(f"  {key}: {detail}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
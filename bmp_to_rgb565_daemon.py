@@ -0,0 +1,542 @@
+"""
+BMP转换守护进程
+常驻进程保持 BMPConverter（连同查找表和缓存）加载在工作进程池中，通过本地Unix套接字
+或回环端口接收转换任务，省去构建脚本逐个调用命令行时每次启动解释器的开销。
+
+协议：每行一个JSON对象（UTF-8），请求和响应都以换行结束，同一连接上可以连续发送多个请求，
+响应按完成顺序返回并带有请求中的 id。
+    转换请求: {"id": 1, "input": "a.bmp", "output": "a.h", "output_format": "RGB565", "byte_order": "little"}
+              输入也可以是 "input_data"（BMP文件内容的base64），可选 binary、compression、crop、tiles、streaming
+    转换响应: {"id": 1, "success": true, "message": "...", "seconds": 0.012}
+    其他请求: {"op": "ping"} 返回运行状态，{"op": "shutdown"} 停止守护进程
+
+安全：守护进程以启动它的用户身份读写任意路径。Unix套接字只允许当前用户连接；
+回环TCP端口（--port）本机的任何用户都能连接，因此TCP模式下每个请求都必须带有 "token" 字段，
+令牌保存在只有所有者可读的令牌文件中（默认 ~/.bmp2rgb565-daemon.token，首次启动时生成）。
+
+用法:
+    python bmp_to_rgb565_daemon.py serve [-j N] [--socket PATH | --port N [--token-file PATH]]
+    python bmp_to_rgb565_daemon.py convert input.bmp output.h [format] [byte_order] [--binary] [--compress rle|deflate]
+    python bmp_to_rgb565_daemon.py submit jobs.jsonl     # 每行一个转换请求，"-" 表示标准输入
+    python bmp_to_rgb565_daemon.py ping | shutdown
+
+客户端部分只使用标准库，不导入numpy和转换器本身。
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import secrets
+
+# 不支持Unix套接字的平台（Windows）默认使用的回环端口
+DEFAULT_PORT = 47565
+# 单行请求的长度上限（input_data 携带整个BMP文件）
+MAX_REQUEST_BYTES = 256 * 1024 * 1024
+# 收到 shutdown 后等待已建立的连接处理完请求的时间（秒）
+SHUTDOWN_GRACE_SECONDS = 30
+
+# 与主模块的取值保持一致（主模块只在工作进程中导入），由 tests/test_daemon.py 校验
+OUTPUT_FORMATS = ['RGB565', 'RGB565_8BIT', 'RGB332', 'GRAY8', 'INDEXED8', 'INDEXED4']
+BYTE_ORDERS = ['little', 'big']
+COMPRESSION_METHODS = ['rle', 'deflate']
+
+
+def default_socket_path():
+    """默认的Unix套接字路径（按用户区分），不支持Unix套接字时返回None"""
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    user = os.getuid() if hasattr(os, 'getuid') else os.getpid()
+    return os.path.join(tempfile.gettempdir(), f"bmp2rgb565-{user}.sock")
+
+
+def default_token_file():
+    """TCP模式默认的令牌文件路径（用户主目录下）"""
+    return os.path.join(os.path.expanduser('~'), '.bmp2rgb565-daemon.token')
+
+
+def _check_token_file(token_file):
+    """令牌文件必须是当前用户所有、其他用户不可读写的普通文件，否则抛出 ValueError"""
+    st = os.stat(token_file)
+    if not os.path.isfile(token_file):
+        raise ValueError(f"令牌文件不是普通文件: {token_file}")
+    if hasattr(os, 'getuid'):
+        if st.st_uid != os.getuid():
+            raise ValueError(f"令牌文件不属于当前用户: {token_file}")
+        if st.st_mode & 0o077:
+            raise ValueError(f"令牌文件对其他用户可见，请执行 chmod 600 {token_file}")
+
+
+def read_token(token_file):
+    """读取令牌文件，返回令牌；文件无效时抛出 ValueError，无法读取时抛出 OSError"""
+    _check_token_file(token_file)
+    with open(token_file, 'r', encoding='utf-8') as f:
+        token = f.read().strip()
+    if not token:
+        raise ValueError(f"令牌文件为空: {token_file}")
+    return token
+
+
+def load_or_create_token(token_file):
+    """读取令牌文件，不存在时生成随机令牌并以仅所有者可读写的权限创建"""
+    try:
+        fd = os.open(token_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return read_token(token_file)
+    token = secrets.token_hex(32)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token + "\n")
+    return token
+
+
+def parse_job(request):
+    """校验转换请求，返回 (输入文件, 输入数据, 输出文件, 转换选项)，请求无效时抛出 ValueError"""
+    allowed = {'id', 'input', 'input_data', 'output', 'output_format', 'byte_order', 'binary', 'compression',
+               'crop', 'tiles', 'streaming'}
+    unknown = set(request) - allowed
+    if unknown:
+        raise ValueError(f"未知的请求字段: {', '.join(sorted(unknown))}")
+
+    input_file = request.get('input')
+    input_data = request.get('input_data')
+    output_file = request.get('output')
+    if (input_file is None) == (input_data is None):
+        raise ValueError("必须且只能指定 input 或 input_data 之一")
+    if not output_file:
+        raise ValueError("缺少 output")
+
+    output_format = request.get('output_format', 'RGB565')
+    byte_order = str(request.get('byte_order', 'little')).lower()
+    compression = request.get('compression')
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {output_format}")
+    if byte_order not in BYTE_ORDERS:
+        raise ValueError(f"不支持的字节顺序: {byte_order}")
+    if compression is not None and compression not in COMPRESSION_METHODS:
+        raise ValueError(f"不支持的压缩方式: {compression}")
+
+    crop = request.get('crop')
+    tiles = request.get('tiles')
+    if crop is not None and len(crop) != 4:
+        raise ValueError("crop 应为 [x, y, 宽, 高]")
+    if tiles is not None and len(tiles) != 2:
+        raise ValueError("tiles 应为 [宽, 高]")
+
+    options = {
+        'output_format': output_format,
+        'byte_order': byte_order,
+        'streaming': bool(request.get('streaming', False)),
+        'binary': bool(request.get('binary', False)),
+        'compression': compression,
+        'crop': tuple(int(value) for value in crop) if crop is not None else None,
+        'tiles': tuple(int(value) for value in tiles) if tiles is not None else None,
+    }
+    if input_data is not None:
+        input_data = base64.b64decode(input_data)
+    return input_file, input_data, output_file, options
+
+
+def _run_job(input_file, input_data, output_file, options):
+    """在工作进程中执行一个转换任务，返回 (是否成功, 消息)
+
+    工作进程复用同一个 BMPConverter（见 run_conversion_job），查找表和缓存在任务之间保留。
+    输入为文件内容时先写入临时文件。
+    """
+    from bmp_to_rgb565_enhanced import run_conversion_job
+
+    temp_file = None
+    try:
+        if input_data is not None:
+            fd, temp_file = tempfile.mkstemp(suffix='.bmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(input_data)
+            input_file = temp_file
+        success, message, _ = run_conversion_job(input_file, output_file, options)
+        return success, message
+    finally:
+        if temp_file is not None:
+            os.remove(temp_file)
+
+
+class ConversionServer:
+    """基于asyncio的转换服务：每个连接上的请求并发执行，转换交给进程池完成"""
+
+    def __init__(self, jobs=None, token=None):
+        self.jobs = jobs or os.cpu_count() or 1
+        # TCP模式下每个请求都必须携带的令牌（Unix套接字模式为None）
+        self.token = token
+        self.executor = None
+        self.stop_event = None
+        self.started = time.time()
+        self.completed = 0
+        self.failed = 0
+        self.active = 0
+        self.connections = set()
+
+    def status(self):
+        return {
+            'success': True,
+            'message': "pong",
+            'pid': os.getpid(),
+            'workers': self.jobs,
+            'uptime': time.time() - self.started,
+            'active': self.active,
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+
+    async def run_job(self, request):
+        """执行一个转换请求并返回响应"""
+        start = time.perf_counter()
+        try:
+            input_file, input_data, output_file, options = parse_job(request)
+        except (ValueError, TypeError) as e:
+            success, message = False, f"请求无效: {str(e)}"
+        else:
+            self.active += 1
+            try:
+                loop = asyncio.get_running_loop()
+                success, message = await loop.run_in_executor(self.executor, _run_job, input_file, input_data,
+                                                              output_file, options)
+            except Exception as e:
+                success, message = False, f"转换过程中发生错误: {str(e)}"
+            finally:
+                self.active -= 1
+
+        if success:
+            self.completed += 1
+        else:
+            self.failed += 1
+        return {'success': success, 'message': message, 'seconds': time.perf_counter() - start}
+
+    async def handle_request(self, line, writer, write_lock):
+        """处理一行请求并写回响应"""
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("请求必须是JSON对象")
+            request_id = request.get('id')
+            token = request.pop('token', None)
+            op = request.pop('op', 'convert')
+            if self.token is not None and not (isinstance(token, str) and
+                                               secrets.compare_digest(token.encode('utf-8'),
+                                                                      self.token.encode('utf-8'))):
+                response = {'success': False, 'message': "认证失败: 缺少令牌或令牌不正确"}
+            elif op == 'ping':
+                response = self.status()
+            elif op == 'shutdown':
+                response = {'success': True, 'message': "守护进程即将停止"}
+                self.stop_event.set()
+            elif op == 'convert':
+                response = await self.run_job(request)
+            else:
+                response = {'success': False, 'message': f"未知的操作: {op}"}
+        except ValueError as e:
+            response = {'success': False, 'message': f"请求无效: {str(e)}"}
+
+        response['id'] = request_id
+        async with write_lock:
+            writer.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b"\n")
+            await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        """逐行读取请求；每个请求在独立的任务中执行，响应按完成顺序写回"""
+        write_lock = asyncio.Lock()
+        tasks = set()
+        self.connections.add(asyncio.current_task())
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(self.handle_request(line, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, asyncio.CancelledError):
+            # 客户端断开，或守护进程停止时仍未结束的连接
+            pass
+        finally:
+            self.connections.discard(asyncio.current_task())
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def serve(self, socket_path=None, port=None):
+        """启动服务直到收到 shutdown 请求"""
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from bmp_to_rgb565_enhanced import init_conversion_worker
+
+        self.stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self.stop_event.set)
+            except (NotImplementedError, AttributeError, ValueError):
+                # Windows 的事件循环不支持信号处理器，Ctrl+C 仍会中断 asyncio.run
+                pass
+
+        # 工作进程不能用 fork 直接派生：fork 出的子进程会继承监听套接字，守护进程退出后
+        # 残留的子进程仍会接受连接却不处理请求。forkserver 派生的进程只继承必要的文件描述符。
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+        else:
+            context = multiprocessing.get_context('spawn')
+        self.executor = ProcessPoolExecutor(max_workers=self.jobs, mp_context=context, initializer=init_conversion_worker)
+        try:
+            if socket_path is not None:
+                # 只允许当前用户连接
+                previous_umask = os.umask(0o077)
+                try:
+                    server = await asyncio.start_unix_server(self.handle_connection, socket_path,
+                                                             limit=MAX_REQUEST_BYTES)
+                finally:
+                    os.umask(previous_umask)
+                address = socket_path
+            else:
+                server = await asyncio.start_server(self.handle_connection, '127.0.0.1', port,
+                                                    limit=MAX_REQUEST_BYTES)
+                address = f"127.0.0.1:{port}"
+
+            print(f"BMP转换守护进程已启动: {address}（{self.jobs} 个工作进程，PID {os.getpid()}）")
+            sys.stdout.flush()
+            async with server:
+                await self.stop_event.wait()
+                # 不再接受新连接，已建立的连接处理完各自的请求后再退出
+                server.close()
+                pending = self.connections - {asyncio.current_task()}
+                if pending:
+                    await asyncio.wait(pending, timeout=SHUTDOWN_GRACE_SECONDS)
+        finally:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            if socket_path is not None and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+def _socket_in_use(socket_path):
+    """判断Unix套接字是否有守护进程在监听（用于清理上次异常退出留下的套接字文件）"""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def add_address_arguments(parser):
+    """添加守护进程地址相关的命令行参数"""
+    parser.add_argument('--socket', default=None, metavar='PATH', help="Unix套接字路径（默认按用户放在临时目录）")
+    parser.add_argument('--port', type=int, default=None, metavar='N',
+                        help=f"改用回环地址 127.0.0.1 的TCP端口（不支持Unix套接字的平台默认 {DEFAULT_PORT}）。"
+                             f"本机其他用户也能连接该端口，而守护进程会以当前用户身份写文件，"
+                             f"因此每个请求都要带上令牌文件中的令牌")
+    parser.add_argument('--token-file', default=None, metavar='PATH',
+                        help="TCP模式的令牌文件（默认 ~/.bmp2rgb565-daemon.token；守护进程首次启动时生成，"
+                             "只有所有者可读，不要与他人共享）")
+
+
+def resolve_address(args):
+    """返回 (套接字路径, 端口)，两者只有一个不为None"""
+    if args.port is not None:
+        return None, args.port
+    socket_path = args.socket or default_socket_path()
+    if socket_path is None:
+        return None, DEFAULT_PORT
+    return socket_path, None
+
+
+def serve_main(argv):
+    """守护进程入口"""
+    parser = argparse.ArgumentParser(prog="bmp_to_rgb565_daemon.py serve", description="启动BMP转换守护进程")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="工作进程数（默认CPU核数）")
+    add_address_arguments(parser)
+    args = parser.parse_args(argv)
+
+    socket_path, port = resolve_address(args)
+    if socket_path is not None and os.path.exists(socket_path):
+        if _socket_in_use(socket_path):
+            print(f"错误: 守护进程已在运行: {socket_path}")
+            return 1
+        # 上次异常退出留下的套接字文件；不属于当前用户等原因无法删除时给出提示
+        try:
+            os.remove(socket_path)
+        except OSError as e:
+            print(f"错误: 无法删除残留的套接字文件 {socket_path}: {e.strerror}，请用 --socket 指定其他路径")
+            return 1
+
+    token = None
+    if port is not None:
+        token_file = args.token_file or default_token_file()
+        try:
+            token = load_or_create_token(token_file)
+        except (OSError, ValueError) as e:
+            print(f"错误: 无法读取令牌文件: {str(e)}")
+            return 1
+        print(f"TCP模式，请求需携带令牌文件 {token_file} 中的令牌")
+
+    server = ConversionServer(args.jobs, token)
+    try:
+        asyncio.run(server.serve(socket_path, port))
+    except KeyboardInterrupt:
+        pass
+    print(f"守护进程已停止: 完成 {server.completed} 个任务，失败 {server.failed} 个")
+    return 0
+
+
+def connect(socket_path, port):
+    """连接到守护进程"""
+    if port is not None:
+        return socket.create_connection(('127.0.0.1', port))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def send_requests(socket_path, port, requests, on_response=None, token=None):
+    """通过一条连接发送全部请求，返回按请求顺序排列的响应列表
+
+    请求一次性全部发出，由守护进程并发处理；on_response 在每个响应到达时调用。
+    token 为TCP模式的令牌，会加入每个请求。
+    """
+    for index, request in enumerate(requests):
+        request.setdefault('id', index)
+        if token is not None:
+            request['token'] = token
+    with connect(socket_path, port) as sock:
+        payload = b"".join(json.dumps(request, ensure_ascii=False).encode('utf-8') + b"\n" for request in requests)
+        sock.sendall(payload)
+        sock.shutdown(socket.SHUT_WR)
+
+        responses = {}
+        with sock.makefile('rb') as stream:
+            for line in stream:
+                response = json.loads(line)
+                responses[response.get('id')] = response
+                if on_response:
+                    on_response(response)
+    return [responses.get(request['id'], {'id': request['id'], 'success': False, 'message': "未收到响应"})
+            for request in requests]
+
+
+def job_request(input_file, output_file, output_format='RGB565', byte_order='little', binary=False,
+                compression=None):
+    """构造转换请求；路径转换为绝对路径，因为守护进程的工作目录与客户端不同"""
+    return {
+        'input': os.path.abspath(input_file),
+        'output': os.path.abspath(output_file),
+        'output_format': output_format,
+        'byte_order': byte_order,
+        'binary': binary,
+        'compression': compression,
+    }
+
+
+def client_main(command, argv):
+    """客户端入口：convert、submit、ping、shutdown"""
+    parser = argparse.ArgumentParser(prog=f"bmp_to_rgb565_daemon.py {command}")
+    if command == 'convert':
+        parser.add_argument('input_file', help="输入BMP文件")
+        parser.add_argument('output_file', help="输出文件")
+        parser.add_argument('output_format', nargs='?', default='RGB565', choices=OUTPUT_FORMATS,
+                            help="输出格式（默认 RGB565）")
+        parser.add_argument('byte_order', nargs='?', default='little', type=str.lower, choices=BYTE_ORDERS,
+                            help="字节顺序（默认 little）")
+        parser.add_argument('--binary', action='store_true', help="输出 .bin 像素数据和精简头文件")
+        parser.add_argument('--compress', choices=COMPRESSION_METHODS, default=None, help="输出压缩后的字节数组")
+    elif command == 'submit':
+        parser.add_argument('jobs_file', help="每行一个JSON转换请求的文件，\"-\" 表示标准输入")
+    add_address_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if command == 'convert':
+        requests = [job_request(args.input_file, args.output_file, args.output_format, args.byte_order,
+                                args.binary, args.compress)]
+    elif command == 'submit':
+        stream = sys.stdin if args.jobs_file == '-' else open(args.jobs_file, 'r', encoding='utf-8')
+        requests = []
+        with stream:
+            for line_number, line in enumerate(stream, 1):
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    print(f"错误: 第 {line_number} 行不是有效的JSON: {str(e)}")
+                    return 1
+                if not isinstance(request, dict):
+                    print(f"错误: 第 {line_number} 行不是JSON对象")
+                    return 1
+                requests.append(request)
+        for request in requests:
+            # 相对路径按客户端的工作目录解析
+            for key in ('input', 'output'):
+                if key in request:
+                    request[key] = os.path.abspath(request[key])
+    else:
+        requests = [{'op': command}]
+
+    socket_path, port = resolve_address(args)
+    token = None
+    if port is not None:
+        try:
+            token = read_token(args.token_file or default_token_file())
+        except (OSError, ValueError) as e:
+            print(f"错误: 无法读取令牌文件: {str(e)}")
+            return 1
+    try:
+        def report(response):
+            if command == 'submit':
+                state = "成功" if response['success'] else "失败"
+                print(f"[{state}] {response.get('id')}: {response['message']}")
+                sys.stdout.flush()
+        responses = send_requests(socket_path, port, requests, report, token)
+    except OSError as e:
+        print(f"错误: 无法连接守护进程（{socket_path or f'127.0.0.1:{port}'}）: {str(e)}")
+        return 1
+
+    failed = sum(1 for response in responses if not response['success'])
+    if command == 'submit':
+        print(f"完成: 成功 {len(responses) - failed} 个，失败 {failed} 个")
+    elif command == 'ping':
+        print(json.dumps(responses[0], ensure_ascii=False, indent=1))
+    else:
+        message = responses[0]['message']
+        print(message if responses[0]['success'] else f"错误: {message}")
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    commands = ['serve', 'convert', 'submit', 'ping', 'shutdown']
+    if not argv or argv[0] not in commands:
+        print(__doc__.strip())
+        return 1
+    if argv[0] == 'serve':
+        return serve_main(argv[1:])
+    return client_main(argv[0], argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
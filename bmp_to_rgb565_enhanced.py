@@ -1,42 +1,1031 @@
+import io
 import struct
 import sys
+import zlib
 import os
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-from PIL import Image
+import mmap
+import glob
+import argparse
+import hashlib
+import json
+import shutil
+import time
+import queue
+import contextlib
+import signal
+# tkinter、Pillow、进程池等只在用到时导入：命令行每次调用都要付启动开销，
+# 无Tk的构建服务器上也不能因为导入GUI库而失败
+import numpy as np
 import threading
 
+# 转换器版本：输出内容发生变化时需要递增，以使转换缓存失效
+CONVERTER_VERSION = "2.1"
+
+# 压缩输出支持的方式
+COMPRESSION_METHODS = ('rle', 'deflate')
+
+# 索引色输出格式及其调色板的最大颜色数
+INDEXED_FORMATS = {'INDEXED8': 256, 'INDEXED4': 16}
+
+# 命令行、批量模式和守护进程可选的全部输出格式
+OUTPUT_FORMATS = ['RGB565', 'RGB565_8BIT', 'RGB332', 'GRAY8', 'INDEXED8', 'INDEXED4']
+
+# RLE数据的C语言参考解码器，随压缩输出写入头文件
+RLE_C_DECODER = """#ifndef BMP_RLE_DECODE_DEFINED
+#define BMP_RLE_DECODE_DEFINED
+/* RLE参考解码器：unit 为每个像素的字节数（RGB565为2，8位格式为1），返回解码后的字节数 */
+static inline uint32_t bmp_rle_decode(const uint8_t *src, uint32_t src_len, uint8_t *dst, uint8_t unit)
+{
+    const uint8_t *end = src + src_len;
+    uint8_t *out = dst;
+    while (src < end) {
+        uint8_t header = *src++;
+        uint32_t count = (uint32_t)(header & 0x7F) + 1;
+        if (header & 0x80) {
+            /* 重复包：一个像素重复 count 次 */
+            while (count--) {
+                for (uint8_t i = 0; i < unit; i++) {
+                    *out++ = src[i];
+                }
+            }
+            src += unit;
+        } else {
+            /* 原样包：后面跟随 count 个像素 */
+            count *= unit;
+            while (count--) {
+                *out++ = *src++;
+            }
+        }
+    }
+    return (uint32_t)(out - dst);
+}
+#endif
+"""
+
+class ConversionCancelled(Exception):
+    """转换被取消（由进度回调抛出，转换方法捕获后返回失败并清理未完成的输出）"""
+
+class ProgressMessage(str):
+    """带完成百分比的进度消息
+    
+    本身就是普通字符串（如 "转换进度: 42%"），只接受字符串的进度回调无需改动；
+    需要确定进度的调用方可读取 percent 属性。
+    """
+    
+    def __new__(cls, percent):
+        message = super().__new__(cls, f"转换进度: {percent}%")
+        message.percent = percent
+        return message
+
+@contextlib.contextmanager
+def atomic_output(output_file, mode='w', **kwargs):
+    """先写入同目录下的临时文件（<输出文件名>.<进程号>.<随机串>.part），完成后再替换输出文件
+    
+    写出过程中出错或被取消时删除临时文件，不会留下只写了一半的输出。
+    临时文件名各不相同且以独占方式创建，多个进程同时写同一输出时不会互相覆盖临时文件。
+    """
+    temp_file = f"{output_file}.{os.getpid()}.{os.urandom(4).hex()}.part"
+    try:
+        with open(temp_file, mode.replace('w', 'x'), **kwargs) as f:
+            yield f
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+def is_path_source(source):
+    """BMP来源是否为文件路径（否则为 bytes 类的文件内容）"""
+    return isinstance(source, (str, os.PathLike))
+
+def read_bmp_source(source):
+    """把BMP来源规范为文件路径或 bytes 类对象
+    
+    文件路径和 bytes/bytearray/memoryview 原样返回；二进制文件对象读取全部内容（不关闭）。
+    """
+    if is_path_source(source) or isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    if hasattr(source, 'read'):
+        return source.read()
+    raise TypeError(f"不支持的BMP来源类型: {type(source).__name__}")
+
+def indexed_format_error(output_format, output_kind):
+    """INDEXED 格式的调色板按整幅图像生成，只支持C数组输出；用于其他输出时返回错误信息，否则返回None"""
+    if output_format in INDEXED_FORMATS:
+        return f"{output_format} 格式只支持C数组输出，不能用于{output_kind}"
+    return None
+
+def _open_source(source):
+    """以二进制只读方式打开BMP来源（文件路径或 bytes 类对象）"""
+    if is_path_source(source):
+        return open(source, 'rb')
+    return io.BytesIO(source)
+
+def _source_size(source):
+    """BMP来源的总字节数"""
+    if is_path_source(source):
+        return os.path.getsize(source)
+    return memoryview(source).nbytes
+
+@contextlib.contextmanager
+def _map_source(source):
+    """把BMP来源映射为可切片的只读缓冲区：文件使用内存映射，bytes 类对象直接使用 memoryview"""
+    if not is_path_source(source):
+        yield memoryview(source).cast('B')
+        return
+    with open(source, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+def rle_encode(data, unit_size=2):
+    """按像素单位对字节数据进行RLE压缩（整段向量化处理）
+    
+    每个包以一个头字节开始：最高位为1表示重复包，低7位+1为重复次数，后跟一个像素；
+    最高位为0表示原样包，低7位+1为像素个数，后跟这些像素。每包最多128个像素。
+    """
+    if len(data) % unit_size:
+        raise ValueError(f"数据长度不是 {unit_size} 的整数倍")
+    raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, unit_size)
+    units = raw.view(np.uint16 if unit_size == 2 else np.uint8).ravel()
+    count = len(units)
+    if count == 0:
+        return b''
+    
+    # 找出所有游程，并拆分为不超过128个像素的块
+    starts = np.flatnonzero(np.concatenate(([True], units[1:] != units[:-1])))
+    lengths = np.diff(np.append(starts, count))
+    chunks_per_run = (lengths + 127) // 128
+    chunk_run = np.repeat(np.arange(len(starts)), chunks_per_run)
+    chunk_offset = np.arange(len(chunk_run)) - np.repeat(np.cumsum(chunks_per_run) - chunks_per_run, chunks_per_run)
+    chunk_start = starts[chunk_run] + chunk_offset * 128
+    chunk_len = np.minimum(lengths[chunk_run] - chunk_offset * 128, 128)
+    
+    # 长度不小于2的块作为重复包，连续的单像素块合并为原样包
+    is_run = chunk_len >= 2
+    is_literal = ~is_run
+    index = np.arange(len(chunk_len))
+    group_begin = is_literal & ~np.concatenate(([False], is_literal[:-1]))
+    group_first = np.maximum.accumulate(np.where(group_begin, index, 0))
+    position = index - group_first
+    group_id = np.cumsum(group_begin) - 1
+    group_size = np.bincount(group_id[is_literal], minlength=max(1, int(group_id.max()) + 1))
+    literal_count = np.minimum(128, group_size[np.maximum(group_id, 0)] - (position // 128) * 128)
+    
+    has_header = is_run | (is_literal & (position % 128 == 0))
+    headers = np.where(is_run, 0x80 | (chunk_len - 1), literal_count - 1).astype(np.uint8)
+    
+    # 每个块输出可选的头字节和一个像素
+    out_len = has_header.astype(np.int64) + unit_size
+    offsets = np.cumsum(out_len) - out_len
+    out = np.empty(int(out_len.sum()), dtype=np.uint8)
+    out[offsets[has_header]] = headers[has_header]
+    unit_pos = offsets + has_header
+    out[unit_pos[:, np.newaxis] + np.arange(unit_size)] = raw[chunk_start]
+    return out.tobytes()
+
+def rle_decode(data, unit_size=2):
+    """RLE参考解码器（与 RLE_C_DECODER 逻辑一致），用于校验压缩结果"""
+    out = bytearray()
+    pos = 0
+    size = len(data)
+    while pos < size:
+        header = data[pos]
+        pos += 1
+        count = (header & 0x7F) + 1
+        if header & 0x80:
+            out += data[pos:pos + unit_size] * count
+            pos += unit_size
+        else:
+            out += data[pos:pos + count * unit_size]
+            pos += count * unit_size
+    return bytes(out)
+
+def compress_pixel_bytes(data, compression, unit_size=2):
+    """按指定方式压缩像素字节数据
+    
+    deflate 为原始DEFLATE流（LZ77+霍夫曼，无zlib头），单片机端可用
+    uzlib、tinf 等inflate实现解码。
+    """
+    if compression == 'rle':
+        return rle_encode(data, unit_size)
+    if compression == 'deflate':
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+    raise ValueError(f"不支持的压缩方式: {compression}")
+
+def decompress_pixel_bytes(data, compression, unit_size=2):
+    """压缩数据的Python参考解码"""
+    if compression == 'rle':
+        return rle_decode(data, unit_size)
+    if compression == 'deflate':
+        return zlib.decompress(data, -15)
+    raise ValueError(f"不支持的压缩方式: {compression}")
+
+class CArrayEmitter:
+    """C数组文本输出器
+    
+    使用预先生成的字符串查找表（16位 65536 项，8位 256 项）格式化像素值，
+    按整行拼接后成块写出，避免逐像素创建格式化字符串。
+    """
+    
+    # 字符串查找表缓存，键为 (表类型, 十六进制前缀, 分隔符)，所有实例共享
+    _token_cache = {}
+    
+    def __init__(self, output_format='RGB565', byte_order='little', values_per_line=None, hex_prefix=None, array_name=None):
+        if hex_prefix is None:
+            # 保持原有风格：8位字节数组使用 0X，其余使用 0x
+            hex_prefix = '0X' if output_format == 'RGB565_8BIT' else '0x'
+        if hex_prefix not in ('0x', '0X'):
+            raise ValueError(f"十六进制前缀必须是 '0x' 或 '0X': {hex_prefix}")
+        
+        if values_per_line is None:
+            values_per_line = 8 if output_format == 'RGB565_8BIT' else 16
+        if values_per_line < 1:
+            raise ValueError(f"每行数值个数必须大于0: {values_per_line}")
+        
+        self.output_format = output_format
+        self.byte_order = byte_order
+        self.values_per_line = values_per_line
+        self.hex_prefix = hex_prefix
+        self.array_name = array_name
+        
+        if output_format == 'RGB565_8BIT':
+            # 每个像素输出高低两个字节，一行至少容纳一个像素
+            self.pixels_per_line = max(1, values_per_line // 2)
+            self.separator = ","
+        else:
+            self.pixels_per_line = values_per_line
+            self.separator = ", "
+        
+        self._tokens = self._get_token_table(output_format, hex_prefix, self.separator)
+        self._width = 0
+    
+    @classmethod
+    def _get_token_table(cls, output_format, hex_prefix, separator):
+        """获取像素值到文本的查找表，表项已包含分隔符"""
+        if output_format == 'RGB565':
+            kind = 'u16'
+        elif output_format == 'RGB565_8BIT':
+            kind = 'u16_bytes'
+        else:
+            kind = 'u8'
+        
+        key = (kind, hex_prefix, separator)
+        table = cls._token_cache.get(key)
+        if table is not None:
+            return table
+        
+        if kind == 'u16':
+            table = [f"{hex_prefix}{value:04X}{separator}" for value in range(65536)]
+        elif kind == 'u16_bytes':
+            byte_tokens = [f"{hex_prefix}{value:02X}" for value in range(256)]
+            table = [byte_tokens[high] + "," + byte_tokens[low] + separator
+                     for high in range(256) for low in range(256)]
+        else:
+            table = [f"{hex_prefix}{value:02X}{separator}" for value in range(256)]
+        
+        cls._token_cache[key] = table
+        return table
+    
+    def declaration(self, width, height):
+        """返回数组声明所需的 (标题, 数据类型, 数组名, 元素个数)"""
+        output_format = self.output_format
+        array_name = self.array_name or f"image_{width}x{height}"
+        if output_format == 'RGB565':
+            title, data_type = "BMP转RGB565数组", "uint16_t"
+        elif output_format == 'RGB332':
+            title, data_type = "BMP转RGB332数组", "uint8_t"
+        elif output_format == 'GRAY8':
+            title, data_type = "BMP转8位灰度数组", "uint8_t"
+        elif output_format == 'RGB565_8BIT':
+            title, data_type = "BMP转RGB565 8位字节数组", "unsigned char"
+        elif output_format == 'INDEXED8':
+            title, data_type = "BMP转8位索引色数组", "uint8_t"
+        elif output_format == 'INDEXED4':
+            title, data_type = "BMP转4位索引色数组", "uint8_t"
+        else:
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        
+        # 计算数组大小
+        if output_format == 'RGB565_8BIT':
+            array_size = width * height * 2  # 每个像素2字节
+        elif output_format == 'INDEXED4':
+            array_size = (width + 1) // 2 * height  # 每字节2个像素，每行补齐到整字节
+        else:
+            array_size = width * height
+        return title, data_type, array_name, array_size
+    
+    def write_header(self, out_f, width, height, bpp, palette=None):
+        """写入数组注释和声明
+        
+        索引色格式需传入 palette（RGB565值数组），先写出 <数组名>_palette 调色板数组。
+        """
+        self._width = width
+        title, data_type, array_name, array_size = self.declaration(width, height)
+        out_f.write(f"// {title}\n")
+        out_f.write(f"// 字节顺序: {self.byte_order}-endian\n")
+        out_f.write(f"// 原始尺寸: {width}×{height}, {bpp}位\n")
+        out_f.write(f"// 输出格式: {self.output_format}\n")
+        if palette is not None:
+            self.write_palette(out_f, array_name, palette)
+        out_f.write(f"const {data_type} {array_name}[{array_size}] = {{\n")
+    
+    def write_palette(self, out_f, array_name, palette):
+        """写出索引色格式的 RGB565 调色板数组"""
+        out_f.write(f"// 调色板: {len(palette)} 色，RGB565\n")
+        if self.output_format == 'INDEXED4':
+            out_f.write("// 索引打包: 每字节2个像素，高4位在前，每行补齐到整字节\n")
+        tokens = self._get_token_table('RGB565', self.hex_prefix, ", ")
+        entries = [tokens[value] for value in palette.tolist()]
+        entries[-1] = entries[-1][:-2]
+        out_f.write(f"const uint16_t {array_name}_palette[{len(palette)}] = {{\n")
+        for i in range(0, len(entries), self.values_per_line):
+            out_f.write("    " + "".join(entries[i:i + self.values_per_line]) + "\n")
+        out_f.write("};\n")
+    
+    def write_compressed_header(self, out_f, width, height, bpp, compression, raw_size, data_size):
+        """写入压缩数据数组的注释、宏定义和声明（元素为 uint8_t 字节）"""
+        title, data_type, array_name, array_size = self.declaration(width, height)
+        macro = array_name.upper()
+        unit_size = 1 if data_type == "uint8_t" else 2
+        ratio = data_size / raw_size * 100 if raw_size else 0
+        self._width = data_size
+        out_f.write(f"// {title}（{compression.upper()}压缩）\n")
+        out_f.write(f"// 字节顺序: {self.byte_order}-endian\n")
+        out_f.write(f"// 原始尺寸: {width}×{height}, {bpp}位\n")
+        out_f.write(f"// 输出格式: {self.output_format}\n")
+        out_f.write(f"// 压缩方式: {compression}，原始 {raw_size} 字节，压缩后 {data_size} 字节（{ratio:.1f}%）\n")
+        if compression == 'deflate':
+            out_f.write("// 数据为原始DEFLATE流（无zlib头），可用 uzlib/tinf 等inflate实现解码\n")
+        out_f.write("#include <stdint.h>\n\n")
+        out_f.write(f"#define {macro}_WIDTH {width}\n")
+        out_f.write(f"#define {macro}_HEIGHT {height}\n")
+        out_f.write(f"#define {macro}_RAW_SIZE {raw_size}\n")
+        out_f.write(f"#define {macro}_UNIT_SIZE {unit_size}\n\n")
+        if compression == 'rle':
+            out_f.write(RLE_C_DECODER)
+            out_f.write("\n")
+        out_f.write(f"const uint8_t {array_name}[{data_size}] = {{\n")
+    
+    def write_extern_header(self, out_f, width, height, bpp, binary_file, data_size):
+        """为二进制像素数据写入精简头文件
+        
+        声明与数组输出相同的符号（extern），并附带可在汇编中使用的 .incbin 片段，
+        C 侧代码无需修改即可改用二进制数据链接。
+        """
+        title, data_type, array_name, array_size = self.declaration(width, height)
+        title = title.replace("数组", "二进制数据")
+        macro = array_name.upper()
+        binary_name = os.path.basename(binary_file)
+        out_f.write(f"// {title}\n")
+        out_f.write(f"// 字节顺序: {self.byte_order}-endian\n")
+        out_f.write(f"// 原始尺寸: {width}×{height}, {bpp}位\n")
+        out_f.write(f"// 输出格式: {self.output_format}\n")
+        out_f.write(f"// 像素数据: {binary_name} ({data_size} 字节)\n")
+        out_f.write(f"#ifndef {macro}_H\n")
+        out_f.write(f"#define {macro}_H\n\n")
+        out_f.write("#include <stdint.h>\n\n")
+        out_f.write(f"#define {macro}_WIDTH {width}\n")
+        out_f.write(f"#define {macro}_HEIGHT {height}\n")
+        out_f.write(f"#define {macro}_SIZE {array_size}\n")
+        out_f.write(f"#define {macro}_FORMAT_{self.output_format} 1\n")
+        out_f.write(f"#define {macro}_BIG_ENDIAN {1 if self.byte_order == 'big' else 0}\n\n")
+        out_f.write(f"extern const {data_type} {array_name}[{array_size}];\n\n")
+        out_f.write("/* 在汇编文件（.S）中链接像素数据:\n")
+        out_f.write("    .section .rodata\n")
+        out_f.write(f"    .global {array_name}\n")
+        out_f.write("    .balign 4\n")
+        out_f.write(f"{array_name}:\n")
+        out_f.write(f"    .incbin \"{binary_name}\"\n")
+        out_f.write("*/\n\n")
+        out_f.write(f"#endif /* {macro}_H */\n")
+    
+    def format_rows(self, values, is_last_block=False):
+        """将若干行像素值（h×w数组）格式化为文本
+        
+        每个图像行独立分行，每行最多 pixels_per_line 个像素；
+        is_last_block 为真时最后一个数值后不加分隔符。
+        """
+        if values.size == 0:
+            return ""
+        
+        tokens = list(map(self._tokens.__getitem__, values.ravel().tolist()))
+        if is_last_block:
+            tokens[-1] = tokens[-1][:-len(self.separator)]
+        
+        width = values.shape[-1]
+        step = self.pixels_per_line
+        lines = []
+        if width % step == 0:
+            # 行宽是每行个数的整数倍时，可以跨图像行连续切分
+            for i in range(0, len(tokens), step):
+                lines.append("    " + "".join(tokens[i:i + step]) + "\n")
+        else:
+            for row_start in range(0, len(tokens), width):
+                row_end = row_start + width
+                for i in range(row_start, row_end, step):
+                    lines.append("    " + "".join(tokens[i:min(i + step, row_end)]) + "\n")
+        return "".join(lines)
+    
+    def write_rows(self, out_f, values, is_last_block=False):
+        """格式化并一次性写出若干行像素值"""
+        out_f.write(self.format_rows(values, is_last_block))
+    
+    def write_footer(self, out_f):
+        """写入数组结尾（每行文本都已以换行结束）"""
+        out_f.write("};\n")
+
+class ConversionCache:
+    """按内容寻址的转换缓存
+    
+    缓存键由输入文件内容的SHA-256、转换选项和 CONVERTER_VERSION 共同决定。
+    缓存的输出文件保存在 objects/ 目录下，manifest.json 记录大小和最近使用时间，
+    总大小超过上限时按最近最少使用（LRU）淘汰。
+    多个进程可以共用同一缓存目录：对象和清单都先写入唯一的临时文件再替换，
+    写回清单时在锁内与磁盘上的清单合并。缓存读写出错只当作未命中，不影响转换结果。
+    """
+    
+    MANIFEST_NAME = 'manifest.json'
+    # 超过该时间的清单锁视为持有进程异常退出后的残留
+    LOCK_STALE_SECONDS = 30
+    
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._manifest_path = os.path.join(cache_dir, self.MANIFEST_NAME)
+        self._entries = self._load_manifest()
+        # 本进程新增/更新和删除的条目，写回时合并到磁盘上的清单
+        self._updated = {}
+        self._removed = set()
+    
+    def _load_manifest(self):
+        """读取清单，文件损坏或版本不符时视为空缓存"""
+        try:
+            with open(self._manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == CONVERTER_VERSION:
+                return manifest.get('entries', {})
+        except (OSError, ValueError):
+            pass
+        return {}
+    
+    @staticmethod
+    def _hash_file(file_path):
+        """计算文件内容的SHA-256"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def _copy_file(source, destination):
+        """经唯一的临时文件复制，其他进程不会读到只复制了一半的文件"""
+        with open(source, 'rb') as src, atomic_output(destination, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+    
+    def make_key(self, input_file, **options):
+        """根据输入内容、转换选项和转换器版本生成缓存键"""
+        key_data = json.dumps([CONVERTER_VERSION, self._hash_file(input_file), options], sort_keys=True)
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+    
+    def _object_path(self, key, index=0):
+        return os.path.join(self.cache_dir, 'objects', key[:2], f"{key}.{index}")
+    
+    def _forget(self, key):
+        self._entries.pop(key, None)
+        self._updated.pop(key, None)
+        self._removed.add(key)
+    
+    def fetch(self, key, output_files):
+        """查询缓存，命中时恢复输出文件并返回 True
+        
+        output_files 为单个路径或路径列表（如二进制模式的 .h 和 .bin）。
+        已有的输出文件与缓存内容相同时保持不动，不改变其修改时间，
+        避免触发下游的重新编译。
+        """
+        if isinstance(output_files, str):
+            output_files = [output_files]
+        entry = self._entries.get(key)
+        objects = [self._object_path(key, index) for index in range(len(output_files))]
+        if (entry is None or len(entry['files']) != len(output_files)
+                or not all(os.path.isfile(object_path) for object_path in objects)):
+            if entry is not None:
+                self._forget(key)
+            self.misses += 1
+            return False
+        
+        try:
+            for output_file, object_path, file_entry in zip(output_files, objects, entry['files']):
+                up_to_date = (os.path.isfile(output_file)
+                              and os.path.getsize(output_file) == file_entry['size']
+                              and self._hash_file(output_file) == file_entry['output_hash'])
+                if not up_to_date:
+                    output_parent = os.path.dirname(output_file)
+                    if output_parent:
+                        os.makedirs(output_parent, exist_ok=True)
+                    self._copy_file(object_path, output_file)
+        except OSError:
+            # 对象被其他进程淘汰等情况，按未命中处理，由调用方重新转换
+            self._forget(key)
+            self.misses += 1
+            return False
+        
+        entry['last_used'] = time.time()
+        self._updated[key] = entry
+        self.hits += 1
+        return True
+    
+    def store(self, key, output_files):
+        """把转换结果存入缓存（超出大小上限的旧条目在 save 时淘汰）
+        
+        复制失败时不记录该条目，转换结果本身不受影响。
+        """
+        if isinstance(output_files, str):
+            output_files = [output_files]
+        files = []
+        try:
+            for index, output_file in enumerate(output_files):
+                object_path = self._object_path(key, index)
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                self._copy_file(output_file, object_path)
+                files.append({
+                    'size': os.path.getsize(output_file),
+                    'output_hash': self._hash_file(output_file),
+                })
+        except OSError:
+            return
+        
+        entry = {
+            'files': files,
+            'size': sum(file_entry['size'] for file_entry in files),
+            'last_used': time.time(),
+        }
+        self._entries[key] = entry
+        self._updated[key] = entry
+        self._removed.discard(key)
+    
+    def _evict(self):
+        """总大小超过上限时，按最近使用时间从旧到新淘汰"""
+        total = sum(entry['size'] for entry in self._entries.values())
+        if total <= self.max_bytes:
+            return
+        for key in sorted(self._entries, key=lambda k: self._entries[k]['last_used']):
+            if total <= self.max_bytes:
+                break
+            entry = self._entries.pop(key)
+            total -= entry['size']
+            for index in range(len(entry['files'])):
+                try:
+                    os.remove(self._object_path(key, index))
+                except OSError:
+                    pass
+    
+    @contextlib.contextmanager
+    def _manifest_lock(self):
+        """以独占创建锁文件的方式串行化各进程对清单的读-合并-写"""
+        lock_path = self._manifest_path + '.lock'
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > self.LOCK_STALE_SECONDS:
+                        os.remove(lock_path)
+                        continue
+                except OSError:
+                    # 锁刚被释放
+                    continue
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock_path)
+    
+    def save(self):
+        """把本进程的改动合并进磁盘上的清单，按需淘汰后写回
+        
+        其他进程在此期间写入的条目会保留。写回失败时忽略，只会损失缓存命中。
+        """
+        if not self._updated and not self._removed:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with self._manifest_lock():
+                entries = self._load_manifest()
+                for key in self._removed:
+                    entries.pop(key, None)
+                for key, entry in self._updated.items():
+                    on_disk = entries.get(key)
+                    if on_disk is not None and on_disk.get('files') == entry['files']:
+                        entry['last_used'] = max(entry['last_used'], on_disk['last_used'])
+                    entries[key] = entry
+                self._entries = entries
+                self._evict()
+                with atomic_output(self._manifest_path, 'w', encoding='utf-8') as f:
+                    json.dump({'version': CONVERTER_VERSION, 'entries': self._entries}, f)
+        except OSError:
+            return
+        self._updated = {}
+        self._removed = set()
+    
+    def summary(self):
+        """返回命中统计信息"""
+        return f"缓存: 命中 {self.hits} 次，未命中 {self.misses} 次"
+
+class _StageTimer:
+    """ConversionStats 中一次阶段计时（上下文管理器）"""
+    
+    __slots__ = ('stats', 'record', 'start', 'base_memory')
+    
+    def __init__(self, stats, record):
+        self.stats = stats
+        self.record = record
+    
+    def __enter__(self):
+        if self.stats.track_memory:
+            import tracemalloc
+            self.base_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        record = self.record
+        record['seconds'] += time.perf_counter() - self.start
+        record['calls'] += 1
+        if self.stats.track_memory:
+            import tracemalloc
+            peak = tracemalloc.get_traced_memory()[1] - self.base_memory
+            record['peak_bytes'] = max(record['peak_bytes'], peak)
+            self.stats.note_peak()
+        return False
+    
+    def add_pixels(self, count):
+        self.record['pixels'] += count
+    
+    def add_bytes(self, count):
+        self.record['bytes'] += count
+
+class _NullStage:
+    """未启用统计时使用的空阶段，所有操作均为空操作"""
+    
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+    
+    def add_pixels(self, count):
+        pass
+    
+    def add_bytes(self, count):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+class ConversionStats:
+    """单次转换的分阶段统计：耗时、像素数、写出字节数和峰值内存分配
+    
+    阶段包括 detect（文件头解析）、decode（像素解码）、quantize（格式量化）、palette（索引色调色板生成和映射）、
+    compress（压缩）、emit（文本或二进制写出）和 stream（流式转换，逐行完成解码、量化和写出）。
+    同名阶段多次执行时累加耗时、像素和字节，峰值内存取最大值。
+    track_memory 为真时通过 tracemalloc 统计峰值内存（只包含Python和numpy的分配）；
+    tracemalloc 会显著拖慢大量小对象分配的阶段（如文本写出），因此默认不开启，以免影响耗时数据。
+    
+    用法:
+        stats = ConversionStats()
+        converter.convert_file(input_file, output_file, stats=stats)
+        print(stats.format_table())
+    """
+    
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.stages = {}
+        self.input_file = None
+        self.output_file = None
+        self.success = None
+        self.message = None
+        self.total_seconds = 0.0
+        self.output_bytes = 0
+        self.peak_bytes = 0
+        self._start = None
+        self._base_memory = 0
+        self._owns_tracemalloc = False
+    
+    def stage(self, name, pixels=0):
+        """返回记录指定阶段的上下文管理器"""
+        record = self.stages.get(name)
+        if record is None:
+            record = self.stages[name] = {'name': name, 'calls': 0, 'seconds': 0.0, 'pixels': 0, 'bytes': 0,
+                                          'peak_bytes': 0}
+        record['pixels'] += pixels
+        return _StageTimer(self, record)
+    
+    def begin(self, input_file, output_file):
+        """开始一次转换的统计"""
+        self.input_file = input_file
+        self.output_file = output_file
+        if self.track_memory:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracemalloc = True
+            self._base_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+    
+    def note_peak(self):
+        """把当前的 tracemalloc 峰值计入整体峰值（阶段计时会重置峰值）"""
+        import tracemalloc
+        self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1] - self._base_memory)
+    
+    def finish(self, result, output_files=()):
+        """结束统计，记录转换结果和输出文件的总字节数"""
+        self.total_seconds = time.perf_counter() - self._start
+        if self.track_memory:
+            self.note_peak()
+            if self._owns_tracemalloc:
+                import tracemalloc
+                tracemalloc.stop()
+                self._owns_tracemalloc = False
+        if result is not None:
+            self.success, self.message = result
+        self.output_bytes = sum(os.path.getsize(path) for path in output_files if os.path.exists(path))
+    
+    def to_dict(self):
+        """返回可直接序列化为JSON的统计结果"""
+        stages = []
+        for record in self.stages.values():
+            record = dict(record)
+            seconds = record['seconds']
+            record['mpixels_per_second'] = record['pixels'] / seconds / 1e6 if seconds > 0 and record['pixels'] else None
+            if not self.track_memory:
+                record['peak_bytes'] = None
+            stages.append(record)
+        return {
+            'input_file': self.input_file,
+            'output_file': self.output_file,
+            'success': self.success,
+            'message': self.message,
+            'total_seconds': self.total_seconds,
+            'output_bytes': self.output_bytes,
+            'peak_bytes': self.peak_bytes if self.track_memory else None,
+            'stages': stages,
+        }
+    
+    def to_json(self):
+        """返回JSON格式的统计结果"""
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=1)
+    
+    def format_table(self):
+        """返回便于阅读的统计表格"""
+        lines = [f"{'阶段':<10}{'次数':>6}{'耗时(ms)':>12}{'像素':>12}{'MP/s':>9}{'写出字节':>12}{'峰值内存(KB)':>14}"]
+        for record in self.to_dict()['stages']:
+            speed = record['mpixels_per_second']
+            speed = f"{speed:.1f}" if speed is not None else '-'
+            peak = record['peak_bytes']
+            peak = f"{peak / 1024:.1f}" if peak is not None else '-'
+            lines.append(f"{record['name']:<10}{record['calls']:>6}{record['seconds'] * 1000:>12.2f}{record['pixels']:>12}"
+                         f"{speed:>9}{record['bytes']:>12}{peak:>14}")
+        peak = f"{self.peak_bytes / 1024:.1f}" if self.track_memory else '-'
+        lines.append(f"{'总计':<10}{'':>6}{self.total_seconds * 1000:>12.2f}{'':>12}{'':>9}{self.output_bytes:>12}{peak:>14}")
+        return "\n".join(lines)
+
+def rgb565_to_rgb888(values):
+    """把RGB565值（未交换字节）展开为 N×3 的8位RGB（浮点），用于颜色距离计算"""
+    values = np.asarray(values, dtype=np.uint32)
+    r = (values >> 11) & 0x1F
+    g = (values >> 5) & 0x3F
+    b = values & 0x1F
+    return np.stack([r * (255 / 31), g * (255 / 63), b * (255 / 31)], axis=-1)
+
+def rgb888_to_rgb565(rgb):
+    """把 N×3 的8位RGB（可为浮点）按 convert_pixel_to_rgb565 的公式转换为RGB565值"""
+    rgb = np.clip(np.rint(rgb), 0, 255).astype(np.uint32)
+    return (((rgb[:, 0] * 31 + 127) // 255) << 11) | (((rgb[:, 1] * 63 + 127) // 255) << 5) | \
+        ((rgb[:, 2] * 31 + 127) // 255)
+
+def nearest_palette_indices(colors, palette, block_size=8192):
+    """为每个颜色找出调色板中RGB欧氏距离最近的项，返回索引数组
+    
+    按块计算距离矩阵，|c-p|² 展开为 |c|² - 2c·p + |p|²，|c|² 不影响最小值位置故省略。
+    """
+    palette = np.asarray(palette, dtype=np.float64)
+    palette_norm = (palette ** 2).sum(axis=1)
+    result = np.empty(len(colors), dtype=np.intp)
+    for start in range(0, len(colors), block_size):
+        block = colors[start:start + block_size]
+        result[start:start + block_size] = (palette_norm - 2.0 * (block @ palette.T)).argmin(axis=1)
+    return result
+
+def median_cut(colors, weights, max_colors):
+    """加权中位切分，返回至多 max_colors 个盒子的加权平均色（K×3）
+    
+    colors 为 N×3 的互不相同的颜色，weights 为各颜色的像素数。反复选出通道跨度最大的盒子，
+    沿该通道在加权中位处一分为二，直到盒子数达到 max_colors 或所有盒子都只剩一种颜色。
+    """
+    def make_box(members):
+        box_colors = colors[members]
+        spans = box_colors.max(axis=0) - box_colors.min(axis=0)
+        axis = int(spans.argmax())
+        return spans[axis], axis, members
+    
+    boxes = [make_box(np.arange(len(colors)))]
+    while len(boxes) < max_colors:
+        index = max(range(len(boxes)), key=lambda i: boxes[i][0])
+        span, axis, members = boxes[index]
+        if span <= 0:
+            break
+        members = members[np.argsort(colors[members, axis], kind='stable')]
+        cumulative = np.cumsum(weights[members])
+        split = int(np.searchsorted(cumulative, cumulative[-1] / 2)) + 1
+        split = min(max(split, 1), len(members) - 1)
+        boxes[index] = make_box(members[:split])
+        boxes.append(make_box(members[split:]))
+    
+    return np.array([np.average(colors[members], axis=0, weights=weights[members])
+                     for _, _, members in boxes])
+
+def refine_palette(colors, weights, centers, iterations):
+    """对调色板做若干轮加权 k-means（Lloyd）迭代；没有分到颜色的中心保持不变"""
+    centers = centers.copy()
+    for _ in range(iterations):
+        labels = nearest_palette_indices(colors, centers)
+        totals = np.bincount(labels, weights=weights, minlength=len(centers))
+        sums = np.stack([np.bincount(labels, weights=weights * colors[:, channel], minlength=len(centers))
+                         for channel in range(3)], axis=1)
+        used = totals > 0
+        centers[used] = sums[used] / totals[used, None]
+    return centers
+
+def build_palette(values, max_colors, kmeans_iterations=4):
+    """为RGB565像素值（H×W，未交换字节）生成调色板，返回 (索引数组, 调色板)
+    
+    不同颜色不超过 max_colors 时调色板就是图像中出现的全部颜色，转换无损；
+    否则对出现过的颜色（加权像素数）做中位切分和 k-means 细化。
+    调色板在 RGB565 精度上去重并排序，每个出现过的RGB565值预先查好最近的调色板项，
+    构成 65536 项的查找表，像素映射只需一次查表。
+    """
+    counts = np.bincount(values.ravel(), minlength=65536)
+    used = np.flatnonzero(counts)
+    index_lut = np.zeros(65536, dtype=np.uint8)
+    if len(used) <= max_colors:
+        palette = used.astype(np.uint16)
+        index_lut[used] = np.arange(len(used))
+    else:
+        colors = rgb565_to_rgb888(used)
+        weights = counts[used].astype(np.float64)
+        centers = refine_palette(colors, weights, median_cut(colors, weights, max_colors), kmeans_iterations)
+        palette = np.unique(rgb888_to_rgb565(centers)).astype(np.uint16)
+        index_lut[used] = nearest_palette_indices(colors, rgb565_to_rgb888(palette))
+    return index_lut[values], palette
+
+def pack_indices(indices, output_format):
+    """把调色板索引（H×W uint8）打包为输出布局：INDEXED4 每字节2个像素，高4位在前，每行补齐到整字节"""
+    if output_format != 'INDEXED4':
+        return indices
+    if indices.shape[1] % 2:
+        indices = np.pad(indices, ((0, 0), (0, 1)))
+    return ((indices[:, 0::2] << 4) | indices[:, 1::2]).astype(np.uint8)
+
+def pixel_values_to_bytes(values, output_format='RGB565'):
+    """将转换后的像素值打包为与C数组内存布局一致的字节（见 BMPConverter.pixel_values_to_bytes）"""
+    if output_format == 'RGB565':
+        return values.astype('<u2', copy=False).tobytes()
+    if output_format == 'RGB565_8BIT':
+        return values.astype('>u2', copy=False).tobytes()
+    return values.astype(np.uint8, copy=False).tobytes()
+
+class ConvertedImage:
+    """内存中的转换结果（由 BMPConverter.convert_image 返回）
+    
+    values 为 H×W 的像素值数组（RGB565/RGB565_8BIT 为 uint16，其余为 uint8），
+    data 为其零拷贝的 memoryview；to_bytes() 返回与C数组内存布局一致的字节。
+    索引色格式的 values 为未打包的调色板索引，palette 为调色板（按字节顺序处理后的RGB565值），
+    其他格式的 palette 为None。
+    """
+    
+    def __init__(self, values, bmp_info, output_format, byte_order, crop=None, palette=None):
+        self.values = values
+        self.output_format = output_format
+        self.byte_order = byte_order
+        self.crop = crop
+        self.palette = palette
+        self.bmp_info = bmp_info
+        self.height, self.width = values.shape
+        self.bpp = bmp_info['bpp']
+    
+    @property
+    def data(self):
+        """像素值的零拷贝缓冲区（本机字节序，形状与 values 相同）"""
+        return memoryview(self.values)
+    
+    def packed_values(self):
+        """按输出布局打包的像素值（只有 INDEXED4 与 values 不同）"""
+        return pack_indices(self.values, self.output_format)
+    
+    def to_bytes(self):
+        """与C数组内存布局一致的像素字节，同 .bin 输出的内容；索引色格式为打包后的索引"""
+        return pixel_values_to_bytes(self.packed_values(), self.output_format)
+    
+    def metadata(self):
+        """返回描述转换结果的字典"""
+        return {
+            'width': self.width,
+            'height': self.height,
+            'output_format': self.output_format,
+            'byte_order': self.byte_order,
+            'dtype': self.values.dtype.name,
+            'crop': self.crop,
+            'palette_size': None if self.palette is None else len(self.palette),
+            'source_width': self.bmp_info['width'],
+            'source_height': self.bmp_info['height'],
+            'source_bpp': self.bpp,
+            'source_compression': self.bmp_info['compression'],
+        }
+
 class BMPConverter:
     def __init__(self):
-        self.supported_formats = [8, 16, 24, 32]
-        self.output_formats = ['RGB565', 'RGB332', 'GRAY8', 'RGB565_8BIT']
+        self.supported_formats = [1, 4, 8, 16, 24, 32]
+        self.output_formats = ['RGB565', 'RGB332', 'GRAY8', 'RGB565_8BIT', 'INDEXED8', 'INDEXED4']
+        # 各输出格式的通道查找表缓存，键为 (output_format, byte_order)
+        self._lut_cache = {}
+        # 整幅转换时每次格式化并写出的像素数
+        self.emit_block_pixels = 1 << 16
+        # GRAY8 按浮点公式分块计算时每块的像素数（限制 float64 临时数组的大小）
+        self.gray_block_pixels = 1 << 18
+        # 当前转换的分阶段统计（ConversionStats），为None时不做任何统计
+        self.stats = None
+        # 指定多个进程时，像素数达到该值的图像才按条带并行格式化（进程启动和数据传递有固定开销）
+        self.parallel_min_pixels = 4 * 1000 * 1000
+        # 并行格式化时每个进程分到的条带数（多分几条便于负载均衡和报告进度）
+        self.bands_per_job = 4
+        # 索引色格式在中位切分之后做的 k-means 细化轮数
+        self.kmeans_iterations = 4
+    
+    def _stage(self, name, pixels=0):
+        """返回阶段统计的上下文管理器；未启用统计时返回空操作的共享对象"""
+        if self.stats is None:
+            return _NULL_STAGE
+        return self.stats.stage(name, pixels)
         
     def detect_bmp_format(self, file_path):
         """自动检测BMP文件格式"""
-        try:
-            with open(file_path, 'rb') as f:
-                # 读取BMP文件头
-                bmp_header = f.read(14)
-                if bmp_header[0:2] != b'BM':
-                    return None, "不是有效的BMP文件"
-                
-                # 读取DIB头
-                dib_header = f.read(40)
-                width, height = struct.unpack('<II', dib_header[4:12])
-                bpp = struct.unpack('<H', dib_header[14:16])[0]
-                compression = struct.unpack('<I', dib_header[16:20])[0]
-                
-                info = {
-                    'width': width,
-                    'height': height,
-                    'bpp': bpp,
-                    'compression': compression,
-                    'file_size': os.path.getsize(file_path)
-                }
-                
-                return info, None
-        except Exception as e:
-            return None, f"读取文件错误: {str(e)}"
+        with self._stage('detect'):
+            try:
+                with _open_source(file_path) as f:
+                    # 读取BMP文件头
+                    bmp_header = f.read(14)
+                    if bmp_header[0:2] != b'BM':
+                        return None, "不是有效的BMP文件"
+                    
+                    # 读取DIB头
+                    dib_header = f.read(40)
+                    dib_size = struct.unpack('<I', dib_header[0:4])[0]
+                    # 宽高为有符号数，高度为负表示自上而下存储
+                    width, height = struct.unpack('<ii', dib_header[4:12])
+                    bpp = struct.unpack('<H', dib_header[14:16])[0]
+                    compression = struct.unpack('<I', dib_header[16:20])[0]
+                    colors_used = struct.unpack('<I', dib_header[32:36])[0]
+                    data_offset = struct.unpack('<I', bmp_header[10:14])[0]
+                    
+                    # 索引色图像的调色板项数，biClrUsed 为0时取 2^bpp
+                    if bpp <= 8 and colors_used == 0:
+                        colors_used = 1 << bpp
+                    
+                    # BI_BITFIELDS 的 R、G、B 掩码：40字节信息头时紧跟在头后，
+                    # V2～V5 信息头时位于头内相同的位置，文件偏移都是 14 + 40
+                    masks = None
+                    if compression == 3 and dib_size >= 40:
+                        mask_data = f.read(12)
+                        if len(mask_data) == 12:
+                            masks = struct.unpack('<III', mask_data)
+                    
+                    info = {
+                        'width': width,
+                        'height': abs(height),
+                        'bpp': bpp,
+                        'compression': compression,
+                        'top_down': height < 0,
+                        'dib_size': dib_size,
+                        'colors_used': colors_used,
+                        'masks': masks,
+                        'data_offset': data_offset,
+                        # 每行字节数按4字节对齐
+                        'row_size': ((width * bpp + 31) // 32) * 4,
+                        'file_size': _source_size(file_path)
+                    }
+                    
+                    return info, None
+            except Exception as e:
+                return None, f"读取文件错误: {str(e)}"
     
     def convert_pixel_to_rgb565(self, r, g, b, byte_order='little'):
         """将RGB像素转换为RGB565格式"""
@@ -67,28 +1056,104 @@ class BMPConverter:
         gray = int(0.299 * r + 0.587 * g + 0.114 * b)
         return min(255, max(0, gray))
     
-    def read_bmp_pixels(self, file_path, bmp_info):
-        """读取BMP像素数据，支持多种格式"""
-        width = bmp_info['width']
-        height = bmp_info['height']
-        bpp = bmp_info['bpp']
+    def _get_channel_luts(self, output_format, byte_order='little'):
+        """获取各通道的查找表（按格式和字节顺序缓存）
         
-        pixels = []
+        每张表只有256项，由上面的逐像素函数按相同公式生成，
+        因此整幅图像查表的结果与逐像素转换逐字节一致。
+        """
+        key = (output_format, byte_order)
+        luts = self._lut_cache.get(key)
+        if luts is not None:
+            return luts
+        
+        levels = np.arange(256, dtype=np.uint32)
+        if output_format in ('RGB565', 'RGB565_8BIT'):
+            lut_r = ((levels * 31 + 127) // 255) << 11
+            lut_g = ((levels * 63 + 127) // 255) << 5
+            lut_b = (levels * 31 + 127) // 255
+            luts = [lut_r, lut_g, lut_b]
+            if byte_order == 'big':
+                # 字节交换对按位或满足分配律，可以直接交换每张通道表
+                luts = [((lut & 0xFF) << 8) | (lut >> 8) for lut in luts]
+            luts = tuple(lut.astype(np.uint16) for lut in luts)
+        elif output_format == 'RGB332':
+            lut_r = ((levels * 7 + 127) // 255) << 5
+            lut_g = ((levels * 7 + 127) // 255) << 2
+            lut_b = (levels * 3 + 127) // 255
+            luts = tuple(lut.astype(np.uint8) for lut in (lut_r, lut_g, lut_b))
+        elif output_format == 'GRAY8':
+            # 保持与逐像素函数相同的浮点乘法和加法顺序
+            levels = levels.astype(np.float64)
+            luts = (0.299 * levels, 0.587 * levels, 0.114 * levels)
+        else:
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        
+        self._lut_cache[key] = luts
+        return luts
+    
+    def convert_pixels_vectorized(self, rgb, output_format='RGB565', byte_order='little'):
+        """整幅图像一次性转换为目标格式
+        
+        rgb 为 H×W×3 的 uint8 数组（或可转换为该形状的数据），返回 H×W 的
+        像素值数组：RGB565/RGB565_8BIT 为 uint16，RGB332/GRAY8 为 uint8。
+        结果与 convert_pixel_to_* 逐像素函数完全一致。
+        """
+        rgb = np.asarray(rgb, dtype=np.uint8)
+        if rgb.ndim != 3 or rgb.shape[2] < 3:
+            raise ValueError(f"像素数据形状无效: {rgb.shape}")
+        
+        lut_r, lut_g, lut_b = self._get_channel_luts(output_format, byte_order)
+        r = rgb[:, :, 0]
+        g = rgb[:, :, 1]
+        b = rgb[:, :, 2]
+        
+        if output_format == 'GRAY8':
+            # 浮点临时数组每像素8字节，整幅计算时4K图像需要数百MB，按行分块后只占一块的大小
+            height, width = r.shape
+            gray = np.empty((height, width), dtype=np.uint8)
+            rows = max(1, self.gray_block_pixels // max(1, width))
+            for y in range(0, height, rows):
+                block = lut_r[r[y:y + rows]] + lut_g[g[y:y + rows]]
+                block += lut_b[b[y:y + rows]]
+                np.clip(block, 0, 255, out=block)
+                gray[y:y + rows] = block
+            return gray
+        
+        values = lut_r[r]
+        values |= lut_g[g]
+        values |= lut_b[b]
+        return values
+    
+    def quantize_to_palette(self, values, output_format='INDEXED8', byte_order='little'):
+        """把RGB565像素值（未交换字节）量化为索引色，返回 (索引数组, 调色板)
+        
+        调色板最多 INDEXED_FORMATS[output_format] 色，big 字节顺序时调色板项交换高低字节。
+        """
+        with self._stage('palette', values.size):
+            indices, palette = build_palette(values, INDEXED_FORMATS[output_format], self.kmeans_iterations)
+            if byte_order == 'big':
+                palette = ((palette & 0xFF) << 8) | (palette >> 8)
+        return indices, palette
+    
+    def read_bmp_pixels(self, file_path, bmp_info):
+        """读取BMP像素数据，支持多种格式
         
+        返回 H×W×3 的 uint8 连续数组（RGB顺序），由整幅图像一次性取出，
+        不再逐像素构造 (r, g, b) 元组。
+        """
         try:
             # 使用PIL库来处理复杂的BMP格式
-            with Image.open(file_path) as img:
+            from PIL import Image
+            with _open_source(file_path) as f, Image.open(f) as img:
                 # 转换为RGB模式
                 if img.mode != 'RGB':
                     img = img.convert('RGB')
                 
-                # 获取像素数据
-                for y in range(height):
-                    row = []
-                    for x in range(width):
-                        r, g, b = img.getpixel((x, y))
-                        row.append((r, g, b))
-                    pixels.append(row)
+                # 一次性获取整幅图像的像素缓冲区
+                width, height = img.size
+                pixels = np.frombuffer(img.tobytes(), dtype=np.uint8)
+                pixels = pixels.reshape(height, width, 3)
                 
                 return pixels, None
                 
@@ -96,62 +1161,611 @@ class BMPConverter:
             # 如果PIL失败，尝试手动解析
             return self.read_bmp_manually(file_path, bmp_info)
     
+    def _decode_bmp_rows(self, raw, bpp, width, masks=None):
+        """将若干行原始BMP数据（n×行字节数的uint8数组）解码为 n×W×3 的RGB数组（16/24/32位）
+        
+        masks 为 BI_BITFIELDS 的 (R, G, B) 掩码，为None时使用默认布局（16位 X1R5G5B5，32位 BGRA）。
+        """
+        rows = raw.shape[0]
+        if masks is not None and bpp in (16, 32):
+            return self._decode_bitfield_rows(raw, bpp, width, masks)
+        if bpp == 24:
+            # 24位BMP: BGR顺序
+            pixels = raw[:, :width * 3].reshape(rows, width, 3)[:, :, ::-1]
+        elif bpp == 32:
+            # 32位BMP: BGRA顺序
+            pixels = raw[:, :width * 4].reshape(rows, width, 4)[:, :, 2::-1]
+        elif bpp == 16:
+            # 16位BMP: 通常是RGB555或RGB565，这里假设是RGB555格式
+            data = np.ascontiguousarray(raw[:, :width * 2]).view('<u2').astype(np.uint32)
+            pixels = np.empty((rows, width, 3), dtype=np.uint8)
+            pixels[:, :, 0] = ((data >> 10) & 0x1F) * 255 // 31
+            pixels[:, :, 1] = ((data >> 5) & 0x1F) * 255 // 31
+            pixels[:, :, 2] = (data & 0x1F) * 255 // 31
+        else:
+            raise ValueError(f"不支持的位深度: {bpp}")
+        return np.ascontiguousarray(pixels)
+    
+    def _decode_bitfield_rows(self, raw, bpp, width, masks):
+        """按位域掩码解码16/32位像素，各通道按 值*255//最大值 扩展到8位（与Pillow一致）"""
+        rows = raw.shape[0]
+        dtype = '<u2' if bpp == 16 else '<u4'
+        data = np.ascontiguousarray(raw[:, :width * (bpp // 8)]).view(dtype).astype(np.uint64)
+        pixels = np.zeros((rows, width, 3), dtype=np.uint8)
+        for channel, mask in enumerate(masks):
+            if mask == 0:
+                continue
+            shift = (mask & -mask).bit_length() - 1
+            pixels[:, :, channel] = ((data & mask) >> shift) * 255 // (mask >> shift)
+        return pixels
+    
+    def _decode_index_rows(self, raw, bpp, width):
+        """将若干行原始索引数据解包为 n×W 的调色板索引数组（1/4/8位）"""
+        if bpp == 8:
+            indices = raw[:, :width]
+        elif bpp == 4:
+            # 高4位在前
+            indices = np.empty((raw.shape[0], raw.shape[1] * 2), dtype=np.uint8)
+            indices[:, 0::2] = raw >> 4
+            indices[:, 1::2] = raw & 0x0F
+            indices = indices[:, :width]
+        elif bpp == 1:
+            # 最高位在前
+            indices = np.unpackbits(raw, axis=1)[:, :width]
+        else:
+            raise ValueError(f"不支持的位深度: {bpp}")
+        return np.ascontiguousarray(indices)
+    
+    def _decode_rle(self, data, bmp_info):
+        """解码RLE8/RLE4压缩的像素数据，返回显示顺序的 H×W 索引数组
+        
+        按游程整段填充，而不是逐像素处理。位图结束标记之后未写到的像素为索引0；
+        数据在填满图像之前中断时抛出 ValueError（与Pillow一样视为不完整）。
+        """
+        width = bmp_info['width']
+        height = bmp_info['height']
+        rle4 = bmp_info['compression'] == 2
+        indices = np.zeros((height, width), dtype=np.uint8)
+        
+        x = y = pos = 0
+        size = len(data)
+        finished = False
+        while pos + 1 < size and y < height:
+            count, value = data[pos], data[pos + 1]
+            pos += 2
+            if count > 0:
+                # 编码模式：重复 count 个像素
+                end = min(x + count, width)
+                if x < end:
+                    if rle4:
+                        run = np.resize(np.array([value >> 4, value & 0x0F], dtype=np.uint8), count)
+                        indices[y, x:end] = run[:end - x]
+                    else:
+                        indices[y, x:end] = value
+                x += count
+            elif value == 0:
+                # 行结束
+                x = 0
+                y += 1
+            elif value == 1:
+                # 位图结束
+                finished = True
+                break
+            elif value == 2:
+                # 位移：向右 dx、向上 dy（文件中的行方向）
+                if pos + 2 > size:
+                    break
+                x += data[pos]
+                y += data[pos + 1]
+                pos += 2
+            else:
+                # 绝对模式：后面跟随 value 个未压缩的像素，按字（2字节）对齐
+                byte_count = (value + 1) // 2 if rle4 else value
+                if pos + byte_count > size:
+                    break
+                run = np.frombuffer(data, dtype=np.uint8, count=byte_count, offset=pos)
+                if rle4:
+                    packed = run
+                    run = np.empty(byte_count * 2, dtype=np.uint8)
+                    run[0::2] = packed >> 4
+                    run[1::2] = packed & 0x0F
+                    run = run[:value]
+                end = min(x + value, width)
+                if x < end:
+                    indices[y, x:end] = run[:end - x]
+                x += value
+                pos += byte_count + (byte_count & 1)
+        
+        # 没有遇到位图结束标记时，数据必须已经覆盖到最后一行末尾
+        if not finished and (y < height - 1 or (y == height - 1 and x < width)):
+            raise ValueError("RLE数据不完整")
+        
+        # RLE位图总是从下到上存储
+        return indices[::-1]
+    
+    def _read_palette(self, f, bmp_info):
+        """读取颜色表，返回 N×3 的RGB数组"""
+        f.seek(14 + bmp_info['dib_size'])
+        count = bmp_info['colors_used']
+        data = f.read(count * 4)
+        if len(data) < count * 4:
+            raise ValueError("调色板数据不完整")
+        # 颜色表每项为 BGRx 四字节
+        return np.ascontiguousarray(np.frombuffer(data, dtype=np.uint8).reshape(count, 4)[:, 2::-1])
+    
+    def _check_manual_support(self, bmp_info):
+        """检查手动解析器是否支持该BMP，返回错误信息或None"""
+        bpp = bmp_info['bpp']
+        compression = bmp_info['compression']
+        if bpp not in self.supported_formats:
+            return f"不支持的位深度: {bpp}"
+        # 0: BI_RGB，3: BI_BITFIELDS（按信息头中的掩码解码），1: RLE8，2: RLE4
+        if compression == 3 and bmp_info.get('masks') is None:
+            return "缺少位域掩码"
+        if compression in (0, 3):
+            return None
+        if (compression == 1 and bpp == 8) or (compression == 2 and bpp == 4):
+            return None
+        return f"不支持的压缩方式: {compression}"
+    
+    def _prefers_manual_decoder(self, bmp_info):
+        """判断是否直接使用NumPy解码器（结果与Pillow逐像素一致）
+        
+        要求标准信息头（不小于40字节，OS/2 的12字节头字段布局不同）。
+        BI_BITFIELDS 按信息头中的掩码解码，与Pillow的换算（value * 255 // max）相同。
+        """
+        return bmp_info['dib_size'] >= 40 and self._check_manual_support(bmp_info) is None
+    
+    def _check_streaming_support(self, bmp_info):
+        """流式读取要求行数据可以随机访问，因此不支持RLE压缩"""
+        error = self._check_manual_support(bmp_info)
+        if error is None and bmp_info['compression'] in (1, 2):
+            error = "RLE压缩的BMP不支持流式读取"
+        return error
+    
+    def read_bmp_indexed(self, file_path, bmp_info):
+        """手动解析索引色BMP（1/4/8位，含RLE4/RLE8），返回 ((索引数组, 调色板), 错误信息)
+        
+        索引数组为显示顺序的 H×W uint8，调色板为 N×3 的RGB数组。
+        """
+        width = bmp_info['width']
+        height = bmp_info['height']
+        bpp = bmp_info['bpp']
+        row_size = bmp_info['row_size']
+        
+        if bpp > 8:
+            return None, f"不是索引色图像: {bpp}位"
+        error = self._check_manual_support(bmp_info)
+        if error:
+            return None, error
+        
+        try:
+            with _open_source(file_path) as f:
+                palette = self._read_palette(f, bmp_info)
+                f.seek(bmp_info['data_offset'])
+                if bmp_info['compression'] in (1, 2):
+                    indices = self._decode_rle(f.read(), bmp_info)
+                    return (indices, palette), None
+                
+                data = f.read(row_size * height)
+                if len(data) < row_size * height:
+                    return None, "像素数据不完整"
+            
+            raw = np.frombuffer(data, dtype=np.uint8).reshape(height, row_size)
+            if not bmp_info['top_down']:
+                raw = raw[::-1]
+            return (self._decode_index_rows(raw, bpp, width), palette), None
+            
+        except Exception as e:
+            return None, f"手动解析失败: {str(e)}"
+    
+    def convert_palette_to_lut(self, palette, output_format='RGB565', byte_order='little'):
+        """把调色板一次性转换为 256 项的输出值查找表
+        
+        每幅图像最多只做256次颜色转换，超出调色板的索引映射为0。
+        """
+        values = self.convert_pixels_vectorized(palette.reshape(1, -1, 3), output_format, byte_order)[0]
+        lut = np.zeros(256, dtype=values.dtype)
+        count = min(len(values), 256)
+        lut[:count] = values[:count]
+        return lut
+    
     def read_bmp_manually(self, file_path, bmp_info):
         """手动解析BMP文件"""
         width = bmp_info['width']
         height = bmp_info['height']
         bpp = bmp_info['bpp']
+        row_size = bmp_info['row_size']
+        
+        error = self._check_manual_support(bmp_info)
+        if error:
+            return None, error
+        
+        if bpp <= 8:
+            # 索引色图像：通过调色板查表得到RGB
+            result, error = self.read_bmp_indexed(file_path, bmp_info)
+            if error:
+                return None, error
+            indices, palette = result
+            full_palette = np.zeros((256, 3), dtype=np.uint8)
+            full_palette[:min(len(palette), 256)] = palette[:256]
+            return full_palette[indices], None
         
         try:
-            with open(file_path, 'rb') as f:
-                # 跳过文件头和DIB头
-                f.seek(54)
+            with _open_source(file_path) as f:
+                # 直接定位到像素数据（bfOffBits），一次读出全部行
+                f.seek(bmp_info['data_offset'])
+                data = f.read(row_size * height)
+                if len(data) < row_size * height:
+                    return None, "像素数据不完整"
+            
+            raw = np.frombuffer(data, dtype=np.uint8).reshape(height, row_size)
+            # BMP默认从下到上存储，需要反转；高度为负时已是显示顺序
+            if not bmp_info['top_down']:
+                raw = raw[::-1]
+            
+            pixels = self._decode_bmp_rows(raw, bpp, width, bmp_info.get('masks'))
+            return pixels, None
                 
-                # 计算每行字节数
+        except Exception as e:
+            return None, f"手动解析失败: {str(e)}"
+    
+    def read_bmp_values(self, file_path, bmp_info, output_format='RGB565', byte_order='little', crop=None):
+        """读取BMP并转换为输出格式的像素值数组（H×W），返回 (数组, 错误信息)
+        
+        索引色图像优先由手动解析器读取索引，再通过调色板查找表映射；
+        其他图像（或手动解析失败时）读取RGB后整幅量化。
+        crop 为 (x, y, 宽, 高) 时只返回该区域，未压缩的BMP只读取和解码所需的扫描行。
+        """
+        if crop is not None:
+            error = self._check_crop(bmp_info, crop)
+            if error:
+                return None, error
+            if not self._check_streaming_support(bmp_info):
+                try:
+                    return self._read_region_values(file_path, bmp_info, crop, output_format, byte_order), None
+                except Exception as e:
+                    return None, f"读取区域失败: {str(e)}"
+            # 压缩的BMP无法按行定位，整幅解码后再裁剪
+            values, error = self.read_bmp_values(file_path, bmp_info, output_format, byte_order)
+            if error:
+                return None, error
+            x, y, width, height = crop
+            return np.ascontiguousarray(values[y:y + height, x:x + width]), None
+        
+        pixel_count = bmp_info['width'] * bmp_info['height']
+        if bmp_info['bpp'] <= 8:
+            with self._stage('decode', pixel_count):
+                result, error = self.read_bmp_indexed(file_path, bmp_info)
+            if not error:
+                indices, palette = result
+                with self._stage('quantize', pixel_count):
+                    lut = self.convert_palette_to_lut(palette, output_format, byte_order)
+                    values = lut[indices]
+                return values, None
+        
+        with self._stage('decode', pixel_count):
+            # NumPy解码器能得到与Pillow相同结果的文件不加载Pillow
+            if self._prefers_manual_decoder(bmp_info):
+                pixels, error = self.read_bmp_manually(file_path, bmp_info)
+                if error:
+                    pixels, error = self.read_bmp_pixels(file_path, bmp_info)
+            else:
+                pixels, error = self.read_bmp_pixels(file_path, bmp_info)
+        if error:
+            return None, error
+        with self._stage('quantize', pixel_count):
+            values = self.convert_pixels_vectorized(pixels, output_format, byte_order)
+        return values, None
+    
+    def _check_crop(self, bmp_info, crop):
+        """检查裁剪区域是否在图像范围内，返回错误信息或None"""
+        x, y, width, height = crop
+        if width < 1 or height < 1 or x < 0 or y < 0:
+            return f"裁剪区域无效: {x},{y},{width},{height}"
+        if x + width > bmp_info['width'] or y + height > bmp_info['height']:
+            return f"裁剪区域超出图像范围（{bmp_info['width']}×{bmp_info['height']}）: {x},{y},{width},{height}"
+        return None
+    
+    def _read_region_values(self, file_path, bmp_info, crop, output_format='RGB565', byte_order='little'):
+        """按 bfOffBits 和行跨度直接定位，只读取并解码区域所在的扫描行"""
+        x, y, width, height = crop
+        bpp = bmp_info['bpp']
+        row_size = bmp_info['row_size']
+        
+        # 区域在文件中对应一段连续的行：自下而上存储时行号需要翻转
+        if bmp_info['top_down']:
+            first_row = y
+        else:
+            first_row = bmp_info['height'] - (y + height)
+        
+        with self._stage('decode', width * height):
+            with _open_source(file_path) as f:
+                palette = self._read_palette(f, bmp_info) if bpp <= 8 else None
+                f.seek(bmp_info['data_offset'] + first_row * row_size)
+                data = f.read(height * row_size)
+            if len(data) < height * row_size:
+                raise ValueError("像素数据不完整")
+            
+            raw = np.frombuffer(data, dtype=np.uint8).reshape(height, row_size)
+            if not bmp_info['top_down']:
+                raw = raw[::-1]
+            
+            if bpp <= 8:
+                # 不足一字节的像素先解包整行，再截取所需的列
+                indices = self._decode_index_rows(raw, bpp, x + width)[:, x:]
+            else:
                 bytes_per_pixel = bpp // 8
-                row_size = (width * bytes_per_pixel + 3) & ~3
-                padding = row_size - width * bytes_per_pixel
-                
-                pixels = []
-                
-                for y in range(height):
-                    row = []
-                    for x in range(width):
-                        if bpp == 24:
-                            # 24位BMP: BGR顺序
-                            b, g, r = struct.unpack('BBB', f.read(3))
-                        elif bpp == 32:
-                            # 32位BMP: BGRA顺序
-                            b, g, r, a = struct.unpack('BBBB', f.read(4))
-                        elif bpp == 16:
-                            # 16位BMP: 通常是RGB555或RGB565
-                            pixel_data = struct.unpack('<H', f.read(2))[0]
-                            # 假设是RGB555格式
-                            r = ((pixel_data >> 10) & 0x1F) * 255 // 31
-                            g = ((pixel_data >> 5) & 0x1F) * 255 // 31
-                            b = (pixel_data & 0x1F) * 255 // 31
-                        elif bpp == 8:
-                            # 8位BMP需要调色板，这里简化处理
-                            gray = struct.unpack('B', f.read(1))[0]
-                            r = g = b = gray
-                        else:
-                            return None, f"不支持的位深度: {bpp}"
-                        
-                        row.append((r, g, b))
-                    
-                    # 跳过填充字节
-                    f.read(padding)
-                    # BMP从下到上存储，需要反转
-                    pixels.insert(0, row)
+                raw = raw[:, x * bytes_per_pixel:(x + width) * bytes_per_pixel]
+                pixels = self._decode_bmp_rows(raw, bpp, width, bmp_info.get('masks'))
+        
+        with self._stage('quantize', width * height):
+            if bpp <= 8:
+                return self.convert_palette_to_lut(palette, output_format, byte_order)[indices]
+            return self.convert_pixels_vectorized(pixels, output_format, byte_order)
+    
+    def iter_bmp_rows(self, file_path, bmp_info, palette_lut=None):
+        """按显示顺序逐行产出像素（1×W×3 数组）
+        
+        使用内存映射读取文件（内存中的BMP直接切片），行跨度和填充只计算一次，
+        任一时刻只持有一行数据，内存占用与图像高度无关。
+        索引色图像需要传入 palette_lut（256项查找表），此时产出经查表得到的 1×W 数组。
+        """
+        width = bmp_info['width']
+        height = bmp_info['height']
+        bpp = bmp_info['bpp']
+        row_size = bmp_info['row_size']
+        data_offset = bmp_info['data_offset']
+        top_down = bmp_info['top_down']
+        masks = bmp_info.get('masks')
+        
+        with _map_source(file_path) as mm:
+            if data_offset + row_size * height > len(mm):
+                raise ValueError("像素数据不完整")
+            
+            for y in range(height):
+                src_y = y if top_down else height - 1 - y
+                start = data_offset + src_y * row_size
+                # 对内存映射切片会复制这一行，避免在关闭映射时仍有缓冲区引用
+                raw = np.frombuffer(mm[start:start + row_size], dtype=np.uint8).reshape(1, row_size)
+                if bpp <= 8:
+                    yield palette_lut[self._decode_index_rows(raw, bpp, width)]
+                else:
+                    yield self._decode_bmp_rows(raw, bpp, width, masks)
+    
+    def iter_bmp_value_rows(self, file_path, bmp_info, output_format='RGB565', byte_order='little'):
+        """按显示顺序逐行产出已转换的像素值（1×W 数组），用于流式转换"""
+        if bmp_info['bpp'] <= 8:
+            with _open_source(file_path) as f:
+                palette = self._read_palette(f, bmp_info)
+            lut = self.convert_palette_to_lut(palette, output_format, byte_order)
+            yield from self.iter_bmp_rows(file_path, bmp_info, lut)
+        else:
+            for rgb_row in self.iter_bmp_rows(file_path, bmp_info):
+                yield self.convert_pixels_vectorized(rgb_row, output_format, byte_order)
+    
+    def convert_image(self, source, output_format='RGB565', byte_order='little', crop=None, progress_callback=None):
+        """在内存中转换BMP，返回 (ConvertedImage, 错误信息)，不写任何文件
+        
+        source 可以是文件路径、bytes/bytearray/memoryview，或二进制文件对象（读取全部内容，不关闭）。
+        crop 为 (x, y, 宽, 高) 时只转换该区域。
+        """
+        try:
+            source = read_bmp_source(source)
+        except (TypeError, OSError) as e:
+            return None, f"读取文件错误: {str(e)}"
+        
+        bmp_info, error = self.detect_bmp_format(source)
+        if error:
+            return None, error
+        
+        if progress_callback:
+            progress_callback(f"检测到 {bmp_info['width']}×{bmp_info['height']} {bmp_info['bpp']}位 BMP文件，"
+                              f"输出格式: {output_format}")
+        
+        if output_format in INDEXED_FORMATS:
+            # 先得到RGB565值，调色板在RGB565精度上生成
+            values, error = self.read_bmp_values(source, bmp_info, 'RGB565', 'little', crop)
+            if error:
+                return None, error
+            values, palette = self.quantize_to_palette(values, output_format, byte_order)
+            return ConvertedImage(values, bmp_info, output_format, byte_order, crop, palette), None
+        
+        values, error = self.read_bmp_values(source, bmp_info, output_format, byte_order, crop)
+        if error:
+            return None, error
+        return ConvertedImage(values, bmp_info, output_format, byte_order, crop), None
+    
+    def iter_array_chunks(self, image, values_per_line=None, hex_prefix=None, array_name=None, progress_callback=None,
+                          jobs=1):
+        """逐块产出 ConvertedImage 的C数组文本（头部、若干行块、结尾），可写入任意文本输出
+        
+        拼接所有块即得到 convert_bmp_to_array 写出的文件内容。
+        jobs 大于1且像素数不少于 parallel_min_pixels 时，按水平条带在多个进程中并行格式化，
+        输出与单进程完全一致。索引色格式的头部包含调色板数组。
+        """
+        values = image.packed_values()
+        height, width = values.shape
+        emitter = CArrayEmitter(image.output_format, image.byte_order, values_per_line, hex_prefix, array_name)
+        header = io.StringIO()
+        emitter.write_header(header, image.width, image.height, image.bpp, image.palette)
+        yield header.getvalue()
+        
+        if jobs > 1 and values.size >= self.parallel_min_pixels:
+            emitter_options = {
+                'output_format': image.output_format,
+                'byte_order': image.byte_order,
+                'values_per_line': values_per_line,
+                'hex_prefix': hex_prefix,
+                'array_name': array_name,
+            }
+            yield from self._iter_rows_parallel(emitter_options, values, jobs, progress_callback)
+        else:
+            # 按行块批量格式化
+            rows_per_block = max(1, self.emit_block_pixels // max(1, width))
+            last_progress = -1
+            for y in range(0, height, rows_per_block):
+                block_end = min(y + rows_per_block, height)
+                yield emitter.format_rows(values[y:block_end], block_end == height)
                 
-                return pixels, None
+                if progress_callback:
+                    progress = int((block_end / height) * 100)
+                    if progress != last_progress:
+                        last_progress = progress
+                        progress_callback(ProgressMessage(progress))
+        
+        yield "};\n"
+    
+    def convert_bmp_to_array(self, input_file, output_file, output_format='RGB565', byte_order='little', progress_callback=None,
+                             values_per_line=None, hex_prefix=None, array_name=None, crop=None, jobs=1):
+        """将BMP文件转换为指定格式的数组
+        
+        values_per_line、hex_prefix（'0x'/'0X'）和 array_name 用于配置输出的数组文本，
+        缺省时保持原有格式。crop 为 (x, y, 宽, 高) 时只转换该区域。
+        jobs 为并行格式化使用的进程数（见 iter_array_chunks）。
+        由 convert_image 和 iter_array_chunks 组合而成，只负责写出文件。
+        """
+        image, error = self.convert_image(input_file, output_format, byte_order, crop, progress_callback)
+        if error:
+            return False, error
+        
+        if progress_callback:
+            progress_callback("开始写出像素数据...")
+        
+        # 写入输出文件
+        try:
+            with self._stage('emit', image.values.size) as stage, \
+                    atomic_output(output_file, 'w', encoding='utf-8', buffering=1 << 20) as out_f:
+                for chunk in self.iter_array_chunks(image, values_per_line, hex_prefix, array_name, progress_callback,
+                                                    jobs):
+                    out_f.write(chunk)
+                stage.add_bytes(out_f.tell())
+            
+            if progress_callback:
+                progress_callback("转换完成！")
+            
+            return True, f"成功转换 {image.width}×{image.height} 图像到 {output_file}"
+            
+        except ConversionCancelled:
+            return False, "转换已取消"
+        except Exception as e:
+            return False, f"写入文件错误: {str(e)}"
+    
+    def _iter_rows_parallel(self, emitter_options, values, jobs, progress_callback=None):
+        """把像素值放入共享内存，按水平条带分给多个进程格式化，再按条带顺序产出文本
+        
+        每个图像行的文本只取决于该行的像素值，条带边界又与图像行对齐，
+        因此拼接结果与单进程逐块格式化完全一致。
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        from multiprocessing import shared_memory
+        
+        height, width = values.shape
+        bands = max(1, min(height, jobs * self.bands_per_job))
+        band_rows = -(-height // bands)
+        rows_per_block = max(1, self.emit_block_pixels // max(1, width))
+        
+        shm = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+        try:
+            shared = np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)
+            shared[:] = values
+            tasks = []
+            for start_row in range(0, height, band_rows):
+                end_row = min(start_row + band_rows, height)
+                tasks.append((shm.name, values.shape, values.dtype.str, start_row, end_row, emitter_options,
+                              rows_per_block, end_row == height))
+            
+            executor = ProcessPoolExecutor(max_workers=min(jobs, len(tasks)))
+            try:
+                futures = [executor.submit(_format_band_task, task) for task in tasks]
+                for index, future in enumerate(futures):
+                    yield future.result()
+                    if progress_callback:
+                        progress_callback(ProgressMessage(int((index + 1) / len(futures) * 100)))
+            finally:
+                # 取消、出错或提前停止迭代时不再启动尚未开始的条带
+                executor.shutdown(wait=True, cancel_futures=True)
+            del shared
+        finally:
+            shm.close()
+            shm.unlink()
+    
+    def pixel_values_to_bytes(self, values, output_format='RGB565'):
+        """将转换后的像素值打包为与C数组内存布局一致的字节
+        
+        RGB565 按 uint16_t 小端存储（目标MCU为小端），RGB565_8BIT 按数组中的
+        高字节在前顺序存储，8位格式直接输出。
+        """
+        return pixel_values_to_bytes(values, output_format)
+    
+    def convert_bmp_to_binary(self, input_file, output_file, output_format='RGB565', byte_order='little', progress_callback=None,
+                              array_name=None, streaming=False, crop=None):
+        """将BMP文件转换为二进制像素数据（.bin）和精简头文件
+        
+        output_file 为头文件路径，像素数据写入同名的 .bin 文件，内容与数组输出的
+        内存布局逐字节一致。头文件保留相同的数组符号，以 extern 声明。
+        crop 为 (x, y, 宽, 高) 时只转换该区域。
+        """
+        error = indexed_format_error(output_format, "二进制输出")
+        if error:
+            return False, error
+        bmp_info, error = self.detect_bmp_format(input_file)
+        if error:
+            return False, error
+        
+        width = bmp_info['width']
+        height = bmp_info['height']
+        bpp = bmp_info['bpp']
+        binary_file = binary_output_path(output_file)
+        # 裁剪时只读取所需的行，本身就不需要流式处理
+        streaming = streaming and crop is None and not self._check_streaming_support(bmp_info)
+        
+        if progress_callback:
+            progress_callback(f"检测到 {width}×{height} {bpp}位 BMP文件，输出格式: {output_format}（二进制）")
+        
+        if not streaming:
+            values, error = self.read_bmp_values(input_file, bmp_info, output_format, byte_order, crop)
+            if error:
+                return False, error
+            height, width = values.shape
+        
+        try:
+            data_size = 0
+            with self._stage('stream' if streaming else 'emit', width * height) as stage:
+                emitter = CArrayEmitter(output_format, byte_order, array_name=array_name)
+                with atomic_output(binary_file, 'wb') as bin_f:
+                    if streaming:
+                        for row in self.iter_bmp_value_rows(input_file, bmp_info, output_format, byte_order):
+                            data_size += bin_f.write(self.pixel_values_to_bytes(row, output_format))
+                    else:
+                        data_size = bin_f.write(self.pixel_values_to_bytes(values, output_format))
                 
+                with atomic_output(output_file, 'w', encoding='utf-8') as out_f:
+                    emitter.write_extern_header(out_f, width, height, bpp, binary_file, data_size)
+                    stage.add_bytes(data_size + out_f.tell())
+            
+            if progress_callback:
+                progress_callback("转换完成！")
+            
+            return True, f"成功转换 {width}×{height} 图像到 {binary_file}（头文件: {output_file}）"
+            
         except Exception as e:
-            return None, f"手动解析失败: {str(e)}"
+            return False, f"写入文件错误: {str(e)}"
     
-    def convert_bmp_to_array(self, input_file, output_file, output_format='RGB565', byte_order='little', progress_callback=None):
-        """将BMP文件转换为指定格式的数组"""
-        # 检测BMP格式
+    def convert_bmp_compressed(self, input_file, output_file, output_format='RGB565', byte_order='little', compression='rle',
+                               progress_callback=None, array_name=None, crop=None):
+        """将BMP文件转换为压缩后的字节数组
+        
+        压缩对象是与普通数组内存布局一致的像素字节流（见 pixel_values_to_bytes），
+        解码后即得到原始数组内容。返回的消息中包含压缩前后的大小和压缩率。
+        crop 为 (x, y, 宽, 高) 时只转换该区域。
+        """
+        error = indexed_format_error(output_format, "压缩输出")
+        if error:
+            return False, error
+        if compression not in COMPRESSION_METHODS:
+            return False, f"不支持的压缩方式: {compression}"
+        
         bmp_info, error = self.detect_bmp_format(input_file)
         if error:
             return False, error
@@ -161,380 +1775,1059 @@ class BMPConverter:
         bpp = bmp_info['bpp']
         
         if progress_callback:
-            progress_callback(f"检测到 {width}×{height} {bpp}位 BMP文件，输出格式: {output_format}")
+            progress_callback(f"检测到 {width}×{height} {bpp}位 BMP文件，输出格式: {output_format}（{compression}压缩）")
+        
+        values, error = self.read_bmp_values(input_file, bmp_info, output_format, byte_order, crop)
+        if error:
+            return False, error
+        height, width = values.shape
+        
+        try:
+            with self._stage('compress', values.size) as stage:
+                raw = self.pixel_values_to_bytes(values, output_format)
+                unit_size = 1 if output_format in ('RGB332', 'GRAY8') else 2
+                data = compress_pixel_bytes(raw, compression, unit_size)
+                stage.add_bytes(len(data))
+            
+            with self._stage('emit') as stage, \
+                    atomic_output(output_file, 'w', encoding='utf-8', buffering=1 << 20) as out_f:
+                # 构造输出器会生成（或取缓存的）字符串查找表，计入写出阶段
+                emitter = CArrayEmitter('GRAY8', byte_order, array_name=array_name)
+                declaring = CArrayEmitter(output_format, byte_order, array_name=array_name)
+                declaring.write_compressed_header(out_f, width, height, bpp, compression, len(raw), len(data))
+                values = np.frombuffer(data, dtype=np.uint8)
+                for start in range(0, len(values), self.emit_block_pixels):
+                    block = values[start:start + self.emit_block_pixels]
+                    emitter.write_rows(out_f, block.reshape(1, -1), start + len(block) == len(values))
+                emitter.write_footer(out_f)
+                stage.add_bytes(out_f.tell())
+            
+            if progress_callback:
+                progress_callback("转换完成！")
+            
+            ratio = len(data) / len(raw) * 100 if raw else 0
+            return True, (f"成功转换 {width}×{height} 图像到 {output_file}，"
+                          f"{compression}压缩: {len(raw)} → {len(data)} 字节（{ratio:.1f}%）")
+            
+        except Exception as e:
+            return False, f"写入文件错误: {str(e)}"
+    
+    def convert_bmp_tiles(self, input_file, output_file, tile_width, tile_height, output_format='RGB565', byte_order='little',
+                          progress_callback=None, values_per_line=None, hex_prefix=None):
+        """按固定网格把BMP切分为图块，每个图块输出为一个独立数组
         
-        # 读取像素数据
-        pixels, error = self.read_bmp_pixels(input_file, bmp_info)
+        逐条读取图块行所在的扫描行（每次只解码一条），再按列切分。
+        图像右侧和底部不足一个图块的部分输出为较小的图块。
+        另外生成按行排列的图块指针表，便于局部刷新时按坐标取图块。
+        """
+        error = indexed_format_error(output_format, "图块输出")
         if error:
             return False, error
+        bmp_info, error = self.detect_bmp_format(input_file)
+        if error:
+            return False, error
+        if tile_width < 1 or tile_height < 1:
+            return False, f"图块尺寸无效: {tile_width}×{tile_height}"
+        
+        width = bmp_info['width']
+        height = bmp_info['height']
+        bpp = bmp_info['bpp']
+        rows = -(-height // tile_height)
+        cols = -(-width // tile_width)
+        base_name = f"image_{width}x{height}"
         
         if progress_callback:
-            progress_callback("开始转换像素数据...")
+            progress_callback(f"检测到 {width}×{height} {bpp}位 BMP文件，切分为 {cols}×{rows} 个图块")
         
-        # 转换并写入输出文件
         try:
-            with open(output_file, 'w', encoding='utf-8') as out_f:
-                # 写入数组声明
-                array_name = f"image_{width}x{height}"
-                if output_format == 'RGB565':
-                    data_type = "uint16_t"
-                    out_f.write(f"// BMP转RGB565数组\n")
-                    out_f.write(f"// 字节顺序: {byte_order}-endian\n")
-                elif output_format == 'RGB332':
-                    data_type = "uint8_t"
-                    out_f.write(f"// BMP转RGB332数组\n")
-                    out_f.write(f"// 字节顺序: {byte_order}-endian\n")
-                elif output_format == 'GRAY8':
-                    data_type = "uint8_t"
-                    out_f.write(f"// BMP转8位灰度数组\n")
-                    out_f.write(f"// 字节顺序: {byte_order}-endian\n")
-                elif output_format == 'RGB565_8BIT':
-                    data_type = "unsigned char"
-                    out_f.write(f"// BMP转RGB565 8位字节数组\n")
-                    out_f.write(f"// 字节顺序: {byte_order}-endian\n")
-                
-                out_f.write(f"// 原始尺寸: {width}×{height}, {bpp}位\n")
-                out_f.write(f"// 输出格式: {output_format}\n")
-                
-                # 计算数组大小
-                if output_format == 'RGB565_8BIT':
-                    array_size = width * height * 2  # 每个像素2字节
-                else:
-                    array_size = width * height
-                
-                out_f.write(f"const {data_type} {array_name}[{array_size}] = {{\n")
-                
-                total_pixels = width * height
-                processed = 0
-                
-                for y, row in enumerate(pixels):
-                    for x, (r, g, b) in enumerate(row):
-                        # 根据输出格式转换像素
-                        if output_format == 'RGB565':
-                            pixel_value = self.convert_pixel_to_rgb565(r, g, b, byte_order)
-                            format_str = f"0x{pixel_value:04X}"
-                        elif output_format == 'RGB332':
-                            pixel_value = self.convert_pixel_to_rgb332(r, g, b, byte_order)
-                            format_str = f"0x{pixel_value:02X}"
-                        elif output_format == 'GRAY8':
-                            pixel_value = self.convert_pixel_to_grayscale8(r, g, b, byte_order)
-                            format_str = f"0x{pixel_value:02X}"
-                        elif output_format == 'RGB565_8BIT':
-                            pixel_value = self.convert_pixel_to_rgb565(r, g, b, byte_order)
-                            # 拆分为高低字节
-                            if byte_order == 'little':
-                                low_byte = pixel_value & 0xFF
-                                high_byte = (pixel_value >> 8) & 0xFF
-                                format_str = f"0X{high_byte:02X},0X{low_byte:02X}"
-                            else:
-                                high_byte = (pixel_value >> 8) & 0xFF
-                                low_byte = pixel_value & 0xFF
-                                format_str = f"0X{high_byte:02X},0X{low_byte:02X}"
-                        
-                        # 格式化输出
-                        if output_format == 'RGB565_8BIT':
-                            # 8位字节数组格式，每行8个字节（4个像素）
-                            if x % 4 == 0:
-                                out_f.write("    ")
-                            
-                            out_f.write(format_str)
-                            
-                            # 添加逗号和换行
-                            if y != height - 1 or x != width - 1:
-                                out_f.write(",")
-                            
-                            if x % 4 == 3:
-                                out_f.write("\n")
-                        else:
-                            # 其他格式保持原有逻辑
-                            if x % 16 == 0:
-                                out_f.write("    ")
-                            
-                            out_f.write(format_str)
-                            
-                            # 添加逗号和换行
-                            if y != height - 1 or x != width - 1:
-                                out_f.write(", ")
-                            
-                            if x % 16 == 15:
-                                out_f.write("\n")
-                        
-                        processed += 1
-                        if progress_callback and processed % 1000 == 0:
-                            progress = int((processed / total_pixels) * 100)
-                            progress_callback(f"转换进度: {progress}%")
-                
-                # 处理最后一行
-                if width % 16 != 0:
-                    out_f.write("\n")
+            names = []
+            with atomic_output(output_file, 'w', encoding='utf-8', buffering=1 << 20) as out_f:
+                for row in range(rows):
+                    y = row * tile_height
+                    strip_height = min(tile_height, height - y)
+                    strip, error = self.read_bmp_values(input_file, bmp_info, output_format, byte_order,
+                                                        (0, y, width, strip_height))
+                    if error:
+                        return False, error
+                    
+                    with self._stage('emit', strip.size) as stage:
+                        start = out_f.tell()
+                        for col in range(cols):
+                            x = col * tile_width
+                            tile = strip[:, x:x + tile_width]
+                            name = f"{base_name}_tile_{row}_{col}"
+                            names.append(name)
+                            emitter = CArrayEmitter(output_format, byte_order, values_per_line, hex_prefix, name)
+                            emitter.write_header(out_f, tile.shape[1], tile.shape[0], bpp)
+                            emitter.write_rows(out_f, tile, True)
+                            emitter.write_footer(out_f)
+                            out_f.write("\n")
+                        stage.add_bytes(out_f.tell() - start)
+                    
+                    if progress_callback:
+                        progress_callback(ProgressMessage(int((row + 1) / rows * 100)))
                 
-                out_f.write("};\n")
+                with self._stage('emit') as stage:
+                    table_start = out_f.tell()
+                    data_type = CArrayEmitter(output_format, byte_order).declaration(1, 1)[1]
+                    macro = base_name.upper()
+                    out_f.write(f"#define {macro}_TILE_WIDTH {tile_width}\n")
+                    out_f.write(f"#define {macro}_TILE_HEIGHT {tile_height}\n")
+                    out_f.write(f"#define {macro}_TILE_COLS {cols}\n")
+                    out_f.write(f"#define {macro}_TILE_ROWS {rows}\n\n")
+                    out_f.write(f"// 图块指针表，按行排列: {base_name}_tiles[行 * {macro}_TILE_COLS + 列]\n")
+                    out_f.write(f"const {data_type} *const {base_name}_tiles[{len(names)}] = {{\n")
+                    for start in range(0, len(names), 4):
+                        line = ", ".join(names[start:start + 4])
+                        separator = "," if start + 4 < len(names) else ""
+                        out_f.write(f"    {line}{separator}\n")
+                    out_f.write("};\n")
+                    stage.add_bytes(out_f.tell() - table_start)
             
             if progress_callback:
                 progress_callback("转换完成！")
             
-            return True, f"成功转换 {width}×{height} 图像到 {output_file}"
+            return True, f"成功把 {width}×{height} 图像切分为 {cols}×{rows} 个图块，输出到 {output_file}"
             
+        except ConversionCancelled:
+            return False, "转换已取消"
         except Exception as e:
             return False, f"写入文件错误: {str(e)}"
-
-class BMPConverterGUI:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("BMP转RGB565转换器")
-        self.root.geometry("600x500")
-        self.root.resizable(True, True)
-        # 设置窗口最小尺寸，防止界面元素被遮挡
-        self.root.minsize(600, 500)
-        
-        self.converter = BMPConverter()
-        self.input_file = ""
-        self.output_file = ""
-        
-        self.setup_ui()
-    
-    def setup_ui(self):
-        # 主框架
-        main_frame = ttk.Frame(self.root, padding="10")
-        main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        
-        # 配置网格权重
-        self.root.columnconfigure(0, weight=1)
-        self.root.rowconfigure(0, weight=1)
-        main_frame.columnconfigure(1, weight=1)
-        main_frame.rowconfigure(4, weight=1)  # 让文件信息栏可以垂直扩展
-        
-        # 输入文件选择
-        ttk.Label(main_frame, text="输入BMP文件:").grid(row=0, column=0, sticky=tk.W, pady=5)
-        self.input_var = tk.StringVar()
-        ttk.Entry(main_frame, textvariable=self.input_var, width=50).grid(row=0, column=1, sticky=(tk.W, tk.E), padx=5)
-        ttk.Button(main_frame, text="浏览", command=self.browse_input).grid(row=0, column=2, padx=5)
-        
-        # 输出文件选择
-        ttk.Label(main_frame, text="输出文件:").grid(row=1, column=0, sticky=tk.W, pady=5)
-        self.output_var = tk.StringVar()
-        ttk.Entry(main_frame, textvariable=self.output_var, width=50).grid(row=1, column=1, sticky=(tk.W, tk.E), padx=5)
-        ttk.Button(main_frame, text="浏览", command=self.browse_output).grid(row=1, column=2, padx=5)
-        
-        # 输出格式选择
-        ttk.Label(main_frame, text="输出格式:").grid(row=2, column=0, sticky=tk.W, pady=5)
-        self.output_format_var = tk.StringVar(value="RGB565")
-        self.display_format_var = tk.StringVar(value="RGB565 (16位)")
-        format_options = [
-            ("RGB565 (16位)", "RGB565"),
-            ("RGB565 (8位字节)", "RGB565_8BIT"),
-            ("RGB332 (8位)", "RGB332"),
-            ("灰度 (8位)", "GRAY8")
-        ]
-        self.format_combobox = ttk.Combobox(main_frame, textvariable=self.display_format_var, 
-                                           values=[option[0] for option in format_options], 
-                                           state="readonly", width=20)
-        self.format_combobox.grid(row=2, column=1, sticky=tk.W, pady=5, padx=5)
-        self.format_combobox.bind('<<ComboboxSelected>>', self.on_format_change)
-        
-        # 创建格式映射字典
-        self.format_mapping = {option[0]: option[1] for option in format_options}
-        self.reverse_format_mapping = {option[1]: option[0] for option in format_options}
-        self.format_combobox.set("RGB565 (16位)")
-        
-        # 字节顺序选择
-        ttk.Label(main_frame, text="字节顺序:").grid(row=3, column=0, sticky=tk.W, pady=5)
-        self.byte_order_var = tk.StringVar(value="little")
-        self.byte_order_frame = ttk.Frame(main_frame)
-        self.byte_order_frame.grid(row=3, column=1, sticky=tk.W, pady=5)
-        self.byte_order_little = ttk.Radiobutton(self.byte_order_frame, text="小端序 (Little)", variable=self.byte_order_var, value="little")
-        self.byte_order_little.pack(side=tk.LEFT)
-        self.byte_order_big = ttk.Radiobutton(self.byte_order_frame, text="大端序 (Big)", variable=self.byte_order_var, value="big")
-        self.byte_order_big.pack(side=tk.LEFT, padx=10)
-        
-        # 文件信息显示
-        info_frame = ttk.LabelFrame(main_frame, text="文件信息", padding="5")
-        info_frame.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=10)
-        info_frame.columnconfigure(0, weight=1)
-        info_frame.rowconfigure(0, weight=1)  # 让文本框可以垂直扩展
-        
-        self.info_text = tk.Text(info_frame, height=6, width=70)
-        info_scrollbar = ttk.Scrollbar(info_frame, orient="vertical", command=self.info_text.yview)
-        self.info_text.configure(yscrollcommand=info_scrollbar.set)
-        self.info_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        info_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        
-        # 转换按钮
-        button_frame = ttk.Frame(main_frame)
-        button_frame.grid(row=5, column=0, columnspan=3, pady=10)
-        ttk.Button(button_frame, text="开始转换", command=self.start_conversion).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="清除信息", command=self.clear_info).pack(side=tk.LEFT, padx=5)
-        
-        # 进度条
-        self.progress_var = tk.StringVar(value="就绪")
-        ttk.Label(main_frame, textvariable=self.progress_var).grid(row=6, column=0, columnspan=3, pady=5)
-        
-        self.progress_bar = ttk.Progressbar(main_frame, mode='indeterminate')
-        self.progress_bar.grid(row=7, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=5)
-        
-        # 开源协议信息
-        license_frame = ttk.Frame(main_frame)
-        license_frame.grid(row=8, column=0, columnspan=3, pady=5)
-        license_text = "本软件采用 MIT 开源许可证发布，允许任何人自由使用、修改和分发，前提是保留原始的版权声明和许可声明。"
-        ttk.Label(license_frame, text=license_text, font=('Arial', 8), foreground='gray').pack()
-    
-    def on_format_change(self, event=None):
-        """当输出格式改变时的处理"""
-        # 获取实际的格式值
-        display_format = self.format_combobox.get()
-        actual_format = self.format_mapping.get(display_format, "RGB565")
-        self.output_format_var.set(actual_format)
-        
-        # 所有格式都支持字节顺序选择
-        self.byte_order_little.config(state='normal')
-        self.byte_order_big.config(state='normal')
-    
-    def browse_input(self):
-        filename = filedialog.askopenfilename(
-            title="选择BMP文件",
-            filetypes=[("BMP文件", "*.bmp"), ("所有文件", "*.*")]
-        )
-        if filename:
-            self.input_var.set(filename)
-            self.analyze_input_file(filename)
-    
-    def browse_output(self):
-        filename = filedialog.asksaveasfilename(
-            title="保存为",
-            defaultextension=".h",
-            filetypes=[("C头文件", "*.h"), ("文本文件", "*.txt"), ("所有文件", "*.*")]
-        )
-        if filename:
-            self.output_var.set(filename)
-    
-    def analyze_input_file(self, filename):
-        """分析输入文件并显示信息"""
-        info, error = self.converter.detect_bmp_format(filename)
-        
-        self.info_text.delete(1.0, tk.END)
+    
+    def convert_atlas(self, inputs, output_file, output_format='RGB565', byte_order='little', atlas_name='atlas',
+                      tile_size=None, progress_callback=None):
+        """把多个BMP打包为一个连续的像素数组，并生成索引表和枚举常量
         
+        inputs 可以是文件、目录或通配符。内容完全相同的图像只保存一份像素数据。
+        指定 tile_size 时按固定大小的图块去重：像素数组保存去重后的图块，
+        每个精灵通过图块映射表引用图块（宽高不足整块的部分以0填充）。
+        """
+        error = indexed_format_error(output_format, "图集")
         if error:
-            self.info_text.insert(tk.END, f"错误: {error}\n")
-        else:
-            self.info_text.insert(tk.END, f"文件路径: {filename}\n")
-            self.info_text.insert(tk.END, f"图像尺寸: {info['width']} × {info['height']}\n")
-            self.info_text.insert(tk.END, f"位深度: {info['bpp']} 位\n")
-            self.info_text.insert(tk.END, f"压缩方式: {info['compression']}\n")
-            self.info_text.insert(tk.END, f"文件大小: {info['file_size']:,} 字节\n")
-            self.info_text.insert(tk.END, f"像素总数: {info['width'] * info['height']:,}\n")
-            
-            # 自动设置输出文件名
-            if not self.output_var.get():
-                base_name = os.path.splitext(os.path.basename(filename))[0]
-                format_suffix = self.output_format_var.get().lower()
-                output_name = f"{base_name}_{format_suffix}.h"
-                output_path = os.path.join(os.path.dirname(filename), output_name)
-                self.output_var.set(output_path)
-    
-    def clear_info(self):
-        self.info_text.delete(1.0, tk.END)
-        self.progress_var.set("就绪")
-    
-    def update_progress(self, message):
-        """更新进度信息"""
-        self.progress_var.set(message)
-        self.root.update_idletasks()
-    
-    def start_conversion(self):
-        """开始转换过程"""
-        input_file = self.input_var.get().strip()
-        output_file = self.output_var.get().strip()
-        
-        if not input_file:
-            messagebox.showerror("错误", "请选择输入文件")
-            return
+            return False, error
+        files = find_bmp_files(inputs)
+        if not files:
+            return False, "没有找到任何BMP文件"
+        if tile_size is not None and tile_size < 1:
+            return False, f"图块大小必须大于0: {tile_size}"
         
-        if not output_file:
-            messagebox.showerror("错误", "请指定输出文件")
-            return
+        sprites = []
+        used_names = set()
+        for input_file, relative_path in files:
+            bmp_info, error = self.detect_bmp_format(input_file)
+            if not error:
+                values, error = self.read_bmp_values(input_file, bmp_info, output_format, byte_order)
+            if error:
+                return False, f"{input_file}: {error}"
+            name = atlas_symbol_name(atlas_name, relative_path, used_names)
+            sprites.append((name, values, bmp_info['bpp']))
+            if progress_callback:
+                progress_callback(f"已读取 {relative_path}（{values.shape[1]}×{values.shape[0]}）")
         
-        if not os.path.exists(input_file):
-            messagebox.showerror("错误", "输入文件不存在")
-            return
+        try:
+            if tile_size:
+                packed = pack_atlas_tiles(sprites, tile_size)
+            else:
+                packed = pack_atlas_sprites(sprites)
+            
+            emitter = CArrayEmitter(output_format, byte_order)
+            with atomic_output(output_file, 'w', encoding='utf-8', buffering=1 << 20) as out_f:
+                write_atlas(out_f, emitter, atlas_name, sprites, packed, tile_size)
+            
+            if progress_callback:
+                progress_callback("转换完成！")
+            
+            unique = packed['unique_count']
+            unit = "个图块" if tile_size else "份像素数据"
+            return True, f"成功打包 {len(sprites)} 个精灵到 {output_file}（去重后 {unique} {unit}，共 {packed['pixel_count']} 像素）"
+            
+        except Exception as e:
+            return False, f"写入文件错误: {str(e)}"
+    
+    def convert_animation(self, inputs, output_file, output_format='RGB565', byte_order='little', anim_name='anim',
+                          merge_gap=4, progress_callback=None):
+        """把一组动画帧转换为首帧完整数据加后续帧的脏矩形增量
+        
+        inputs 按顺序给出帧（目录和通配符按文件名排序）。每一帧与上一帧整幅比较，
+        只输出发生变化的矩形区域；间隔不超过 merge_gap 个像素的变化合并到同一矩形。
+        所有帧必须尺寸相同。
+        """
+        error = indexed_format_error(output_format, "动画")
+        if error:
+            return False, error
+        files = find_bmp_files(inputs)
+        if not files:
+            return False, "没有找到任何BMP文件"
         
-        # 在新线程中执行转换
-        self.progress_bar.start()
-        thread = threading.Thread(target=self.conversion_thread, args=(input_file, output_file))
-        thread.daemon = True
-        thread.start()
+        frames = []
+        rects = []
+        blocks = []
+        offset = 0
+        previous = None
+        for frame_index, (input_file, relative_path) in enumerate(files):
+            bmp_info, error = self.detect_bmp_format(input_file)
+            if not error:
+                values, error = self.read_bmp_values(input_file, bmp_info, output_format, byte_order)
+            if error:
+                return False, f"{input_file}: {error}"
+            
+            if previous is None:
+                height, width = values.shape
+                bpp = bmp_info['bpp']
+                frame_rects = [(0, 0, width, height)]
+            elif values.shape != previous.shape:
+                return False, f"{input_file}: 帧尺寸 {values.shape[1]}×{values.shape[0]} 与首帧 {width}×{height} 不一致"
+            else:
+                frame_rects = find_dirty_rects(previous, values, merge_gap)
+            
+            frames.append((len(rects), len(frame_rects), relative_path))
+            for x, y, rect_width, rect_height in frame_rects:
+                block = values[y:y + rect_height, x:x + rect_width]
+                rects.append((x, y, rect_width, rect_height, offset))
+                blocks.append((frame_index, block))
+                offset += block.size
+            previous = values
+            
+            if progress_callback:
+                progress_callback(f"已处理第 {frame_index + 1}/{len(files)} 帧（{len(frame_rects)} 个变化区域）")
+        
+        try:
+            emitter = CArrayEmitter(output_format, byte_order)
+            with atomic_output(output_file, 'w', encoding='utf-8', buffering=1 << 20) as out_f:
+                write_animation(out_f, emitter, anim_name, width, height, bpp, frames, rects, blocks, offset)
+            
+            if progress_callback:
+                progress_callback("转换完成！")
+            
+            full_size = width * height * len(frames)
+            ratio = offset / full_size * 100 if full_size else 0
+            return True, (f"成功转换 {len(frames)} 帧 {width}×{height} 动画到 {output_file}，"
+                          f"像素数据 {offset} / {full_size}（{ratio:.1f}%）")
+            
+        except Exception as e:
+            return False, f"写入文件错误: {str(e)}"
     
-    def conversion_thread(self, input_file, output_file):
-        """转换线程"""
+    def convert_file(self, input_file, output_file, output_format='RGB565', byte_order='little', progress_callback=None,
+                     streaming=False, binary=False, compression=None, crop=None, tiles=None, stats=None, jobs=1):
+        """按选项选择转换方式：图块、压缩数组、二进制数据、流式或整幅数组
+        
+        crop 为 (x, y, 宽, 高) 的裁剪区域，tiles 为 (图块宽, 图块高)。
+        jobs 为整幅数组输出时并行格式化使用的进程数（见 convert_bmp_to_array）。
+        传入 stats（ConversionStats）时记录各阶段的耗时、像素数、写出字节数和峰值内存。
+        """
+        if stats is not None:
+            previous_stats = self.stats
+            self.stats = stats
+            stats.begin(input_file, output_file)
+            result = None
+            try:
+                result = self.convert_file(input_file, output_file, output_format, byte_order, progress_callback,
+                                           streaming, binary, compression, crop, tiles, jobs=jobs)
+                return result
+            finally:
+                self.stats = previous_stats
+                stats.finish(result, batch_output_files(output_file, binary))
+        
+        if output_format in INDEXED_FORMATS:
+            if tiles or compression or binary:
+                return False, f"{output_format} 格式只支持C数组输出，不能与图块、压缩或二进制输出同时使用"
+            # 调色板需要整幅图像的颜色分布，不能流式处理
+            return self.convert_bmp_to_array(input_file, output_file, output_format, byte_order, progress_callback,
+                                             crop=crop, jobs=jobs)
+        if tiles:
+            return self.convert_bmp_tiles(input_file, output_file, tiles[0], tiles[1], output_format, byte_order,
+                                          progress_callback)
+        if compression:
+            return self.convert_bmp_compressed(input_file, output_file, output_format, byte_order, compression,
+                                               progress_callback, crop=crop)
+        if binary:
+            return self.convert_bmp_to_binary(input_file, output_file, output_format, byte_order, progress_callback,
+                                              streaming=streaming, crop=crop)
+        if crop:
+            # 裁剪时只读取所需的行，不需要流式处理
+            return self.convert_bmp_to_array(input_file, output_file, output_format, byte_order, progress_callback,
+                                             crop=crop, jobs=jobs)
+        if streaming:
+            return self.convert_bmp_streaming(input_file, output_file, output_format, byte_order, progress_callback)
+        return self.convert_bmp_to_array(input_file, output_file, output_format, byte_order, progress_callback,
+                                         jobs=jobs)
+    
+    def convert_bmp_streaming(self, input_file, output_file, output_format='RGB565', byte_order='little', progress_callback=None,
+                              values_per_line=None, hex_prefix=None, array_name=None):
+        """流式转换BMP文件：逐行读取、转换并写出
+        
+        输出与 convert_bmp_to_array 完全一致，但任一时刻只保留一行像素，
+        适合非常高的滚动背景、地图条带等图像。不支持的BMP（如RLE压缩）
+        会自动回退到整幅转换。INDEXED 格式的调色板需要整幅图像，同样整幅转换。
+        """
+        if output_format in INDEXED_FORMATS:
+            return self.convert_bmp_to_array(input_file, output_file, output_format, byte_order, progress_callback,
+                                             values_per_line, hex_prefix, array_name)
+        bmp_info, error = self.detect_bmp_format(input_file)
+        if error:
+            return False, error
+        
+        width = bmp_info['width']
+        height = bmp_info['height']
+        bpp = bmp_info['bpp']
+        
+        if self._check_streaming_support(bmp_info):
+            if progress_callback:
+                progress_callback("该BMP不支持流式转换，改为整幅转换")
+            return self.convert_bmp_to_array(input_file, output_file, output_format, byte_order, progress_callback,
+                                             values_per_line, hex_prefix, array_name)
+        
+        if progress_callback:
+            progress_callback(f"检测到 {width}×{height} {bpp}位 BMP文件，输出格式: {output_format}（流式）")
+        
         try:
-            output_format = self.output_format_var.get()
-            # 直接从单选按钮获取字节序值
-            byte_order = self.byte_order_var.get()
-            success, message = self.converter.convert_bmp_to_array(
-                input_file, output_file, output_format, byte_order, self.update_progress
-            )
+            with self._stage('stream', width * height) as stage, \
+                    atomic_output(output_file, 'w', encoding='utf-8', buffering=1 << 20) as out_f:
+                emitter = CArrayEmitter(output_format, byte_order, values_per_line, hex_prefix, array_name)
+                emitter.write_header(out_f, width, height, bpp)
+                
+                last_progress = -1
+                rows = self.iter_bmp_value_rows(input_file, bmp_info, output_format, byte_order)
+                for y, row in enumerate(rows):
+                    emitter.write_rows(out_f, row, y == height - 1)
+                    
+                    if progress_callback:
+                        progress = int(((y + 1) / height) * 100)
+                        if progress != last_progress:
+                            last_progress = progress
+                            progress_callback(ProgressMessage(progress))
+                
+                emitter.write_footer(out_f)
+                stage.add_bytes(out_f.tell())
             
-            # 在主线程中更新UI
-            self.root.after(0, self.conversion_complete, success, message)
+            if progress_callback:
+                progress_callback("转换完成！")
             
+            return True, f"成功转换 {width}×{height} 图像到 {output_file}"
+            
+        except ConversionCancelled:
+            return False, "转换已取消"
         except Exception as e:
-            self.root.after(0, self.conversion_complete, False, f"转换过程中发生错误: {str(e)}")
+            return False, f"写入文件错误: {str(e)}"
     
-    def conversion_complete(self, success, message):
-        """转换完成回调"""
-        self.progress_bar.stop()
+    def convert_batch(self, inputs, output_dir, output_format='RGB565', byte_order='little', jobs=None,
+                      streaming=False, progress_callback=None, cache=None, binary=False, compression=None):
+        """批量转换目录或通配符匹配到的BMP文件
         
+        文件分发到进程池中并行转换（jobs 缺省为CPU核数），单个文件失败不会中断整批。
+        每个输出与单独调用 convert_bmp_to_array 的结果完全一致。
+        指定 cache（ConversionCache）时，缓存的查询和写入都在当前进程中完成。
+        binary 为真时输出 .bin 像素数据和精简头文件；compression 指定压缩输出方式。
+        返回 [(输入文件, 输出文件, 是否成功, 消息), ...]，顺序与输入一致。
+        """
+        pairs = expand_batch_inputs(inputs, output_dir, output_format)
+        if not pairs:
+            return []
+        
+        options = {
+            'output_format': output_format,
+            'byte_order': byte_order,
+            'streaming': streaming,
+            'binary': binary,
+            'compression': compression,
+        }
+        
+        results = [None] * len(pairs)
+        tasks = []
+        cache_keys = {}
+        # 多个输入写同一输出会互相覆盖，转换开始前就把它们全部记为失败
+        duplicates = find_duplicate_outputs(pairs)
+        for index, (input_file, output_file) in enumerate(pairs):
+            if index in duplicates:
+                results[index] = (input_file, output_file, False, duplicates[index])
+                if progress_callback:
+                    progress_callback(results[index])
+                continue
+            if cache is not None:
+                try:
+                    key = cache.make_key(input_file, output_format=output_format, byte_order=byte_order,
+                                         binary=binary, compression=compression)
+                except OSError as e:
+                    results[index] = (input_file, output_file, False, f"读取文件错误: {str(e)}")
+                    if progress_callback:
+                        progress_callback(results[index])
+                    continue
+                if cache.fetch(key, batch_output_files(output_file, binary)):
+                    results[index] = (input_file, output_file, True, "缓存命中")
+                    if progress_callback:
+                        progress_callback(results[index])
+                    continue
+                cache_keys[index] = key
+            tasks.append((index, (input_file, output_file, options)))
+        
+        def finish(index, result):
+            results[index] = result
+            if result[2] and index in cache_keys:
+                cache.store(cache_keys[index], batch_output_files(result[1], binary))
+            if progress_callback:
+                progress_callback(result)
+        
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        jobs = max(1, min(jobs, len(tasks)))
+        
+        if jobs == 1:
+            # 单进程时直接在当前进程转换，省去进程池开销
+            for index, task in tasks:
+                finish(index, _convert_batch_task(task, self))
+        else:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = {executor.submit(_convert_batch_task, task): (index, task) for index, task in tasks}
+                for future in as_completed(futures):
+                    index, task = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # 工作进程异常退出等情况，只记为该文件失败
+                        result = (task[0], task[1], False, f"转换过程中发生错误: {str(e)}")
+                    finish(index, result)
+        
+        if cache is not None:
+            cache.save()
+        return results
+
+class ProgressChannel:
+    """转换线程与界面线程之间的线程安全进度通道
+    
+    实例本身可作为 progress_callback 传给转换方法：转换线程只向队列投递事件，
+    界面线程定时调用 drain() 取出并更新界面。cancel() 之后的下一次进度回调
+    会抛出 ConversionCancelled，使转换尽快结束。
+    """
+    
+    def __init__(self):
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+    
+    def __call__(self, message):
+        if self.cancel_event.is_set():
+            raise ConversionCancelled()
+        self.events.put(('progress', message))
+    
+    def finish(self, success, message):
+        """投递转换结束事件"""
+        self.events.put(('done', success, message))
+    
+    def cancel(self):
+        self.cancel_event.set()
+    
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+    
+    def drain(self):
+        """取出当前队列中的全部事件（不阻塞）"""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+def binary_output_path(output_file):
+    """二进制输出模式下，像素数据文件与头文件同名，扩展名为 .bin"""
+    return os.path.splitext(output_file)[0] + '.bin'
+
+def batch_output_files(output_file, binary=False):
+    """返回一次转换产生的全部输出文件"""
+    if binary:
+        return [output_file, binary_output_path(output_file)]
+    return [output_file]
+
+def glob_root(pattern):
+    """通配符模式中不含通配符的前导目录（如 'assets/**/*.bmp' 为 'assets'），没有时返回 '.'"""
+    if os.altsep:
+        pattern = pattern.replace(os.altsep, os.sep)
+    parts = pattern.split(os.sep)
+    root_parts = []
+    for part in parts[:-1]:
+        if any(char in part for char in '*?['):
+            break
+        root_parts.append(part)
+    if root_parts == ['']:
+        return os.sep
+    return os.sep.join(root_parts) or '.'
+
+def find_bmp_files(inputs):
+    """展开输入（文件、目录或通配符），返回 [(输入文件, 相对路径), ...]
+    
+    目录会递归查找 .bmp 文件，相对路径相对于该目录；通配符匹配结果相对于模式中
+    不含通配符的前导目录（见 glob_root），保留子目录结构；单独指定的文件只保留文件名。
+    """
+    found = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for dir_path, dir_names, file_names in os.walk(pattern):
+                dir_names.sort()
+                for file_name in sorted(file_names):
+                    if file_name.lower().endswith('.bmp'):
+                        input_file = os.path.join(dir_path, file_name)
+                        found.append((input_file, os.path.relpath(input_file, pattern)))
+        elif os.path.isfile(pattern):
+            found.append((pattern, os.path.basename(pattern)))
+        else:
+            root = glob_root(pattern)
+            for input_file in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isfile(input_file):
+                    found.append((input_file, os.path.relpath(input_file, root)))
+    return found
+
+def expand_batch_inputs(inputs, output_dir, output_format='RGB565'):
+    """展开批量输入（文件、目录或通配符），返回 [(输入文件, 输出文件), ...]
+    
+    目录和通配符匹配到的文件在输出目录中保留相对路径；单独指定的文件直接输出到输出目录。
+    输出文件名与GUI自动命名一致。不同输入仍可能对应同一输出文件（如不同目录下的同名文件），
+    见 find_duplicate_outputs。
+    """
+    found = find_bmp_files(inputs)
+    
+    pairs = []
+    seen = set()
+    format_suffix = output_format.lower()
+    for input_file, relative_path in found:
+        key = os.path.normcase(os.path.abspath(input_file))
+        if key in seen:
+            continue
+        seen.add(key)
+        base_name = os.path.splitext(relative_path)[0]
+        output_file = os.path.join(output_dir, f"{base_name}_{format_suffix}.h")
+        pairs.append((input_file, output_file))
+    return pairs
+
+def find_duplicate_outputs(pairs):
+    """找出输出文件相同的输入，返回 {序号: 错误信息}，同一输出的所有输入都会列出"""
+    groups = {}
+    for index, (input_file, output_file) in enumerate(pairs):
+        groups.setdefault(os.path.normcase(os.path.abspath(output_file)), []).append(index)
+    errors = {}
+    for indices in groups.values():
+        if len(indices) > 1:
+            inputs = "、".join(pairs[index][0] for index in indices)
+            for index in indices:
+                errors[index] = f"输出文件 {pairs[index][1]} 与其他输入重复（{inputs}），未转换"
+    return errors
+
+def atlas_symbol_name(atlas_name, relative_path, used_names):
+    """由文件相对路径生成精灵的枚举名（大写，非字母数字替换为下划线，重名时追加序号）"""
+    base = os.path.splitext(relative_path)[0]
+    name = ''.join(ch if ch.isascii() and ch.isalnum() else '_' for ch in base).upper().strip('_') or 'SPRITE'
+    name = f"{atlas_name.upper()}_{name}"
+    candidate = name
+    suffix = 2
+    while candidate in used_names:
+        candidate = f"{name}_{suffix}"
+        suffix += 1
+    used_names.add(candidate)
+    return candidate
+
+def pack_atlas_sprites(sprites):
+    """按整幅图像去重，返回像素块列表和每个精灵的 (偏移, 宽, 高)"""
+    blocks = []
+    index = []
+    offsets = {}
+    offset = 0
+    for name, values, bpp in sprites:
+        height, width = values.shape
+        key = (width, height, values.dtype.str, hashlib.sha256(values.tobytes()).digest())
+        if key not in offsets:
+            offsets[key] = offset
+            blocks.append((name, values))
+            offset += values.size
+        index.append((offsets[key], width, height))
+    return {'blocks': blocks, 'index': index, 'unique_count': len(blocks), 'pixel_count': offset}
+
+def pack_atlas_tiles(sprites, tile_size):
+    """按固定大小图块去重，返回图块像素块、图块映射表和每个精灵的 (映射偏移, 宽, 高)"""
+    tiles = []
+    tile_ids = {}
+    tile_map = []
+    index = []
+    for name, values, bpp in sprites:
+        height, width = values.shape
+        rows = -(-height // tile_size)
+        cols = -(-width // tile_size)
+        padded = np.zeros((rows * tile_size, cols * tile_size), dtype=values.dtype)
+        padded[:height, :width] = values
+        # 切分为 rows×cols 个图块，每个图块按行展开
+        grid = padded.reshape(rows, tile_size, cols, tile_size).swapaxes(1, 2).reshape(-1, tile_size * tile_size)
+        index.append((len(tile_map), width, height))
+        for tile in grid:
+            key = tile.tobytes()
+            tile_id = tile_ids.get(key)
+            if tile_id is None:
+                tile_id = tile_ids[key] = len(tiles)
+                tiles.append(tile)
+            tile_map.append(tile_id)
+    
+    blocks = []
+    if tiles:
+        blocks.append((None, np.stack(tiles)))
+    return {
+        'blocks': blocks,
+        'index': index,
+        'tile_map': tile_map,
+        'unique_count': len(tiles),
+        'pixel_count': len(tiles) * tile_size * tile_size,
+    }
+
+def write_atlas(out_f, emitter, atlas_name, sprites, packed, tile_size=None):
+    """写出图集头文件：枚举常量、索引表、（图块映射表）和像素数组"""
+    output_format = emitter.output_format
+    data_type = emitter.declaration(1, 1)[1]
+    # RGB565_8BIT 的数组元素为字节，偏移和大小按元素计
+    scale = 2 if output_format == 'RGB565_8BIT' else 1
+    macro = atlas_name.upper()
+    pixel_count = packed['pixel_count']
+    
+    out_f.write(f"// BMP精灵图集（{len(sprites)} 个精灵）\n")
+    out_f.write(f"// 字节顺序: {emitter.byte_order}-endian\n")
+    out_f.write(f"// 输出格式: {output_format}\n")
+    if tile_size:
+        out_f.write(f"// 图块: {tile_size}×{tile_size}，去重后 {packed['unique_count']} 个\n")
+        out_f.write(f"// 精灵图块: {atlas_name}_tiles + {atlas_name}_tile_map[offset + 行 * 每行图块数 + 列] * {macro}_TILE_STRIDE\n")
+    else:
+        out_f.write(f"// 精灵像素: {atlas_name}_pixels + {atlas_name}_index[id].offset，去重后 {packed['unique_count']} 份像素数据\n")
+    out_f.write("#include <stdint.h>\n\n")
+    
+    out_f.write("enum {\n")
+    for sprite_id, (name, values, bpp) in enumerate(sprites):
+        out_f.write(f"    {name} = {sprite_id},\n")
+    out_f.write(f"    {macro}_COUNT = {len(sprites)}\n")
+    out_f.write("};\n\n")
+    
+    if tile_size:
+        out_f.write(f"#define {macro}_TILE_SIZE {tile_size}\n")
+        out_f.write(f"#define {macro}_TILE_STRIDE {tile_size * tile_size * scale}\n\n")
+    
+    out_f.write("typedef struct {\n")
+    out_f.write("    uint32_t offset;\n")
+    out_f.write("    uint16_t width;\n")
+    out_f.write("    uint16_t height;\n")
+    out_f.write(f"}} {atlas_name}_sprite_t;\n\n")
+    
+    out_f.write(f"const {atlas_name}_sprite_t {atlas_name}_index[{len(sprites)}] = {{\n")
+    for (name, values, bpp), (offset, width, height) in zip(sprites, packed['index']):
+        offset = offset if tile_size else offset * scale
+        out_f.write(f"    {{{offset}, {width}, {height}}}, // {name}\n")
+    out_f.write("};\n\n")
+    
+    if tile_size:
+        tile_map = packed['tile_map']
+        map_type = "uint16_t" if packed['unique_count'] <= 0xFFFF else "uint32_t"
+        out_f.write(f"const {map_type} {atlas_name}_tile_map[{len(tile_map)}] = {{\n")
+        for start in range(0, len(tile_map), 16):
+            line = ", ".join(str(tile_id) for tile_id in tile_map[start:start + 16])
+            separator = "," if start + 16 < len(tile_map) else ""
+            out_f.write(f"    {line}{separator}\n")
+        out_f.write("};\n\n")
+        array_name = f"{atlas_name}_tiles"
+    else:
+        array_name = f"{atlas_name}_pixels"
+    
+    out_f.write(f"const {data_type} {array_name}[{pixel_count * scale}] = {{\n")
+    blocks = packed['blocks']
+    for block_index, (name, values) in enumerate(blocks):
+        if name:
+            out_f.write(f"    // {name} ({values.shape[1]}×{values.shape[0]})\n")
+        emitter.write_rows(out_f, values, block_index == len(blocks) - 1)
+    emitter.write_footer(out_f)
+
+def _true_runs(mask, merge_gap=0):
+    """返回布尔数组中连续为真的区间 [(起点, 终点), ...]，间隔不超过 merge_gap 的区间会合并"""
+    positions = np.flatnonzero(mask)
+    if len(positions) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(positions) > merge_gap + 1)
+    starts = positions[np.concatenate(([0], breaks + 1))]
+    ends = positions[np.concatenate((breaks, [len(positions) - 1]))] + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+def find_dirty_rects(previous, current, merge_gap=4):
+    """整幅比较两帧，返回变化区域的矩形列表 [(x, y, 宽, 高), ...]
+    
+    先按发生变化的行分段，再在每段内按发生变化的列分段。
+    """
+    changed = previous != current
+    rects = []
+    for top, bottom in _true_runs(changed.any(axis=1), merge_gap):
+        for left, right in _true_runs(changed[top:bottom].any(axis=0), merge_gap):
+            rects.append((left, top, right - left, bottom - top))
+    return rects
+
+def write_animation(out_f, emitter, anim_name, width, height, bpp, frames, rects, blocks, pixel_count):
+    """写出动画头文件：帧表、矩形表和像素数组"""
+    data_type = emitter.declaration(1, 1)[1]
+    # RGB565_8BIT 的数组元素为字节，偏移和大小按元素计
+    scale = 2 if emitter.output_format == 'RGB565_8BIT' else 1
+    macro = anim_name.upper()
+    
+    out_f.write(f"// BMP动画序列（{len(frames)} 帧，首帧完整，后续帧为变化区域）\n")
+    out_f.write(f"// 字节顺序: {emitter.byte_order}-endian\n")
+    out_f.write(f"// 原始尺寸: {width}×{height}, {bpp}位\n")
+    out_f.write(f"// 输出格式: {emitter.output_format}\n")
+    out_f.write(f"// 第 i 帧: 依次把 {anim_name}_rects[first_rect .. first_rect + rect_count) 中每个矩形的像素\n")
+    out_f.write(f"//         （{anim_name}_pixels + offset，按行存储）绘制到 (x, y)\n")
+    out_f.write("#include <stdint.h>\n\n")
+    out_f.write(f"#define {macro}_WIDTH {width}\n")
+    out_f.write(f"#define {macro}_HEIGHT {height}\n")
+    out_f.write(f"#define {macro}_FRAME_COUNT {len(frames)}\n\n")
+    
+    out_f.write("typedef struct {\n")
+    out_f.write("    uint16_t x;\n")
+    out_f.write("    uint16_t y;\n")
+    out_f.write("    uint16_t width;\n")
+    out_f.write("    uint16_t height;\n")
+    out_f.write("    uint32_t offset;\n")
+    out_f.write(f"}} {anim_name}_rect_t;\n\n")
+    out_f.write("typedef struct {\n")
+    out_f.write("    uint32_t first_rect;\n")
+    out_f.write("    uint32_t rect_count;\n")
+    out_f.write(f"}} {anim_name}_frame_t;\n\n")
+    
+    out_f.write(f"const {anim_name}_frame_t {anim_name}_frames[{len(frames)}] = {{\n")
+    for first_rect, rect_count, relative_path in frames:
+        out_f.write(f"    {{{first_rect}, {rect_count}}}, // {relative_path}\n")
+    out_f.write("};\n\n")
+    
+    # 空数组在C中不合法，没有变化区域时保留一个占位元素
+    out_f.write(f"const {anim_name}_rect_t {anim_name}_rects[{max(1, len(rects))}] = {{\n")
+    for x, y, rect_width, rect_height, offset in rects:
+        out_f.write(f"    {{{x}, {y}, {rect_width}, {rect_height}, {offset * scale}}},\n")
+    if not rects:
+        out_f.write("    {0, 0, 0, 0, 0}\n")
+    out_f.write("};\n\n")
+    
+    out_f.write(f"const {data_type} {anim_name}_pixels[{pixel_count * scale}] = {{\n")
+    last_frame = None
+    for block_index, (frame_index, block) in enumerate(blocks):
+        if frame_index != last_frame:
+            out_f.write(f"    // 第 {frame_index} 帧\n")
+            last_frame = frame_index
+        emitter.write_rows(out_f, block, block_index == len(blocks) - 1)
+    emitter.write_footer(out_f)
+
+def _format_band_task(task):
+    """并行格式化中的单个条带，在工作进程中执行：从共享内存读取像素值并返回数组文本"""
+    from multiprocessing import shared_memory
+    
+    shm_name, shape, dtype, start_row, end_row, emitter_options, rows_per_block, is_last_band = task
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        values = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        emitter = CArrayEmitter(**emitter_options)
+        parts = []
+        for y in range(start_row, end_row, rows_per_block):
+            block_end = min(y + rows_per_block, end_row)
+            parts.append(emitter.format_rows(values[y:block_end], is_last_band and block_end == end_row))
+        # 释放对共享内存缓冲区的引用后才能关闭
+        del values
+        return "".join(parts)
+    finally:
+        shm.close()
+
+# 工作进程内复用的转换器（保留查找表缓存）
+_worker_converter = None
+
+def init_conversion_worker():
+    """常驻进程池（守护进程、监视模式）的工作进程初始化函数
+    
+    预先创建转换器，第一个任务不必再付导入开销。工作进程忽略 SIGINT/SIGTERM：
+    Ctrl+C 会发给整个进程组，停止由主进程统一处理（等待进程池退出），
+    工作进程不再各自打印 KeyboardInterrupt 回溯。
+    """
+    global _worker_converter
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    _worker_converter = BMPConverter()
+
+def run_conversion_job(input_file, output_file, options, method='convert_file', converter=None):
+    """执行一次转换，返回 (是否成功, 消息, 转换耗时秒数)
+    
+    method 为使用的 BMPConverter 方法名，监视模式的数组格式选项需要 convert_bmp_to_array。
+    未传入 converter 时使用工作进程内复用的转换器，查找表在任务之间保留。
+    """
+    global _worker_converter
+    if converter is None:
+        if _worker_converter is None:
+            _worker_converter = BMPConverter()
+        converter = _worker_converter
+    
+    start = time.perf_counter()
+    try:
+        output_parent = os.path.dirname(output_file)
+        if output_parent:
+            os.makedirs(output_parent, exist_ok=True)
+        success, message = getattr(converter, method)(input_file, output_file, **options)
+    except Exception as e:
+        success, message = False, f"转换过程中发生错误: {str(e)}"
+    return success, message, time.perf_counter() - start
+
+def _convert_batch_task(task, converter=None):
+    """批量转换中的单个任务，在工作进程中执行"""
+    input_file, output_file, options = task
+    success, message, _ = run_conversion_job(input_file, output_file, options, converter=converter)
+    return input_file, output_file, success, message
+
+def parse_crop(text):
+    """解析 --crop 参数（X,Y,W,H）"""
+    try:
+        x, y, width, height = (int(part) for part in text.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"裁剪区域格式应为 X,Y,W,H: {text}")
+    return x, y, width, height
+
+def parse_tile_size(text):
+    """解析 --tiles 参数（WxH）"""
+    try:
+        width, height = (int(part) for part in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"图块尺寸格式应为 WxH: {text}")
+    if width < 1 or height < 1:
+        raise argparse.ArgumentTypeError(f"图块尺寸必须大于0: {text}")
+    return width, height
+
+def add_compress_argument(parser):
+    """添加压缩输出相关的命令行参数"""
+    parser.add_argument('--compress', choices=COMPRESSION_METHODS, default=None,
+                        help="输出压缩后的字节数组（rle: 游程编码，deflate: LZ77+霍夫曼），与 --binary 不能同时使用")
+
+def add_cache_arguments(parser):
+    """添加转换缓存相关的命令行参数"""
+    parser.add_argument('--cache', metavar='DIR', default=None,
+                        help="转换缓存目录，输入和选项都未变化时直接复用之前的输出")
+    parser.add_argument('--cache-size', metavar='MB', type=int, default=256,
+                        help="缓存大小上限，单位MB（默认 256）")
+
+def batch_main(argv):
+    """批量转换命令行入口"""
+    parser = argparse.ArgumentParser(
+        prog="bmp_to_rgb565_enhanced.py --batch",
+        description="批量转换目录或通配符匹配到的BMP文件"
+    )
+    parser.add_argument('inputs', nargs='+', help="输入目录、BMP文件或通配符（如 'assets/**/*.bmp'）")
+    parser.add_argument('-o', '--output-dir', required=True, help="输出目录")
+    parser.add_argument('-f', '--format', dest='output_format', default='RGB565',
+                        choices=OUTPUT_FORMATS, help="输出格式（默认 RGB565）")
+    parser.add_argument('-b', '--byte-order', default='little', type=str.lower,
+                        choices=['little', 'big'], help="字节顺序（默认 little）")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="并行进程数（默认CPU核数）")
+    parser.add_argument('--stream', action='store_true', help="使用流式转换")
+    parser.add_argument('--binary', action='store_true', help="输出 .bin 像素数据和精简头文件")
+    add_compress_argument(parser)
+    add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.compress and args.binary:
+        parser.error("--compress 不能与 --binary 同时使用")
+    cache = ConversionCache(args.cache, args.cache_size * 1024 * 1024) if args.cache else None
+    
+    def report(result):
+        input_file, output_file, success, message = result
         if success:
-            messagebox.showinfo("成功", message)
-            self.progress_var.set("转换完成")
+            print(f"[成功] {input_file} -> {output_file}")
+        else:
+            print(f"[失败] {input_file}: {message}")
+    
+    converter = BMPConverter()
+    results = converter.convert_batch(args.inputs, args.output_dir, args.output_format, args.byte_order,
+                                      args.jobs, args.stream, report, cache, args.binary, args.compress)
+    if not results:
+        print("错误: 没有找到任何BMP文件")
+        return 1
+    
+    failed = sum(1 for result in results if not result[2])
+    print(f"批量转换完成: 成功 {len(results) - failed} 个，失败 {failed} 个")
+    if cache is not None:
+        print(cache.summary())
+    return 1 if failed else 0
+
+def atlas_main(argv):
+    """图集打包命令行入口"""
+    parser = argparse.ArgumentParser(
+        prog="bmp_to_rgb565_enhanced.py --atlas",
+        description="把多个BMP打包为一个像素数组，并生成索引表和枚举常量"
+    )
+    parser.add_argument('inputs', nargs='+', help="输入目录、BMP文件或通配符")
+    parser.add_argument('-o', '--output', required=True, help="输出头文件")
+    parser.add_argument('-f', '--format', dest='output_format', default='RGB565',
+                        choices=['RGB565', 'RGB565_8BIT', 'RGB332', 'GRAY8'], help="输出格式（默认 RGB565）")
+    parser.add_argument('-b', '--byte-order', default='little', type=str.lower,
+                        choices=['little', 'big'], help="字节顺序（默认 little）")
+    parser.add_argument('--name', default='atlas', help="图集名称，用作数组和枚举前缀（默认 atlas）")
+    parser.add_argument('--tile', type=int, default=None, metavar='N', help="按 N×N 图块去重")
+    args = parser.parse_args(argv)
+    
+    if not args.name.isidentifier():
+        parser.error(f"图集名称必须是合法的C标识符: {args.name}")
+    
+    converter = BMPConverter()
+    success, message = converter.convert_atlas(args.inputs, args.output, args.output_format, args.byte_order,
+                                               args.name, args.tile)
+    if success:
+        print(message)
+        return 0
+    print(f"错误: {message}")
+    return 1
+
+def animation_main(argv):
+    """动画序列命令行入口"""
+    parser = argparse.ArgumentParser(
+        prog="bmp_to_rgb565_enhanced.py --animation",
+        description="把按顺序给出的动画帧转换为首帧完整数据加后续帧的变化区域"
+    )
+    parser.add_argument('inputs', nargs='+', help="按顺序给出的帧文件、目录或通配符（目录和通配符按文件名排序）")
+    parser.add_argument('-o', '--output', required=True, help="输出头文件")
+    parser.add_argument('-f', '--format', dest='output_format', default='RGB565',
+                        choices=['RGB565', 'RGB565_8BIT', 'RGB332', 'GRAY8'], help="输出格式（默认 RGB565）")
+    parser.add_argument('-b', '--byte-order', default='little', type=str.lower,
+                        choices=['little', 'big'], help="字节顺序（默认 little）")
+    parser.add_argument('--name', default='anim', help="动画名称，用作数组和宏前缀（默认 anim）")
+    parser.add_argument('--merge-gap', type=int, default=4, metavar='N',
+                        help="间隔不超过 N 个像素的变化合并到同一矩形（默认 4）")
+    args = parser.parse_args(argv)
+    
+    if not args.name.isidentifier():
+        parser.error(f"动画名称必须是合法的C标识符: {args.name}")
+    
+    converter = BMPConverter()
+    success, message = converter.convert_animation(args.inputs, args.output, args.output_format, args.byte_order,
+                                                   args.name, args.merge_gap)
+    if success:
+        print(message)
+        return 0
+    print(f"错误: {message}")
+    return 1
+
+def cli_main(argv):
+    """单文件转换命令行入口"""
+    parser = argparse.ArgumentParser(
+        prog="bmp_to_rgb565_enhanced.py",
+        description="将BMP文件转换为C数组。批量模式: bmp_to_rgb565_enhanced.py --batch ...，"
+                    "图集打包: bmp_to_rgb565_enhanced.py --atlas ...，"
+                    "动画序列: bmp_to_rgb565_enhanced.py --animation ...，"
+                    "监视模式: bmp_to_rgb565_enhanced.py --watch ..."
+    )
+    parser.add_argument('input_file', help="输入BMP文件")
+    parser.add_argument('output_file', help="输出文件")
+    parser.add_argument('output_format', nargs='?', default='RGB565',
+                        help="输出格式: RGB565 (默认), RGB565_8BIT, RGB332, GRAY8, "
+                             "INDEXED8/INDEXED4 (256/16色调色板 + 索引)")
+    parser.add_argument('byte_order', nargs='?', default='little',
+                        help="字节顺序: little (默认) 或 big (所有格式均支持字节序选择)")
+    parser.add_argument('--stream', action='store_true', help="流式转换，适合超大图像")
+    parser.add_argument('--binary', action='store_true',
+                        help="输出 .bin 像素数据（与输出文件同名）和精简头文件，代替C数组")
+    add_compress_argument(parser)
+    parser.add_argument('--crop', type=parse_crop, default=None, metavar='X,Y,W,H',
+                        help="只转换指定区域，只读取该区域所在的扫描行")
+    parser.add_argument('--tiles', type=parse_tile_size, default=None, metavar='WxH',
+                        help="按固定网格切分，每个图块输出一个数组（与 --crop/--binary/--compress 不能同时使用）")
+    add_cache_arguments(parser)
+    parser.add_argument('-j', '--jobs', nargs='?', type=int, const=0, default=1, metavar='N',
+                        help="大图按水平条带在 N 个进程中并行格式化（只写 -j 时使用全部CPU核），输出与单进程一致")
+    parser.add_argument('--parallel-threshold', type=float, default=None, metavar='MP',
+                        help="并行格式化的最小图像尺寸（百万像素，默认 4）")
+    parser.add_argument('--stats', nargs='?', const='table', choices=['table', 'json'], default=None,
+                        help="输出各阶段的耗时、像素数、写出字节数和峰值内存（table 表格或 json，默认 table）")
+    parser.add_argument('--stats-memory', action='store_true',
+                        help="同时统计各阶段的峰值内存（使用 tracemalloc，会使转换明显变慢）")
+    parser.add_argument('--stats-output', default=None, metavar='FILE',
+                        help="把 --stats 的结果写入文件而不是标准输出")
+    args = parser.parse_args(argv)
+    
+    input_file = args.input_file
+    output_file = args.output_file
+    output_format = args.output_format
+    byte_order = args.byte_order.lower()
+    
+    if output_format not in OUTPUT_FORMATS:
+        print(f"错误: format 必须是 {', '.join(OUTPUT_FORMATS)} 之一")
+        return 1
+    
+    if byte_order not in ['little', 'big']:
+        print("错误: byte_order 必须是 'little' 或 'big'")
+        return 1
+    
+    if args.compress and args.binary:
+        print("错误: --compress 不能与 --binary 同时使用")
+        return 1
+    
+    if args.tiles and (args.crop or args.binary or args.compress):
+        print("错误: --tiles 不能与 --crop、--binary 或 --compress 同时使用")
+        return 1
+    
+    if not os.path.exists(input_file):
+        print(f"错误: 输入文件 '{input_file}' 不存在")
+        return 1
+    
+    cache = None
+    cache_key = None
+    if args.cache:
+        cache = ConversionCache(args.cache, args.cache_size * 1024 * 1024)
+        cache_key = cache.make_key(input_file, output_format=output_format, byte_order=byte_order,
+                                   binary=args.binary, compression=args.compress, crop=args.crop, tiles=args.tiles)
+        if cache.fetch(cache_key, batch_output_files(output_file, args.binary)):
+            cache.save()
+            print(f"缓存命中: {output_file}")
+            print(cache.summary())
+            return 0
+    
+    jobs = args.jobs or os.cpu_count() or 1
+    stats = ConversionStats(args.stats_memory) if args.stats or args.stats_memory else None
+    converter = BMPConverter()
+    if args.parallel_threshold is not None:
+        converter.parallel_min_pixels = int(args.parallel_threshold * 1000 * 1000)
+    success, message = converter.convert_file(input_file, output_file, output_format, byte_order,
+                                              streaming=args.stream, binary=args.binary, compression=args.compress,
+                                              crop=args.crop, tiles=args.tiles, stats=stats, jobs=jobs)
+    
+    if stats is not None:
+        report = stats.to_json() if args.stats == 'json' else stats.format_table()
+        if args.stats_output:
+            with open(args.stats_output, 'w', encoding='utf-8') as f:
+                f.write(report + "\n")
         else:
-            messagebox.showerror("错误", message)
-            self.progress_var.set("转换失败")
+            print(report)
+    
+    if cache is not None and success:
+        cache.store(cache_key, batch_output_files(output_file, args.binary))
+        cache.save()
+    
+    if success:
+        print(message)
+        if cache is not None:
+            print(cache.summary())
+        return 0
+    else:
+        print(f"错误: {message}")
+        return 1
 
 def main():
     """主函数"""
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        # 批量模式
+        sys.exit(batch_main(sys.argv[2:]))
+    elif len(sys.argv) > 1 and sys.argv[1] == '--atlas':
+        # 图集打包模式
+        sys.exit(atlas_main(sys.argv[2:]))
+    elif len(sys.argv) > 1 and sys.argv[1] == '--animation':
+        # 动画序列模式
+        sys.exit(animation_main(sys.argv[2:]))
+    elif len(sys.argv) > 1 and sys.argv[1] == '--watch':
+        # 监视模式（保存后自动重新转换，在单独的模块中）
+        from bmp_to_rgb565_watch import watch_main
+        sys.exit(watch_main(sys.argv[2:]))
+    elif len(sys.argv) > 1:
         # 命令行模式
-        if len(sys.argv) < 3:
-            print("用法: python bmp_to_rgb565_enhanced.py input.bmp output.h [format] [byte_order]")
-            print("format 可选: RGB565 (默认), RGB565_8BIT, RGB332, GRAY8")
-            print("byte_order 可选: little (默认) 或 big (所有格式均支持字节序选择)")
-            sys.exit(1)
-        
-        input_file = sys.argv[1]
-        output_file = sys.argv[2]
-        output_format = 'RGB565'
-        byte_order = 'little'
-        
-        if len(sys.argv) > 3:
-            output_format = sys.argv[3]
-            if output_format not in ['RGB565', 'RGB565_8BIT', 'RGB332', 'GRAY8']:
-                print("错误: format 必须是 'RGB565', 'RGB565_8BIT', 'RGB332' 或 'GRAY8'")
-                sys.exit(1)
-        
-        if len(sys.argv) > 4:
-            byte_order = sys.argv[4].lower()
-            if byte_order not in ['little', 'big']:
-                print("错误: byte_order 必须是 'little' 或 'big'")
-                sys.exit(1)
-        
-        if not os.path.exists(input_file):
-            print(f"错误: 输入文件 '{input_file}' 不存在")
-            sys.exit(1)
-        
-        converter = BMPConverter()
-        success, message = converter.convert_bmp_to_array(input_file, output_file, output_format, byte_order)
-        
-        if success:
-            print(message)
-            sys.exit(0)
-        else:
-            print(f"错误: {message}")
-            sys.exit(1)
+        sys.exit(cli_main(sys.argv[1:]))
     else:
-        # GUI模式
-        root = tk.Tk()
-        app = BMPConverterGUI(root)
-        root.mainloop()
+        # GUI模式（图形界面在单独的模块中，命令行调用不会加载tkinter）
+        from bmp_to_rgb565_gui import main as gui_main
+        gui_main()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
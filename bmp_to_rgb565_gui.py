@@ -0,0 +1,280 @@
+import os
+import threading
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+
+from bmp_to_rgb565_enhanced import BMPConverter, ConversionCancelled, ProgressChannel
+
+class BMPConverterGUI:
+    # 界面线程读取进度队列的间隔（毫秒）
+    PROGRESS_POLL_MS = 50
+    
+    def __init__(self, root):
+        self.root = root
+        self.root.title("BMP转RGB565转换器")
+        self.root.geometry("600x500")
+        self.root.resizable(True, True)
+        # 设置窗口最小尺寸，防止界面元素被遮挡
+        self.root.minsize(600, 500)
+        
+        self.converter = BMPConverter()
+        self.input_file = ""
+        self.output_file = ""
+        # 正在进行的转换的进度通道，空闲时为None
+        self.progress_channel = None
+        
+        self.setup_ui()
+    
+    def setup_ui(self):
+        # 主框架
+        main_frame = ttk.Frame(self.root, padding="10")
+        main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        
+        # 配置网格权重
+        self.root.columnconfigure(0, weight=1)
+        self.root.rowconfigure(0, weight=1)
+        main_frame.columnconfigure(1, weight=1)
+        main_frame.rowconfigure(4, weight=1)  # 让文件信息栏可以垂直扩展
+        
+        # 输入文件选择
+        ttk.Label(main_frame, text="输入BMP文件:").grid(row=0, column=0, sticky=tk.W, pady=5)
+        self.input_var = tk.StringVar()
+        ttk.Entry(main_frame, textvariable=self.input_var, width=50).grid(row=0, column=1, sticky=(tk.W, tk.E), padx=5)
+        ttk.Button(main_frame, text="浏览", command=self.browse_input).grid(row=0, column=2, padx=5)
+        
+        # 输出文件选择
+        ttk.Label(main_frame, text="输出文件:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.output_var = tk.StringVar()
+        ttk.Entry(main_frame, textvariable=self.output_var, width=50).grid(row=1, column=1, sticky=(tk.W, tk.E), padx=5)
+        ttk.Button(main_frame, text="浏览", command=self.browse_output).grid(row=1, column=2, padx=5)
+        
+        # 输出格式选择
+        ttk.Label(main_frame, text="输出格式:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        self.output_format_var = tk.StringVar(value="RGB565")
+        self.display_format_var = tk.StringVar(value="RGB565 (16位)")
+        format_options = [
+            ("RGB565 (16位)", "RGB565"),
+            ("RGB565 (8位字节)", "RGB565_8BIT"),
+            ("RGB332 (8位)", "RGB332"),
+            ("灰度 (8位)", "GRAY8"),
+            ("索引色 (256色调色板)", "INDEXED8"),
+            ("索引色 (16色调色板)", "INDEXED4")
+        ]
+        self.format_combobox = ttk.Combobox(main_frame, textvariable=self.display_format_var, 
+                                           values=[option[0] for option in format_options], 
+                                           state="readonly", width=20)
+        self.format_combobox.grid(row=2, column=1, sticky=tk.W, pady=5, padx=5)
+        self.format_combobox.bind('<<ComboboxSelected>>', self.on_format_change)
+        
+        # 创建格式映射字典
+        self.format_mapping = {option[0]: option[1] for option in format_options}
+        self.reverse_format_mapping = {option[1]: option[0] for option in format_options}
+        self.format_combobox.set("RGB565 (16位)")
+        
+        # 字节顺序选择
+        ttk.Label(main_frame, text="字节顺序:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        self.byte_order_var = tk.StringVar(value="little")
+        self.byte_order_frame = ttk.Frame(main_frame)
+        self.byte_order_frame.grid(row=3, column=1, sticky=tk.W, pady=5)
+        self.byte_order_little = ttk.Radiobutton(self.byte_order_frame, text="小端序 (Little)", variable=self.byte_order_var, value="little")
+        self.byte_order_little.pack(side=tk.LEFT)
+        self.byte_order_big = ttk.Radiobutton(self.byte_order_frame, text="大端序 (Big)", variable=self.byte_order_var, value="big")
+        self.byte_order_big.pack(side=tk.LEFT, padx=10)
+        
+        # 文件信息显示
+        info_frame = ttk.LabelFrame(main_frame, text="文件信息", padding="5")
+        info_frame.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=10)
+        info_frame.columnconfigure(0, weight=1)
+        info_frame.rowconfigure(0, weight=1)  # 让文本框可以垂直扩展
+        
+        self.info_text = tk.Text(info_frame, height=6, width=70)
+        info_scrollbar = ttk.Scrollbar(info_frame, orient="vertical", command=self.info_text.yview)
+        self.info_text.configure(yscrollcommand=info_scrollbar.set)
+        self.info_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        info_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        
+        # 转换按钮
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=5, column=0, columnspan=3, pady=10)
+        self.start_button = ttk.Button(button_frame, text="开始转换", command=self.start_conversion)
+        self.start_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(button_frame, text="取消", command=self.cancel_conversion, state='disabled')
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="清除信息", command=self.clear_info).pack(side=tk.LEFT, padx=5)
+        
+        # 进度条
+        self.progress_var = tk.StringVar(value="就绪")
+        ttk.Label(main_frame, textvariable=self.progress_var).grid(row=6, column=0, columnspan=3, pady=5)
+        
+        self.progress_bar = ttk.Progressbar(main_frame, mode='determinate', maximum=100)
+        self.progress_bar.grid(row=7, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=5)
+        
+        # 开源协议信息
+        license_frame = ttk.Frame(main_frame)
+        license_frame.grid(row=8, column=0, columnspan=3, pady=5)
+        license_text = "本软件采用 MIT 开源许可证发布，允许任何人自由使用、修改和分发，前提是保留原始的版权声明和许可声明。"
+        ttk.Label(license_frame, text=license_text, font=('Arial', 8), foreground='gray').pack()
+    
+    def on_format_change(self, event=None):
+        """当输出格式改变时的处理"""
+        # 获取实际的格式值
+        display_format = self.format_combobox.get()
+        actual_format = self.format_mapping.get(display_format, "RGB565")
+        self.output_format_var.set(actual_format)
+        
+        # 所有格式都支持字节顺序选择
+        self.byte_order_little.config(state='normal')
+        self.byte_order_big.config(state='normal')
+    
+    def browse_input(self):
+        filename = filedialog.askopenfilename(
+            title="选择BMP文件",
+            filetypes=[("BMP文件", "*.bmp"), ("所有文件", "*.*")]
+        )
+        if filename:
+            self.input_var.set(filename)
+            self.analyze_input_file(filename)
+    
+    def browse_output(self):
+        filename = filedialog.asksaveasfilename(
+            title="保存为",
+            defaultextension=".h",
+            filetypes=[("C头文件", "*.h"), ("文本文件", "*.txt"), ("所有文件", "*.*")]
+        )
+        if filename:
+            self.output_var.set(filename)
+    
+    def analyze_input_file(self, filename):
+        """分析输入文件并显示信息"""
+        info, error = self.converter.detect_bmp_format(filename)
+        
+        self.info_text.delete(1.0, tk.END)
+        
+        if error:
+            self.info_text.insert(tk.END, f"错误: {error}\n")
+        else:
+            self.info_text.insert(tk.END, f"文件路径: {filename}\n")
+            self.info_text.insert(tk.END, f"图像尺寸: {info['width']} × {info['height']}\n")
+            self.info_text.insert(tk.END, f"位深度: {info['bpp']} 位\n")
+            self.info_text.insert(tk.END, f"压缩方式: {info['compression']}\n")
+            self.info_text.insert(tk.END, f"文件大小: {info['file_size']:,} 字节\n")
+            self.info_text.insert(tk.END, f"像素总数: {info['width'] * info['height']:,}\n")
+            
+            # 自动设置输出文件名
+            if not self.output_var.get():
+                base_name = os.path.splitext(os.path.basename(filename))[0]
+                format_suffix = self.output_format_var.get().lower()
+                output_name = f"{base_name}_{format_suffix}.h"
+                output_path = os.path.join(os.path.dirname(filename), output_name)
+                self.output_var.set(output_path)
+    
+    def clear_info(self):
+        self.info_text.delete(1.0, tk.END)
+        if self.progress_channel is None:
+            self.progress_var.set("就绪")
+            self.progress_bar['value'] = 0
+    
+    def poll_progress(self):
+        """在界面线程中定时取出进度事件并更新界面"""
+        channel = self.progress_channel
+        if channel is None:
+            return
+        
+        for event in channel.drain():
+            if event[0] == 'done':
+                self.conversion_complete(event[1], event[2])
+                return
+            message = event[1]
+            percent = getattr(message, 'percent', None)
+            if percent is not None:
+                self.progress_bar['value'] = percent
+            if not channel.cancelled:
+                self.progress_var.set(message)
+        
+        self.root.after(self.PROGRESS_POLL_MS, self.poll_progress)
+    
+    def start_conversion(self):
+        """开始转换过程"""
+        input_file = self.input_var.get().strip()
+        output_file = self.output_var.get().strip()
+        
+        if not input_file:
+            messagebox.showerror("错误", "请选择输入文件")
+            return
+        
+        if not output_file:
+            messagebox.showerror("错误", "请指定输出文件")
+            return
+        
+        if not os.path.exists(input_file):
+            messagebox.showerror("错误", "输入文件不存在")
+            return
+        
+        if self.progress_channel is not None:
+            return
+        
+        # 界面控件只在主线程中读取，转换线程只通过进度通道通信
+        output_format = self.output_format_var.get()
+        # 直接从单选按钮获取字节序值
+        byte_order = self.byte_order_var.get()
+        
+        self.progress_channel = ProgressChannel()
+        self.progress_bar['value'] = 0
+        self.progress_var.set("正在转换...")
+        self.start_button.config(state='disabled')
+        self.cancel_button.config(state='normal')
+        
+        # 在新线程中执行转换
+        thread = threading.Thread(target=self.conversion_thread,
+                                  args=(self.progress_channel, input_file, output_file, output_format, byte_order))
+        thread.daemon = True
+        thread.start()
+        self.root.after(self.PROGRESS_POLL_MS, self.poll_progress)
+    
+    def cancel_conversion(self):
+        """请求取消正在进行的转换，转换线程会在下一次报告进度时停止"""
+        if self.progress_channel is not None:
+            self.progress_channel.cancel()
+            self.cancel_button.config(state='disabled')
+            self.progress_var.set("正在取消...")
+    
+    def conversion_thread(self, channel, input_file, output_file, output_format, byte_order):
+        """转换线程"""
+        try:
+            success, message = self.converter.convert_bmp_to_array(
+                input_file, output_file, output_format, byte_order, channel
+            )
+        except ConversionCancelled:
+            success, message = False, "转换已取消"
+        except Exception as e:
+            success, message = False, f"转换过程中发生错误: {str(e)}"
+        
+        # 由界面线程取出结束事件后更新UI
+        channel.finish(success, message)
+    
+    def conversion_complete(self, success, message):
+        """转换完成回调"""
+        cancelled = self.progress_channel.cancelled
+        self.progress_channel = None
+        self.start_button.config(state='normal')
+        self.cancel_button.config(state='disabled')
+        
+        if success:
+            self.progress_bar['value'] = 100
+            messagebox.showinfo("成功", message)
+            self.progress_var.set("转换完成")
+        elif cancelled:
+            self.progress_bar['value'] = 0
+            self.progress_var.set("转换已取消")
+        else:
+            messagebox.showerror("错误", message)
+            self.progress_var.set("转换失败")
+
+def main():
+    """图形界面入口"""
+    root = tk.Tk()
+    app = BMPConverterGUI(root)
+    root.mainloop()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
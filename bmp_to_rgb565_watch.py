@@ -0,0 +1,269 @@
+"""
+BMP转换监视模式
+轮询监视目录中BMP文件的修改时间和大小，文件保存后只重新转换有变化的文件，
+不依赖任何外部服务。连续的多次写入在去抖时间内合并为一次转换，转换在常驻的工作进程池中执行，
+每次变化都会记录从检测到写出头文件的延迟。
+
+每个监视目录可以放置一个配置文件 bmp2rgb565.json，内容为 convert_bmp_to_array 的选项:
+    {"output_dir": "generated", "output_format": "RGB565", "byte_order": "little",
+     "values_per_line": 16, "hex_prefix": "0x"}
+output_dir 相对于监视目录（默认为监视目录本身），子目录结构和输出文件名与批量模式一致
+（<文件名>_<格式>.h）。修改配置文件后该目录中的所有BMP会重新转换。
+
+用法:
+    python bmp_to_rgb565_watch.py DIR [DIR ...] [-j N] [--interval 秒] [--debounce 秒]
+    python bmp_to_rgb565_enhanced.py --watch DIR [DIR ...]
+
+启动时输出已是最新（比BMP和配置文件都新）的文件不会重新转换。按 Ctrl+C 停止。
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+
+from bmp_to_rgb565_enhanced import OUTPUT_FORMATS, expand_batch_inputs, init_conversion_worker, run_conversion_job
+
+# 每个监视目录中的配置文件名
+CONFIG_FILE_NAME = 'bmp2rgb565.json'
+
+# 配置文件中除 output_dir 外可用的选项（均传给 convert_bmp_to_array）
+CONFIG_OPTIONS = ('output_format', 'byte_order', 'values_per_line', 'hex_prefix')
+
+
+def file_signature(path):
+    """返回文件的 (修改时间纳秒, 大小)，文件不存在时返回None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def load_watch_config(directory):
+    """读取监视目录的配置文件，返回 ((输出目录, 转换选项), 错误信息)
+
+    没有配置文件时使用默认选项，输出到监视目录本身。
+    """
+    config_file = os.path.join(directory, CONFIG_FILE_NAME)
+    config = {}
+    if os.path.exists(config_file):
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            return None, f"读取配置文件失败 {config_file}: {str(e)}"
+        if not isinstance(config, dict):
+            return None, f"配置文件应为JSON对象: {config_file}"
+
+    unknown = sorted(set(config) - set(CONFIG_OPTIONS) - {'output_dir'})
+    if unknown:
+        return None, f"配置文件中有未知选项 {config_file}: {', '.join(unknown)}"
+
+    options = {key: config[key] for key in CONFIG_OPTIONS if key in config}
+    options.setdefault('output_format', 'RGB565')
+    options.setdefault('byte_order', 'little')
+    if options['output_format'] not in OUTPUT_FORMATS:
+        return None, f"不支持的输出格式 {config_file}: {options['output_format']}"
+    if options['byte_order'] not in ('little', 'big'):
+        return None, f"字节顺序必须是 little 或 big {config_file}: {options['byte_order']}"
+    values_per_line = options.get('values_per_line')
+    if values_per_line is not None and (not isinstance(values_per_line, int) or values_per_line < 1):
+        return None, f"values_per_line 必须是正整数 {config_file}: {values_per_line}"
+    if options.get('hex_prefix') not in (None, '0x', '0X'):
+        return None, f"hex_prefix 必须是 '0x' 或 '0X' {config_file}: {options['hex_prefix']}"
+
+    output_dir = os.path.normpath(os.path.join(directory, config.get('output_dir', '.')))
+    return (output_dir, options), None
+
+
+class WatchedDirectory:
+    """一个监视目录的状态：当前配置、已转换的文件签名和等待去抖的变化"""
+
+    def __init__(self, root):
+        self.root = root
+        self.config = None
+        self.config_signature = ()
+        # 输入文件 -> 最近一次提交转换时的文件签名
+        self.converted = {}
+        # 输入文件 -> {'signature', 'settle_at', 'detected', 'modified'}，签名稳定到 settle_at 后才转换
+        self.pending = {}
+
+    def reload_config(self, log):
+        """配置文件有变化时重新读取，返回配置是否可用"""
+        signature = file_signature(os.path.join(self.root, CONFIG_FILE_NAME))
+        if signature == self.config_signature:
+            return self.config is not None
+        first_load = self.config_signature == ()
+        self.config_signature = signature
+        self.config, error = load_watch_config(self.root)
+        # 配置变化后所有输出都可能不同，重新检查每个文件（输出比新配置旧时会被转换）
+        self.converted.clear()
+        if error:
+            log(f"[配置错误] {error}")
+        elif not first_load:
+            log(f"[配置] 已重新读取 {os.path.join(self.root, CONFIG_FILE_NAME)}")
+        return self.config is not None
+
+    def is_up_to_date(self, input_file, output_file, signature):
+        """输出文件是否比输入文件和配置文件都新（用于首次看到某个文件时跳过转换）"""
+        output_signature = file_signature(output_file)
+        if output_signature is None:
+            return False
+        config_mtime = self.config_signature[0] if self.config_signature else 0
+        return output_signature[0] >= max(signature[0], config_mtime)
+
+    def poll(self, debounce, log, busy):
+        """扫描一次目录，返回已经稳定、可以转换的 [(输入文件, 输出文件, 选项, 变化信息), ...]
+
+        busy 为正在转换中的输入文件集合，这些文件等本次转换完成后再处理。
+        """
+        if not self.reload_config(log):
+            return []
+        output_dir, options = self.config
+        now = time.time()
+        ready = []
+        seen = set()
+        for input_file, output_file in expand_batch_inputs([self.root], output_dir, options['output_format']):
+            seen.add(input_file)
+            signature = file_signature(input_file)
+            if signature is None or signature == self.converted.get(input_file):
+                self.pending.pop(input_file, None)
+                continue
+            if input_file not in self.converted and input_file not in self.pending and \
+                    self.is_up_to_date(input_file, output_file, signature):
+                self.converted[input_file] = signature
+                continue
+
+            change = self.pending.get(input_file)
+            if change is None or change['signature'] != signature:
+                # 每次写入都会推后修改时间，连续写入时 settle_at 随之推后；
+                # 修改时间早于检测时刻时（如复制时保留了时间）以检测时刻为准
+                change = {
+                    'signature': signature,
+                    'settle_at': min(signature[0] / 1e9, now) + debounce,
+                    'detected': change['detected'] if change else time.perf_counter(),
+                    # 已转换过的文件被修改（而不是启动或配置变化时的首次转换）
+                    'modified': change['modified'] if change else input_file in self.converted,
+                }
+                self.pending[input_file] = change
+            if now >= change['settle_at'] and input_file not in busy:
+                del self.pending[input_file]
+                self.converted[input_file] = signature
+                ready.append((input_file, output_file, dict(options), change))
+
+        # 已删除的文件不再跟踪
+        for input_file in list(self.converted):
+            if input_file not in seen:
+                del self.converted[input_file]
+        for input_file in list(self.pending):
+            if input_file not in seen:
+                del self.pending[input_file]
+        return ready
+
+
+class BMPWatcher:
+    """轮询多个目录，把变化的BMP提交到工作进程池转换并记录延迟"""
+
+    def __init__(self, directories, jobs=None, interval=0.1, debounce=0.1, log=print):
+        self.directories = [WatchedDirectory(directory) for directory in directories]
+        self.jobs = jobs or os.cpu_count() or 1
+        self.interval = interval
+        self.debounce = debounce
+        self.log = log
+        # 正在执行的转换: future -> (输入文件, 输出文件, 变化信息)
+        self.in_flight = {}
+        self.completed = 0
+        self.failed = 0
+        self.total_latency = 0.0
+
+    def submit_ready(self, executor):
+        """扫描所有目录，把已稳定的变化提交到进程池"""
+        busy = {input_file for input_file, _, _ in self.in_flight.values()}
+        for directory in self.directories:
+            for input_file, output_file, options, change in directory.poll(self.debounce, self.log, busy):
+                future = executor.submit(run_conversion_job, input_file, output_file, options, 'convert_bmp_to_array')
+                self.in_flight[future] = (input_file, output_file, change)
+
+    def report(self, future):
+        """记录一次转换的结果和延迟"""
+        input_file, output_file, change = self.in_flight.pop(future)
+        try:
+            success, message, seconds = future.result()
+        except Exception as e:
+            success, message, seconds = False, f"工作进程错误: {str(e)}", 0.0
+        latency = time.perf_counter() - change['detected']
+        timing = f"转换 {seconds * 1000:.0f} ms，检测后 {latency * 1000:.0f} ms"
+        if change['modified']:
+            timing += f"，保存后 {(time.time() - change['signature'][0] / 1e9) * 1000:.0f} ms"
+        stamp = time.strftime('%H:%M:%S')
+        if success:
+            self.completed += 1
+            self.total_latency += latency
+            self.log(f"{stamp} [成功] {input_file} -> {output_file}（{timing}）")
+        else:
+            self.failed += 1
+            self.log(f"{stamp} [失败] {input_file}: {message}")
+
+    def summary(self):
+        """返回本次监视的汇总信息"""
+        average = self.total_latency / self.completed * 1000 if self.completed else 0.0
+        return f"监视结束: 转换 {self.completed} 次，失败 {self.failed} 次，平均延迟 {average:.0f} ms"
+
+    def run(self):
+        """持续监视直到收到 Ctrl+C 或 SIGTERM"""
+        from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+        for directory in self.directories:
+            self.log(f"监视目录: {directory.root}")
+        self.log(f"工作进程 {self.jobs} 个，轮询间隔 {self.interval * 1000:.0f} ms，去抖 {self.debounce * 1000:.0f} ms")
+        executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=init_conversion_worker)
+        try:
+            while True:
+                self.submit_ready(executor)
+                if self.in_flight:
+                    # 有转换在执行时，完成后立即记录，不必等满一个轮询间隔
+                    done, _ = wait(list(self.in_flight), timeout=self.interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self.report(future)
+                else:
+                    time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self.log(self.summary())
+        return 1 if self.failed else 0
+
+
+def watch_main(argv):
+    """监视模式命令行入口"""
+    parser = argparse.ArgumentParser(
+        prog="bmp_to_rgb565_enhanced.py --watch",
+        description=f"监视目录中的BMP文件，保存后自动重新转换（每个目录的选项来自 {CONFIG_FILE_NAME}）"
+    )
+    parser.add_argument('directories', nargs='+', help="要监视的目录（递归查找 .bmp 文件）")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="工作进程数（默认CPU核数）")
+    parser.add_argument('--interval', type=float, default=0.1, metavar='秒', help="轮询间隔（默认 0.1 秒）")
+    parser.add_argument('--debounce', type=float, default=0.1, metavar='秒',
+                        help="文件最后一次写入后等待的时间，期间的连续写入合并为一次转换（默认 0.1 秒）")
+    args = parser.parse_args(argv)
+
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            print(f"错误: 目录 '{directory}' 不存在")
+            return 1
+    if args.interval <= 0 or args.debounce < 0:
+        parser.error("--interval 必须大于0，--debounce 不能为负数")
+
+    # SIGTERM 与 Ctrl+C 一样正常停止，等待工作进程退出
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    sys.stdout.reconfigure(line_buffering=True)
+    watcher = BMPWatcher(args.directories, args.jobs, args.interval, args.debounce)
+    return watcher.run()
+
+
+if __name__ == "__main__":
+    sys.exit(watch_main(sys.argv[1:]))
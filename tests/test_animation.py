@@ -0,0 +1,98 @@
+"""动画序列测试：按输出的帧表和脏矩形依次绘制，应还原出每一帧"""
+
+import re
+
+import numpy as np
+import pytest
+
+from bmp_benchmark import encode_bmp
+from bmp_to_rgb565_enhanced import BMPConverter
+
+
+def write_bmp(path, rgb):
+    with open(path, 'wb') as f:
+        f.write(encode_bmp(rgb, 24))
+    return path
+
+
+def parse_array(text, name):
+    match = re.search(rf"const \w+ {name}\[(\d+)\] = \{{(.*?)\}};", text, re.S)
+    body = re.sub(r"//[^\n]*", "", match.group(2))
+    return [int(token, 0) for token in re.findall(r"0x[0-9A-Fa-f]+|\d+", body)], int(match.group(1))
+
+
+@pytest.fixture
+def frames(tmp_path):
+    """8帧：移动的方块、两处相距较远的变化、一帧无变化"""
+    rng = np.random.default_rng(12)
+    background = rng.integers(0, 256, size=(24, 32, 3), dtype=np.uint8)
+    images = []
+    for i in range(6):
+        frame = background.copy()
+        frame[4 + i:10 + i, 2 + 3 * i:8 + 3 * i] = (255, 255 - 40 * i, 0)
+        if i % 2:
+            frame[20:23, 28:31] = rng.integers(0, 256, size=(3, 3, 3), dtype=np.uint8)
+        images.append(frame)
+    images.append(images[-1])
+    images.append(background)
+    paths = []
+    for i, image in enumerate(images):
+        paths.append(write_bmp(str(tmp_path / f"frame_{i:02d}.bmp"), image))
+    return paths
+
+
+@pytest.mark.parametrize('merge_gap', [0, 4])
+def test_dirty_rect_replay_reproduces_frames(tmp_path, frames, merge_gap):
+    output_file = str(tmp_path / 'anim.h')
+    converter = BMPConverter()
+    success, message = converter.convert_animation(frames, output_file, merge_gap=merge_gap)
+    assert success, message
+    with open(output_file, encoding='utf-8') as f:
+        text = f.read()
+
+    frame_table, frame_count = parse_array(text, 'anim_frames')
+    rect_table, _ = parse_array(text, 'anim_rects')
+    pixels, pixel_count = parse_array(text, 'anim_pixels')
+    assert frame_count == len(frames)
+    assert len(pixels) == pixel_count
+    frame_table = np.array(frame_table).reshape(-1, 2)
+    rect_table = np.array(rect_table).reshape(-1, 5)
+    pixels = np.array(pixels, dtype=np.uint16)
+
+    # 首帧是完整的一个矩形，无变化的帧没有矩形
+    assert frame_table[0].tolist() == [0, 1]
+    assert rect_table[0].tolist() == [0, 0, 32, 24, 0]
+    assert frame_table[6][1] == 0
+
+    canvas = np.zeros((24, 32), dtype=np.uint16)
+    for frame_path, (first_rect, rect_count) in zip(frames, frame_table):
+        for x, y, width, height, offset in rect_table[first_rect:first_rect + rect_count]:
+            canvas[y:y + height, x:x + width] = pixels[offset:offset + width * height].reshape(height, width)
+        image, error = converter.convert_image(frame_path)
+        assert error is None
+        assert canvas.tolist() == image.values.tolist()
+
+
+def test_merge_gap_joins_nearby_changes(tmp_path):
+    background = np.zeros((8, 20, 3), dtype=np.uint8)
+    changed = background.copy()
+    changed[2, 3] = changed[2, 6] = (255, 0, 0)
+    paths = [write_bmp(str(tmp_path / 'a.bmp'), background), write_bmp(str(tmp_path / 'b.bmp'), changed)]
+    converter = BMPConverter()
+
+    for merge_gap, rect_count in ((0, 2), (2, 1)):
+        output_file = str(tmp_path / f"anim_{merge_gap}.h")
+        assert converter.convert_animation(paths, output_file, merge_gap=merge_gap)[0]
+        with open(output_file, encoding='utf-8') as f:
+            frame_table, _ = parse_array(f.read(), 'anim_frames')
+        assert frame_table[3] == rect_count
+
+
+def test_mismatched_frame_size_is_rejected(tmp_path):
+    first = write_bmp(str(tmp_path / 'a.bmp'), np.zeros((6, 9, 3), dtype=np.uint8))
+    second = write_bmp(str(tmp_path / 'b.bmp'), np.zeros((6, 8, 3), dtype=np.uint8))
+    output_file = tmp_path / 'anim.h'
+    success, message = BMPConverter().convert_animation([first, second], str(output_file))
+    assert not success
+    assert "不一致" in message
+    assert not output_file.exists()
@@ -0,0 +1,91 @@
+"""精灵图集打包测试：按输出的索引表取回每个精灵，应与单独转换的结果一致"""
+
+import re
+
+import numpy as np
+import pytest
+
+from bmp_benchmark import encode_bmp
+from bmp_to_rgb565_enhanced import BMPConverter
+
+
+def write_bmp(path, rgb):
+    with open(path, 'wb') as f:
+        f.write(encode_bmp(rgb, 24))
+    return path
+
+
+@pytest.fixture
+def sprite_dir(tmp_path):
+    """a 与 b 内容相同，c 尺寸不同，d 由重复的 4×4 图块组成"""
+    rng = np.random.default_rng(10)
+    directory = tmp_path / 'sprites'
+    directory.mkdir()
+    shared = rng.integers(0, 256, size=(6, 5, 3), dtype=np.uint8)
+    write_bmp(str(directory / 'a.bmp'), shared)
+    write_bmp(str(directory / 'b.bmp'), shared)
+    write_bmp(str(directory / 'c.bmp'), rng.integers(0, 256, size=(3, 7, 3), dtype=np.uint8))
+    tile = rng.integers(0, 256, size=(4, 4, 3), dtype=np.uint8)
+    write_bmp(str(directory / 'd.bmp'), np.tile(tile, (2, 3, 1)))
+    return directory
+
+
+def parse_array(text, name):
+    match = re.search(rf"const \w+ {name}\[(\d+)\] = \{{(.*?)\}};", text, re.S)
+    body = re.sub(r"//[^\n]*", "", match.group(2))
+    values = [int(token, 0) for token in re.findall(r"0x[0-9A-Fa-f]+|\d+", body)]
+    assert len(values) == int(match.group(1))
+    return values
+
+
+def parse_index(text):
+    """返回 {枚举名: (偏移, 宽, 高)}"""
+    return {name: (int(offset), int(width), int(height))
+            for offset, width, height, name in re.findall(r"\{(\d+), (\d+), (\d+)\}, // (\w+)", text)}
+
+
+def sprite_values(directory, name):
+    image, error = BMPConverter().convert_image(str(directory / f"{name}.bmp"))
+    assert error is None
+    return image.values
+
+
+def test_atlas_offsets_and_dedup(tmp_path, sprite_dir):
+    output_file = str(tmp_path / 'atlas.h')
+    success, message = BMPConverter().convert_atlas([str(sprite_dir)], output_file)
+    assert success, message
+    assert "去重后 3 份像素数据" in message
+    with open(output_file, encoding='utf-8') as f:
+        text = f.read()
+
+    index = parse_index(text)
+    pixels = np.array(parse_array(text, 'atlas_pixels'), dtype=np.uint16)
+    assert index['ATLAS_A'] == index['ATLAS_B']
+    assert len({offset for offset, _, _ in index.values()}) == 3
+    assert len(pixels) == 6 * 5 + 3 * 7 + 8 * 12
+    for name, (offset, width, height) in index.items():
+        expected = sprite_values(sprite_dir, name[len('ATLAS_'):].lower())
+        assert pixels[offset:offset + width * height].reshape(height, width).tolist() == expected.tolist()
+
+
+def test_atlas_tiles_dedup(tmp_path, sprite_dir):
+    output_file = str(tmp_path / 'atlas.h')
+    success, message = BMPConverter().convert_atlas([str(sprite_dir / 'd.bmp'), str(sprite_dir / 'c.bmp')],
+                                                   output_file, tile_size=4)
+    assert success, message
+    with open(output_file, encoding='utf-8') as f:
+        text = f.read()
+
+    tile_map = parse_array(text, 'atlas_tile_map')
+    tiles = np.array(parse_array(text, 'atlas_tiles'), dtype=np.uint16).reshape(-1, 4, 4)
+    # d 的 2×3 个图块完全相同，c（3×7）占 1×2 个补零的图块
+    assert tile_map[:6] == [0] * 6
+    assert len(tiles) == 3
+    assert "去重后 3 个图块" in message
+
+    for name, (offset, width, height) in parse_index(text).items():
+        rows, cols = -(-height // 4), -(-width // 4)
+        grid = [tiles[tile_map[offset + row * cols + col]] for row in range(rows) for col in range(cols)]
+        sprite = np.block([[grid[row * cols + col] for col in range(cols)] for row in range(rows)])
+        expected = sprite_values(sprite_dir, name[len('ATLAS_'):].lower())
+        assert sprite[:height, :width].tolist() == expected.tolist()
@@ -0,0 +1,94 @@
+"""写出中途失败时不应留下只写了一半的输出文件"""
+
+import os
+
+import numpy as np
+import pytest
+
+import bmp_to_rgb565_enhanced
+from bmp_benchmark import encode_bmp
+from bmp_to_rgb565_enhanced import BMPConverter, CArrayEmitter, binary_output_path
+
+
+@pytest.fixture
+def bmp_file(tmp_path):
+    rgb = np.random.default_rng(15).integers(0, 256, size=(6, 9, 3), dtype=np.uint8)
+    path = str(tmp_path / 'image.bmp')
+    with open(path, 'wb') as f:
+        f.write(encode_bmp(rgb, 24))
+    return path
+
+
+def interrupted_write(out_f, *args, **kwargs):
+    """写出部分内容后失败，模拟磁盘已满或转换被取消"""
+    out_f.write("partial")
+    raise RuntimeError("写出中断")
+
+
+def write_previous_outputs(paths):
+    for path in paths:
+        with open(path, 'w') as f:
+            f.write("previous")
+
+
+def assert_previous_outputs_kept(tmp_path, paths):
+    for path in paths:
+        with open(path) as f:
+            assert f.read() == "previous"
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.part')]
+
+
+def test_binary_header_failure_keeps_previous_output(tmp_path, monkeypatch, bmp_file):
+    output_file = str(tmp_path / 'image.h')
+    write_previous_outputs([output_file])
+    monkeypatch.setattr(CArrayEmitter, 'write_extern_header',
+                        lambda self, out_f, *args: interrupted_write(out_f))
+    success, message = BMPConverter().convert_bmp_to_binary(bmp_file, output_file)
+    assert not success
+    assert "写出中断" in message
+    assert_previous_outputs_kept(tmp_path, [output_file])
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_binary_data_failure_keeps_previous_output(tmp_path, monkeypatch, bmp_file, streaming):
+    output_file = str(tmp_path / 'image.h')
+    binary_file = binary_output_path(output_file)
+    write_previous_outputs([output_file, binary_file])
+
+    def failing_bytes(values, output_format):
+        raise RuntimeError("写出中断")
+    monkeypatch.setattr(BMPConverter, 'pixel_values_to_bytes', staticmethod(failing_bytes))
+    success, message = BMPConverter().convert_bmp_to_binary(bmp_file, output_file, streaming=streaming)
+    assert not success
+    assert_previous_outputs_kept(tmp_path, [output_file, binary_file])
+
+
+@pytest.mark.parametrize('compression', ['rle', 'deflate'])
+def test_compressed_failure_keeps_previous_output(tmp_path, monkeypatch, bmp_file, compression):
+    output_file = str(tmp_path / 'image.h')
+    write_previous_outputs([output_file])
+    monkeypatch.setattr(CArrayEmitter, 'write_rows', lambda self, out_f, *args: interrupted_write(out_f))
+    success, message = BMPConverter().convert_bmp_compressed(bmp_file, output_file, compression=compression)
+    assert not success
+    assert "写出中断" in message
+    assert_previous_outputs_kept(tmp_path, [output_file])
+
+
+def test_atlas_failure_keeps_previous_output(tmp_path, monkeypatch, bmp_file):
+    output_file = str(tmp_path / 'atlas.h')
+    write_previous_outputs([output_file])
+    monkeypatch.setattr(bmp_to_rgb565_enhanced, 'write_atlas', interrupted_write)
+    success, message = BMPConverter().convert_atlas([bmp_file], output_file)
+    assert not success
+    assert "写出中断" in message
+    assert_previous_outputs_kept(tmp_path, [output_file])
+
+
+def test_animation_failure_keeps_previous_output(tmp_path, monkeypatch, bmp_file):
+    output_file = str(tmp_path / 'anim.h')
+    write_previous_outputs([output_file])
+    monkeypatch.setattr(bmp_to_rgb565_enhanced, 'write_animation', interrupted_write)
+    success, message = BMPConverter().convert_animation([bmp_file, bmp_file], output_file)
+    assert not success
+    assert "写出中断" in message
+    assert_previous_outputs_kept(tmp_path, [output_file])
@@ -0,0 +1,59 @@
+"""批量模式的输入展开和输出命名测试"""
+
+import os
+
+import numpy as np
+
+from bmp_benchmark import encode_bmp
+from bmp_to_rgb565_enhanced import BMPConverter, atomic_output, expand_batch_inputs, glob_root
+
+
+def write_bmp(path, value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rgb = np.full((2, 3, 3), value, dtype=np.uint8)
+    with open(path, 'wb') as f:
+        f.write(encode_bmp(rgb, 24))
+
+
+def test_glob_root():
+    assert glob_root(os.path.join('assets', '**', '*.bmp')) == 'assets'
+    assert glob_root('*.bmp') == '.'
+    assert glob_root(os.path.join(os.sep + 'data', 'a*', 'x.bmp')) == os.sep + 'data'
+
+
+def test_glob_keeps_subdirectories(tmp_path):
+    write_bmp(str(tmp_path / 'g' / 'a' / 'icon.bmp'), 10)
+    write_bmp(str(tmp_path / 'g' / 'b' / 'icon.bmp'), 200)
+    out_dir = str(tmp_path / 'out')
+
+    pairs = expand_batch_inputs([str(tmp_path / 'g' / '**' / '*.bmp')], out_dir)
+    assert sorted(output for _, output in pairs) == [
+        os.path.join(out_dir, 'a', 'icon_rgb565.h'),
+        os.path.join(out_dir, 'b', 'icon_rgb565.h'),
+    ]
+
+    results = BMPConverter().convert_batch([str(tmp_path / 'g' / '**' / '*.bmp')], out_dir, jobs=2)
+    assert all(result[2] for result in results)
+
+
+def test_duplicate_outputs_fail_before_converting(tmp_path):
+    write_bmp(str(tmp_path / 'a' / 'icon.bmp'), 10)
+    write_bmp(str(tmp_path / 'b' / 'icon.bmp'), 200)
+    out_dir = str(tmp_path / 'out')
+
+    inputs = [str(tmp_path / 'a' / 'icon.bmp'), str(tmp_path / 'b' / 'icon.bmp')]
+    results = BMPConverter().convert_batch(inputs, out_dir, jobs=2)
+    assert [result[2] for result in results] == [False, False]
+    assert not os.path.exists(os.path.join(out_dir, 'icon_rgb565.h'))
+
+
+def test_atomic_output_uses_unique_temp_file(tmp_path):
+    output_file = str(tmp_path / 'image.h')
+    with atomic_output(output_file) as first, atomic_output(output_file) as second:
+        assert first.name != second.name
+        assert os.path.dirname(first.name) == str(tmp_path)
+        first.write("first")
+        second.write("second")
+    with open(output_file) as f:
+        assert f.read() == "first"
+    assert os.listdir(str(tmp_path)) == ['image.h']
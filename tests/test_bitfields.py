@@ -0,0 +1,146 @@
+"""BI_BITFIELDS（位域掩码）BMP的解码测试：各转换路径应与整幅数组输出一致"""
+
+import os
+import re
+import struct
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from bmp_benchmark import STARTUP_SCRIPT
+from bmp_to_rgb565_enhanced import BMPConverter, binary_output_path
+
+
+def make_bitfields_bmp(path, pixels, bpp, masks):
+    """写出自下而上存储的 BI_BITFIELDS BMP：40字节信息头后跟 R、G、B 三个掩码
+
+    pixels 为 H×W 的原始像素值（16位或32位）。
+    """
+    height, width = pixels.shape
+    row_size = ((width * bpp + 31) // 32) * 4
+    rows = np.zeros((height, row_size), dtype=np.uint8)
+    dtype = '<u2' if bpp == 16 else '<u4'
+    rows[:, :width * bpp // 8] = pixels.astype(dtype).view(np.uint8).reshape(height, -1)
+    data = rows[::-1].tobytes()
+    data_offset = 14 + 40 + 12
+    file_header = struct.pack('<2sIHHI', b'BM', data_offset + len(data), 0, 0, data_offset)
+    info_header = struct.pack('<IiiHHIIiiII', 40, width, height, 1, bpp, 3, len(data), 2835, 2835, 0, 0)
+    with open(path, 'wb') as f:
+        f.write(file_header + info_header + struct.pack('<III', *masks) + data)
+    return path
+
+
+@pytest.fixture
+def rgb565_bitfields_bmp(tmp_path):
+    """16位 R5G6B5 位域BMP，宽度为奇数以覆盖行填充"""
+    rng = np.random.default_rng(3)
+    pixels = rng.integers(0, 65536, size=(9, 13)).astype(np.uint16)
+    pixels[0, 0] = 0x58C1
+    path = make_bitfields_bmp(str(tmp_path / 'rgb565.bmp'), pixels, 16, (0xF800, 0x07E0, 0x001F))
+    return path, pixels
+
+
+@pytest.fixture
+def bgrx_bitfields_bmp(tmp_path):
+    """32位 X8R8G8B8 位域BMP"""
+    rng = np.random.default_rng(4)
+    pixels = rng.integers(0, 1 << 24, size=(5, 7)).astype(np.uint32)
+    path = make_bitfields_bmp(str(tmp_path / 'bgrx.bmp'), pixels, 32, (0xFF0000, 0x00FF00, 0x0000FF))
+    return path, pixels
+
+
+def read_text(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def test_rgb565_bitfields_values(rgb565_bitfields_bmp):
+    path, pixels = rgb565_bitfields_bmp
+    converter = BMPConverter()
+    image, error = converter.convert_image(path, 'RGB565')
+    assert error is None
+    # R5G6B5 扩展到8位再量化回RGB565是无损的
+    assert image.values.tolist() == pixels.tolist()
+
+    bmp_info, _ = converter.detect_bmp_format(path)
+    assert bmp_info['masks'] == (0xF800, 0x07E0, 0x001F)
+    manual, error = converter.read_bmp_manually(path, bmp_info)
+    assert error is None
+    assert converter.convert_pixels_vectorized(manual, 'RGB565').tolist() == pixels.tolist()
+
+
+@pytest.mark.parametrize('fixture_name', ['rgb565_bitfields_bmp', 'bgrx_bitfields_bmp'])
+@pytest.mark.parametrize('output_format', ['RGB565', 'RGB565_8BIT', 'GRAY8'])
+def test_streaming_matches_array(request, tmp_path, fixture_name, output_format):
+    path, _ = request.getfixturevalue(fixture_name)
+    converter = BMPConverter()
+    array_file = str(tmp_path / 'array.h')
+    stream_file = str(tmp_path / 'stream.h')
+    assert converter.convert_bmp_to_array(path, array_file, output_format)[0]
+    assert converter.convert_bmp_streaming(path, stream_file, output_format)[0]
+    assert read_text(stream_file) == read_text(array_file)
+
+
+def test_binary_streaming_matches_array(tmp_path, rgb565_bitfields_bmp):
+    path, pixels = rgb565_bitfields_bmp
+    converter = BMPConverter()
+    output_file = str(tmp_path / 'image.h')
+    assert converter.convert_bmp_to_binary(path, output_file, 'RGB565', streaming=True)[0]
+    with open(binary_output_path(output_file), 'rb') as f:
+        assert f.read() == pixels.astype('<u2').tobytes()
+
+
+def parse_arrays(text):
+    """从输出文本中取出各数组的数值: {数组名: [数值, ...]}"""
+    arrays = {}
+    for match in re.finditer(r"const \w+ (\w+)\[\d+\] = \{(.*?)\};", text, re.S):
+        arrays[match.group(1)] = [int(token, 16) for token in re.findall(r"0[xX][0-9A-Fa-f]+", match.group(2))]
+    return arrays
+
+
+@pytest.mark.parametrize('fixture_name', ['rgb565_bitfields_bmp', 'bgrx_bitfields_bmp'])
+def test_crop_matches_array(request, fixture_name):
+    path, _ = request.getfixturevalue(fixture_name)
+    converter = BMPConverter()
+    full, error = converter.convert_image(path, 'RGB565')
+    assert error is None
+    cropped, error = converter.convert_image(path, 'RGB565', crop=(2, 1, 5, 4))
+    assert error is None
+    assert cropped.values.tolist() == full.values[1:5, 2:7].tolist()
+
+
+def test_tiles_match_array(tmp_path, rgb565_bitfields_bmp):
+    path, pixels = rgb565_bitfields_bmp
+    output_file = str(tmp_path / 'tiles.h')
+    assert BMPConverter().convert_bmp_tiles(path, output_file, 4, 4)[0]
+    arrays = parse_arrays(read_text(output_file))
+    height, width = pixels.shape
+    for row in range(-(-height // 4)):
+        for col in range(-(-width // 4)):
+            tile = pixels[row * 4:row * 4 + 4, col * 4:col * 4 + 4]
+            assert arrays[f"image_{width}x{height}_tile_{row}_{col}"] == tile.ravel().tolist()
+
+
+@pytest.mark.parametrize('fixture_name', ['rgb565_bitfields_bmp', 'bgrx_bitfields_bmp'])
+def test_manual_decoder_matches_pillow(request, fixture_name):
+    path, _ = request.getfixturevalue(fixture_name)
+    converter = BMPConverter()
+    bmp_info, _ = converter.detect_bmp_format(path)
+    assert converter._prefers_manual_decoder(bmp_info)
+    manual, error = converter.read_bmp_manually(path, bmp_info)
+    assert error is None
+    pillow, error = converter.read_bmp_pixels(path, bmp_info)
+    assert error is None
+    assert np.array_equal(manual, pillow)
+
+
+def test_cli_does_not_load_pillow(tmp_path, rgb565_bitfields_bmp):
+    path, _ = rgb565_bitfields_bmp
+    script = STARTUP_SCRIPT.format(forbidden=['PIL'])
+    result = subprocess.run([sys.executable, '-c', script, path, str(tmp_path / 'rgb565.h')],
+                            capture_output=True, text=True, cwd=str(tmp_path.parent),
+                            env={**os.environ, 'PYTHONPATH': os.path.dirname(os.path.dirname(os.path.abspath(__file__)))})
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert 'loaded:\n' in result.stdout
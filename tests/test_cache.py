@@ -0,0 +1,123 @@
+"""转换缓存测试"""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from bmp_benchmark import encode_bmp
+from bmp_to_rgb565_enhanced import ConversionCache, cli_main
+
+
+def write_bmp(path, value):
+    rgb = np.full((4, 6, 3), value, dtype=np.uint8)
+    with open(path, 'wb') as f:
+        f.write(encode_bmp(rgb, 24))
+
+
+@pytest.fixture
+def bmp_file(tmp_path):
+    path = str(tmp_path / 'image.bmp')
+    write_bmp(path, 90)
+    return path
+
+
+def manifest_entries(cache_dir):
+    with open(os.path.join(cache_dir, ConversionCache.MANIFEST_NAME), encoding='utf-8') as f:
+        return json.load(f)['entries']
+
+
+def test_miss_then_hit(tmp_path, capsys, bmp_file):
+    cache_dir = str(tmp_path / 'cache')
+    output_file = str(tmp_path / 'image.h')
+    assert cli_main([bmp_file, output_file, '--cache', cache_dir]) == 0
+    assert "未命中 1 次" in capsys.readouterr().out
+    with open(output_file, 'rb') as f:
+        expected = f.read()
+
+    os.remove(output_file)
+    assert cli_main([bmp_file, output_file, '--cache', cache_dir]) == 0
+    assert "缓存命中" in capsys.readouterr().out
+    with open(output_file, 'rb') as f:
+        assert f.read() == expected
+
+
+def test_hit_keeps_output_mtime(tmp_path, bmp_file):
+    output_file = str(tmp_path / 'image.h')
+    with open(output_file, 'w') as f:
+        f.write("converted")
+    cache = ConversionCache(str(tmp_path / 'cache'))
+    key = cache.make_key(bmp_file, output_format='RGB565')
+    cache.store(key, output_file)
+    cache.save()
+
+    os.utime(output_file, ns=(1_000_000_000, 1_000_000_000))
+    cache = ConversionCache(str(tmp_path / 'cache'))
+    assert cache.fetch(key, output_file)
+    assert os.stat(output_file).st_mtime_ns == 1_000_000_000
+
+
+def test_key_depends_on_options_and_input(tmp_path, bmp_file):
+    cache = ConversionCache(str(tmp_path / 'cache'))
+    key = cache.make_key(bmp_file, output_format='RGB565', byte_order='little')
+    assert key == cache.make_key(bmp_file, output_format='RGB565', byte_order='little')
+    assert key != cache.make_key(bmp_file, output_format='RGB565', byte_order='big')
+    assert key != cache.make_key(bmp_file, output_format='GRAY8', byte_order='little')
+
+    write_bmp(bmp_file, 91)
+    assert key != cache.make_key(bmp_file, output_format='RGB565', byte_order='little')
+
+
+def test_lru_eviction_respects_size_limit(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    cache = ConversionCache(cache_dir, max_bytes=250)
+    output_file = str(tmp_path / 'out.h')
+    for name in ('a', 'b', 'c'):
+        with open(output_file, 'w') as f:
+            f.write(name * 100)
+        cache.store(name * 64, output_file)
+    # 最早存入的 a 最久未使用，命中 b 后淘汰顺序为 a、c
+    assert cache.fetch('b' * 64, output_file)
+    cache.save()
+
+    entries = manifest_entries(cache_dir)
+    assert sorted(entries) == ['b' * 64, 'c' * 64]
+    assert sum(entry['size'] for entry in entries.values()) <= 250
+    assert not os.path.exists(cache._object_path('a' * 64))
+
+
+def store_in_process(cache_dir, name):
+    """在独立进程中存入一个条目（模拟多个命令行同时使用 --cache）"""
+    output_file = os.path.join(os.path.dirname(cache_dir), f"{name}.{os.getpid()}.h")
+    with open(output_file, 'w') as f:
+        f.write(name * 50)
+    cache = ConversionCache(cache_dir)
+    cache.store(f"{name:0>64}", output_file)
+    cache.save()
+    return True
+
+
+def test_concurrent_stores_keep_all_entries(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    names = [f"{i:x}" for i in range(16)]
+    # 同一个键由多个进程同时写入
+    names += names[:4]
+    with ProcessPoolExecutor(max_workers=8) as executor:
+        assert all(executor.map(store_in_process, [cache_dir] * len(names), names))
+
+    entries = manifest_entries(cache_dir)
+    assert sorted(entries) == sorted({f"{name:0>64}" for name in names})
+    leftovers = [name for _, _, files in os.walk(cache_dir) for name in files
+                 if name.endswith(('.part', '.lock'))]
+    assert leftovers == []
+
+
+def test_unwritable_cache_does_not_fail_conversion(tmp_path, bmp_file):
+    cache_dir = str(tmp_path / 'cache')
+    # 缓存目录位置被普通文件占用，所有缓存写入都会失败
+    with open(cache_dir, 'w'):
+        pass
+    assert cli_main([bmp_file, str(tmp_path / 'image.h'), '--cache', cache_dir]) == 0
+    assert os.path.isfile(str(tmp_path / 'image.h'))
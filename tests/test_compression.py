@@ -0,0 +1,98 @@
+"""像素数据压缩（RLE / DEFLATE）的往返测试"""
+
+import re
+
+import numpy as np
+import pytest
+
+from bmp_benchmark import encode_bmp
+from bmp_to_rgb565_enhanced import (BMPConverter, compress_pixel_bytes, decompress_pixel_bytes, rle_decode,
+                                    rle_encode)
+
+
+def units_to_bytes(units, unit_size):
+    return np.asarray(units, dtype=np.uint8 if unit_size == 1 else '<u2').tobytes()
+
+
+def edge_cases(unit_size):
+    """边界数据：空输入、超过128的游程、交替的原样像素、恰好在128处结束的原样段"""
+    alternating = [1, 2] * 150
+    return {
+        'empty': [],
+        'single': [7],
+        'long_run': [5] * 300,
+        'run_of_128': [5] * 128,
+        'run_of_129': [5] * 129,
+        'alternating': alternating,
+        'literal_128_then_run': list(range(1, 129)) + [9] * 4,
+        'literal_256': [i % 251 for i in range(256)],
+        'run_literal_run': [3] * 130 + [1, 2, 1, 2] + [4] * 2,
+        'random': np.random.default_rng(unit_size).integers(0, 4, 5000).tolist(),
+    }
+
+
+@pytest.mark.parametrize('unit_size', [1, 2])
+def test_rle_round_trip(unit_size):
+    for name, units in edge_cases(unit_size).items():
+        data = units_to_bytes(units, unit_size)
+        encoded = rle_encode(data, unit_size)
+        assert rle_decode(encoded, unit_size) == data, name
+
+
+@pytest.mark.parametrize('unit_size', [1, 2])
+def test_rle_packets_hold_at_most_128_units(unit_size):
+    data = units_to_bytes([5] * 300 + list(range(1, 201)), unit_size)
+    encoded = rle_encode(data, unit_size)
+    pos = 0
+    packets = []
+    while pos < len(encoded):
+        header = encoded[pos]
+        count = (header & 0x7F) + 1
+        packets.append((bool(header & 0x80), count))
+        pos += 1 + (unit_size if header & 0x80 else count * unit_size)
+    assert packets == [(True, 128), (True, 128), (True, 44), (False, 128), (False, 72)]
+
+
+def test_rle_rejects_partial_units():
+    with pytest.raises(ValueError):
+        rle_encode(b'\x01\x02\x03', 2)
+
+
+@pytest.mark.parametrize('unit_size', [1, 2])
+def test_deflate_round_trip(unit_size):
+    for name, units in edge_cases(unit_size).items():
+        data = units_to_bytes(units, unit_size)
+        encoded = compress_pixel_bytes(data, 'deflate', unit_size)
+        assert decompress_pixel_bytes(encoded, 'deflate', unit_size) == data, name
+
+
+def emitted_bytes(path):
+    """取出头文件中最后一个 uint8_t 数组（压缩数据）的内容"""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    match = list(re.finditer(r"const uint8_t \w+\[(\d+)\] = \{(.*?)\};", text, re.S))[-1]
+    data = bytes(int(token, 16) for token in re.findall(r"0x[0-9A-Fa-f]+", match.group(2)))
+    assert len(data) == int(match.group(1))
+    return data
+
+
+@pytest.mark.parametrize('compression', ['rle', 'deflate'])
+@pytest.mark.parametrize('output_format', ['RGB565', 'GRAY8'])
+def test_compressed_array_decodes_to_pixels(tmp_path, compression, output_format):
+    rgb = np.zeros((20, 150, 3), dtype=np.uint8)
+    rgb[:, :70] = (200, 40, 10)
+    rgb[5:9] = np.random.default_rng(9).integers(0, 256, size=(4, 150, 3), dtype=np.uint8)
+    bmp_file = str(tmp_path / 'image.bmp')
+    with open(bmp_file, 'wb') as f:
+        f.write(encode_bmp(rgb, 24))
+
+    converter = BMPConverter()
+    output_file = str(tmp_path / 'image.h')
+    success, message = converter.convert_bmp_compressed(bmp_file, output_file, output_format, 'big', compression)
+    assert success, message
+
+    image, error = converter.convert_image(bmp_file, output_format, 'big')
+    assert error is None
+    expected = converter.pixel_values_to_bytes(image.values, output_format)
+    unit_size = 1 if output_format == 'GRAY8' else 2
+    assert decompress_pixel_bytes(emitted_bytes(output_file), compression, unit_size) == expected
@@ -0,0 +1,81 @@
+"""转换守护进程的请求处理测试"""
+
+import asyncio
+import json
+import os
+
+import pytest
+
+from bmp_to_rgb565_daemon import ConversionServer, load_or_create_token, read_token
+
+
+class FakeWriter:
+    """收集响应的写端"""
+
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+
+def handle(server, request):
+    writer = FakeWriter()
+
+    async def run():
+        await server.handle_request(json.dumps(request).encode('utf-8'), writer, asyncio.Lock())
+
+    asyncio.run(run())
+    return json.loads(writer.data)
+
+
+def test_tcp_requests_require_token():
+    server = ConversionServer(jobs=1, token='secret')
+    assert not handle(server, {'op': 'ping'})['success']
+    assert not handle(server, {'op': 'ping', 'token': 'wrong'})['success']
+    assert handle(server, {'op': 'ping', 'token': 'secret'})['message'] == "pong"
+
+
+def test_unix_socket_requests_need_no_token():
+    server = ConversionServer(jobs=1)
+    assert handle(server, {'op': 'ping'})['message'] == "pong"
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason="需要POSIX文件权限")
+def test_token_file_is_private(tmp_path):
+    token_file = str(tmp_path / 'token')
+    token = load_or_create_token(token_file)
+    assert os.stat(token_file).st_mode & 0o777 == 0o600
+    assert read_token(token_file) == token == load_or_create_token(token_file)
+
+    os.chmod(token_file, 0o644)
+    with pytest.raises(ValueError):
+        read_token(token_file)
+
+
+def test_stale_socket_that_cannot_be_removed(tmp_path, monkeypatch, capsys):
+    import bmp_to_rgb565_daemon
+
+    socket_path = str(tmp_path / 'daemon.sock')
+    with open(socket_path, 'w'):
+        pass
+
+    def deny(path):
+        raise PermissionError(1, "Operation not permitted", path)
+
+    monkeypatch.setattr(bmp_to_rgb565_daemon.os, 'remove', deny)
+    assert bmp_to_rgb565_daemon.serve_main(['--socket', socket_path]) == 1
+    assert "无法删除残留的套接字文件" in capsys.readouterr().out
+
+
+def test_option_values_match_main_module():
+    import bmp_to_rgb565_daemon
+    import bmp_to_rgb565_enhanced
+
+    assert bmp_to_rgb565_daemon.OUTPUT_FORMATS == list(bmp_to_rgb565_enhanced.OUTPUT_FORMATS)
+    assert bmp_to_rgb565_daemon.COMPRESSION_METHODS == list(bmp_to_rgb565_enhanced.COMPRESSION_METHODS)
+    # 主模块的 --byte-order 选项直接写在参数定义里
+    assert bmp_to_rgb565_daemon.BYTE_ORDERS == ['little', 'big']
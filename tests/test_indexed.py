@@ -0,0 +1,53 @@
+"""INDEXED 输出格式在各转换方式上的处理测试"""
+
+import os
+
+import numpy as np
+import pytest
+
+from bmp_benchmark import encode_bmp
+from bmp_to_rgb565_enhanced import BMPConverter
+
+
+@pytest.fixture
+def bmp_file(tmp_path):
+    rng = np.random.default_rng(20)
+    rgb = rng.integers(0, 256, size=(8, 10, 3), dtype=np.uint8)
+    path = str(tmp_path / 'image.bmp')
+    with open(path, 'wb') as f:
+        f.write(encode_bmp(rgb, 24))
+    return path
+
+
+CONVERSIONS = {
+    'binary': lambda converter, bmp_file, output_file, output_format:
+        converter.convert_bmp_to_binary(bmp_file, output_file, output_format),
+    'compressed': lambda converter, bmp_file, output_file, output_format:
+        converter.convert_bmp_compressed(bmp_file, output_file, output_format, compression='rle'),
+    'tiles': lambda converter, bmp_file, output_file, output_format:
+        converter.convert_bmp_tiles(bmp_file, output_file, 4, 4, output_format),
+    'atlas': lambda converter, bmp_file, output_file, output_format:
+        converter.convert_atlas([bmp_file], output_file, output_format),
+    'animation': lambda converter, bmp_file, output_file, output_format:
+        converter.convert_animation([bmp_file, bmp_file], output_file, output_format),
+}
+
+
+@pytest.mark.parametrize('output_format', ['INDEXED8', 'INDEXED4'])
+@pytest.mark.parametrize('path', sorted(CONVERSIONS))
+def test_array_only_paths_reject_indexed(tmp_path, bmp_file, path, output_format):
+    output_file = str(tmp_path / 'image.h')
+    success, message = CONVERSIONS[path](BMPConverter(), bmp_file, output_file, output_format)
+    assert not success
+    assert output_format in message
+    assert not os.path.exists(output_file)
+
+
+def test_streaming_indexed_falls_back_to_whole_image(tmp_path, bmp_file):
+    converter = BMPConverter()
+    streamed = str(tmp_path / 'streamed.h')
+    whole = str(tmp_path / 'whole.h')
+    assert converter.convert_bmp_streaming(bmp_file, streamed, 'INDEXED8', array_name='image')[0]
+    assert converter.convert_bmp_to_array(bmp_file, whole, 'INDEXED8', array_name='image')[0]
+    with open(streamed) as a, open(whole) as b:
+        assert a.read() == b.read()
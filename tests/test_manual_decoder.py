@@ -0,0 +1,118 @@
+"""NumPy手动解码器（索引色和RLE8/RLE4）与Pillow的对比测试"""
+
+import struct
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from bmp_benchmark import encode_bmp
+from bmp_to_rgb565_enhanced import BMPConverter
+
+
+def pillow_rgb(path):
+    with Image.open(path) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def manual_rgb(path):
+    converter = BMPConverter()
+    bmp_info, error = converter.detect_bmp_format(path)
+    assert error is None
+    pixels, error = converter.read_bmp_manually(path, bmp_info)
+    assert error is None, error
+    return pixels
+
+
+@pytest.mark.parametrize('top_down', [False, True])
+@pytest.mark.parametrize('bpp', [1, 4, 8])
+def test_palette_images_match_pillow(tmp_path, bpp, top_down):
+    # 奇数宽度覆盖行末的填充字节和不满一字节的像素
+    rgb = np.random.default_rng(bpp).integers(0, 256, size=(7, 13, 3), dtype=np.uint8)
+    path = str(tmp_path / 'image.bmp')
+    with open(path, 'wb') as f:
+        f.write(encode_bmp(rgb, bpp, top_down))
+
+    expected = pillow_rgb(path)
+    assert np.array_equal(manual_rgb(path), expected)
+    image, error = BMPConverter().convert_image(path, 'RGB565')
+    assert error is None
+    assert np.array_equal(image.values, BMPConverter().convert_pixels_vectorized(expected, 'RGB565'))
+
+
+def write_rle_bmp(path, width, height, data, bpp=8):
+    """写出RLE8（bpp=8）或RLE4（bpp=4）BMP，调色板各项颜色互不相同"""
+    colors = 1 << bpp
+    palette = bytes(value for i in range(colors) for value in ((i * 37) & 0xFF, 255 - i, (i * 11) & 0xFF, 0))
+    data_offset = 14 + 40 + len(palette)
+    file_header = struct.pack('<2sIHHI', b'BM', data_offset + len(data), 0, 0, data_offset)
+    info_header = struct.pack('<IiiHHIIiiII', 40, width, height, 1, bpp, 1 if bpp == 8 else 2, len(data),
+                              2835, 2835, colors, 0)
+    with open(path, 'wb') as f:
+        f.write(file_header + info_header + palette + bytes(data))
+    return path
+
+
+# 文件中的行自下而上：编码包、奇数长度的绝对模式（带填充字节）、行结束、位移和位图结束
+RLE8_STREAM = [
+    3, 7, 0, 3, 1, 2, 3, 0, 0, 0,
+    2, 9, 0, 2, 2, 1,
+    2, 5, 0, 0,
+    0, 6, 1, 2, 3, 4, 5, 6, 0, 1,
+]
+
+RLE4_STREAM = [
+    2, 0x12, 0, 4, 0x34, 0x56, 0, 0,
+    0, 4, 0x67, 0x89, 0, 2, 1, 1,
+    1, 0xA0, 0, 0, 0, 1,
+]
+
+
+@pytest.mark.parametrize('bpp, width, height, stream', [(8, 6, 4, RLE8_STREAM), (4, 6, 3, RLE4_STREAM)])
+def test_rle_matches_pillow(tmp_path, bpp, width, height, stream):
+    path = write_rle_bmp(str(tmp_path / 'rle.bmp'), width, height, stream, bpp)
+    assert np.array_equal(manual_rgb(path), pillow_rgb(path))
+
+
+def read_indices(path):
+    converter = BMPConverter()
+    bmp_info, _ = converter.detect_bmp_format(path)
+    return converter.read_bmp_indexed(path, bmp_info)
+
+
+def test_rle4_odd_absolute_run(tmp_path):
+    # 3个像素占2字节，已按字对齐，不再跟填充字节
+    path = write_rle_bmp(str(tmp_path / 'rle.bmp'), 3, 1, [0, 3, 0x12, 0x30, 0, 1], 4)
+    (indices, _), error = read_indices(path)
+    assert error is None
+    assert indices.tolist() == [[1, 2, 3]]
+
+
+def test_rle_end_of_bitmap_leaves_zero_indices(tmp_path):
+    path = write_rle_bmp(str(tmp_path / 'rle.bmp'), 4, 2, [4, 1, 0, 0, 0, 1])
+    (indices, _), error = read_indices(path)
+    assert error is None
+    assert indices.tolist() == [[0, 0, 0, 0], [1, 1, 1, 1]]
+
+
+def test_rle_last_row_without_end_marker(tmp_path):
+    path = write_rle_bmp(str(tmp_path / 'rle.bmp'), 4, 2, [4, 1, 0, 0, 4, 2])
+    (indices, _), error = read_indices(path)
+    assert error is None
+    assert indices.tolist() == [[2, 2, 2, 2], [1, 1, 1, 1]]
+    assert np.array_equal(manual_rgb(path), pillow_rgb(path))
+
+
+@pytest.mark.parametrize('stream', [
+    [4, 1, 0, 0],           # 第二行之前数据结束
+    [0, 4, 1, 2],           # 绝对模式的像素不完整
+    [0, 2, 1],              # 位移参数不完整
+    [4, 1, 0],              # 包头不完整
+])
+def test_truncated_rle_is_reported(tmp_path, stream):
+    path = write_rle_bmp(str(tmp_path / 'rle.bmp'), 4, 2, stream)
+    result, error = read_indices(path)
+    assert result is None
+    assert "RLE数据不完整" in error
+    image, error = BMPConverter().convert_image(path)
+    assert image is None and error
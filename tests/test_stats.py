@@ -0,0 +1,83 @@
+"""分阶段统计测试"""
+
+import numpy as np
+import pytest
+
+from bmp_benchmark import encode_bmp
+from bmp_to_rgb565_enhanced import BMPConverter, CArrayEmitter, ConversionStats, _StageTimer
+
+
+@pytest.fixture
+def bmp_file(tmp_path):
+    rng = np.random.default_rng(14)
+    rgb = rng.integers(0, 256, size=(24, 40, 3), dtype=np.uint8)
+    path = str(tmp_path / 'image.bmp')
+    with open(path, 'wb') as f:
+        f.write(encode_bmp(rgb, 24))
+    return path
+
+
+@pytest.mark.parametrize('options, expected_stages', [
+    ({'compression': 'rle'}, ['detect', 'decode', 'quantize', 'compress', 'emit']),
+    ({'binary': True}, ['detect', 'decode', 'quantize', 'emit']),
+    ({'tiles': (16, 16)}, ['detect', 'decode', 'quantize', 'emit']),
+    ({'streaming': True}, ['detect', 'stream']),
+    ({}, ['detect', 'decode', 'quantize', 'emit']),
+])
+def test_stage_records(tmp_path, bmp_file, options, expected_stages):
+    stats = ConversionStats(track_memory=True)
+    success, message = BMPConverter().convert_file(bmp_file, str(tmp_path / 'image.h'), stats=stats, **options)
+    assert success, message
+    report = stats.to_dict()
+    assert [record['name'] for record in report['stages']] == expected_stages
+    for record in report['stages']:
+        assert record['calls'] >= 1
+        assert record['seconds'] >= 0
+        assert record['pixels'] >= 0
+        assert record['bytes'] >= 0
+        assert record['peak_bytes'] >= 0
+    # 写出阶段记录了输出的字节数
+    assert report['stages'][-1]['bytes'] > 0
+    assert report['output_bytes'] > 0
+    assert report['peak_bytes'] > 0
+
+
+@pytest.mark.parametrize('options', [{'compression': 'rle'}, {'binary': True}, {'tiles': (16, 16)}, {}])
+def test_emitter_setup_is_inside_stages(tmp_path, monkeypatch, bmp_file, options):
+    # 构造输出器时会生成字符串查找表，这部分开销应计入某个阶段
+    open_stages = []
+    setup_depths = []
+    enter, exit_ = _StageTimer.__enter__, _StageTimer.__exit__
+
+    def tracked_enter(self):
+        open_stages.append(self)
+        return enter(self)
+
+    def tracked_exit(self, *exc_info):
+        open_stages.remove(self)
+        return exit_(self, *exc_info)
+
+    emitter_init = CArrayEmitter.__init__
+
+    def tracked_init(self, *args, **kwargs):
+        setup_depths.append(len(open_stages))
+        emitter_init(self, *args, **kwargs)
+
+    monkeypatch.setattr(_StageTimer, '__enter__', tracked_enter)
+    monkeypatch.setattr(_StageTimer, '__exit__', tracked_exit)
+    monkeypatch.setattr(CArrayEmitter, '__init__', tracked_init)
+    success, message = BMPConverter().convert_file(bmp_file, str(tmp_path / 'image.h'), stats=ConversionStats(),
+                                                   **options)
+    assert success, message
+    assert setup_depths
+    assert all(depth > 0 for depth in setup_depths)
+
+
+def test_indexed_palette_has_own_stage(tmp_path, bmp_file):
+    stats = ConversionStats()
+    success, message = BMPConverter().convert_file(bmp_file, str(tmp_path / 'image.h'), 'INDEXED8', stats=stats)
+    assert success, message
+    stages = {record['name']: record for record in stats.to_dict()['stages']}
+    assert stages['quantize']['calls'] == 1
+    assert stages['quantize']['pixels'] == 24 * 40
+    assert stages['palette']['pixels'] == 24 * 40
@@ -0,0 +1,55 @@
+"""整幅向量化转换与逐像素参考函数的一致性测试"""
+
+import numpy as np
+import pytest
+
+from bmp_to_rgb565_enhanced import BMPConverter
+
+DIRECT_FORMATS = ['RGB565', 'RGB565_8BIT', 'RGB332', 'GRAY8']
+
+
+def reference_value(converter, output_format, r, g, b, byte_order):
+    """逐像素参考实现（RGB565_8BIT 的像素值与 RGB565 相同，只是输出时拆成两个字节）"""
+    if output_format in ('RGB565', 'RGB565_8BIT'):
+        return converter.convert_pixel_to_rgb565(r, g, b, byte_order)
+    if output_format == 'RGB332':
+        return converter.convert_pixel_to_rgb332(r, g, b, byte_order)
+    return converter.convert_pixel_to_grayscale8(r, g, b, byte_order)
+
+
+def channel_sweep_image():
+    """每个通道都遍历 0..255 全部取值的测试图像：三行分别扫描 R、G、B，其余通道取随机值，再附加随机像素"""
+    rng = np.random.default_rng(565)
+    levels = np.arange(256, dtype=np.uint8)
+    rows = []
+    for channel in range(3):
+        row = rng.integers(0, 256, size=(256, 3), dtype=np.uint8)
+        row[:, channel] = levels
+        rows.append(row)
+    rows.append(rng.integers(0, 256, size=(256, 3), dtype=np.uint8))
+    return np.stack(rows)
+
+
+@pytest.mark.parametrize('byte_order', ['little', 'big'])
+@pytest.mark.parametrize('output_format', DIRECT_FORMATS)
+def test_vectorized_matches_per_pixel(output_format, byte_order):
+    converter = BMPConverter()
+    rgb = channel_sweep_image()
+    values = converter.convert_pixels_vectorized(rgb, output_format, byte_order)
+
+    expected = [[reference_value(converter, output_format, int(r), int(g), int(b), byte_order)
+                 for r, g, b in row] for row in rgb]
+    assert values.shape == rgb.shape[:2]
+    assert values.tolist() == expected
+
+
+@pytest.mark.parametrize('block_pixels', [1, 768, 1 << 20])
+def test_gray8_blocks_match_per_pixel(block_pixels):
+    # 图像为 4×256：块小于一行（按一行计）、每块3行且最后一块不满、整幅一块
+    converter = BMPConverter()
+    converter.gray_block_pixels = block_pixels
+    rgb = channel_sweep_image()
+    values = converter.convert_pixels_vectorized(rgb, 'GRAY8')
+    expected = [[converter.convert_pixel_to_grayscale8(int(r), int(g), int(b)) for r, g, b in row] for row in rgb]
+    assert values.dtype == np.uint8
+    assert values.tolist() == expected
@@ -0,0 +1,101 @@
+"""监视模式测试：用线程池代替工作进程，逐次轮询检查触发的转换"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from bmp_benchmark import encode_bmp
+from bmp_to_rgb565_enhanced import BMPConverter
+from bmp_to_rgb565_watch import CONFIG_FILE_NAME, BMPWatcher
+
+
+def bmp_bytes(value):
+    rgb = np.full((4, 5, 3), value, dtype=np.uint8)
+    return encode_bmp(rgb, 24)
+
+
+def write_bmp(path, value, mtime=None):
+    with open(path, 'wb') as f:
+        f.write(bmp_bytes(value))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        yield executor
+
+
+def poll(watcher, executor):
+    """轮询一次并等待本次提交的转换完成，返回新完成的转换次数"""
+    before = watcher.completed + watcher.failed
+    watcher.submit_ready(executor)
+    for future in list(watcher.in_flight):
+        future.result()
+        watcher.report(future)
+    return watcher.completed + watcher.failed - before
+
+
+def test_new_and_modified_files_convert_once(tmp_path, executor):
+    log = []
+    watcher = BMPWatcher([str(tmp_path)], debounce=0, log=log.append)
+    assert poll(watcher, executor) == 0
+
+    input_file = str(tmp_path / 'icon.bmp')
+    write_bmp(input_file, 10, time.time() - 10)
+    assert poll(watcher, executor) == 1
+    assert poll(watcher, executor) == 0
+    output_file = str(tmp_path / 'icon_rgb565.h')
+    assert os.path.isfile(output_file)
+
+    write_bmp(input_file, 200, time.time() - 5)
+    assert poll(watcher, executor) == 1
+    assert poll(watcher, executor) == 0
+    assert watcher.failed == 0
+    assert sum("[成功]" in line for line in log) == 2
+
+
+def test_half_written_file_waits_for_debounce(tmp_path, executor):
+    watcher = BMPWatcher([str(tmp_path)], debounce=0.5, log=lambda message: None)
+    input_file = str(tmp_path / 'icon.bmp')
+    data = bmp_bytes(90)
+    with open(input_file, 'wb') as f:
+        f.write(data[:len(data) // 2])
+    assert poll(watcher, executor) == 0
+
+    with open(input_file, 'ab') as f:
+        f.write(data[len(data) // 2:])
+    assert poll(watcher, executor) == 0
+
+    time.sleep(0.55)
+    assert poll(watcher, executor) == 1
+    assert watcher.failed == 0
+    # 转换的是写完后的完整文件
+    expected_file = str(tmp_path / 'expected.h')
+    assert BMPConverter().convert_bmp_to_array(input_file, expected_file)[0]
+    with open(str(tmp_path / 'icon_rgb565.h'), encoding='utf-8') as f, open(expected_file, encoding='utf-8') as g:
+        assert f.read() == g.read()
+
+
+def test_directory_config_overrides_format(tmp_path, executor):
+    configured = tmp_path / 'configured'
+    default = tmp_path / 'default'
+    configured.mkdir()
+    default.mkdir()
+    with open(str(configured / CONFIG_FILE_NAME), 'w', encoding='utf-8') as f:
+        json.dump({'output_format': 'GRAY8', 'output_dir': 'generated'}, f)
+    write_bmp(str(configured / 'icon.bmp'), 50, time.time() - 10)
+    write_bmp(str(default / 'icon.bmp'), 50, time.time() - 10)
+
+    watcher = BMPWatcher([str(configured), str(default)], debounce=0, log=lambda message: None)
+    assert poll(watcher, executor) == 2
+    with open(str(configured / 'generated' / 'icon_gray8.h'), encoding='utf-8') as f:
+        assert "uint8_t" in f.read()
+    with open(str(default / 'icon_rgb565.h'), encoding='utf-8') as f:
+        assert "uint16_t" in f.read()
+    assert not os.path.exists(str(configured / 'icon_rgb565.h'))